@@ -0,0 +1,425 @@
+"""
+Offline bulk ingestion of an S3 bucket on a pool of worker processes.
+
+The key space is split into shards, either one per prefix or by hash range
+under a single prefix. Each shard runs through
+`DocumentProcessor.process_documents` in worker processes, which have their own
+embedding service, vector store and document tracker. Hash ranges share one
+listing of the prefix, made by the parent process, which hands their keys to
+the workers in batches. Finished shards are
+recorded in a checkpoint file, so an interrupted backfill resumes where it
+left off:
+
+    python -m app.bulk_ingest --prefix docs/ --workers 8 --shards 64
+    python -m app.bulk_ingest --prefixes docs/a/ docs/b/ docs/c/ --workers 3
+
+Documents are marked processed only after their vectors are written. A shard
+that was cut short, or in which some documents failed to download, split,
+embed or write, is not recorded as finished: it is run again on resume and
+skips the documents it already finished.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.config import settings
+from app.utils.logger import logger
+
+_STAT_NAMES = ("queued", "processed", "skipped", "failed", "chunks", "reused", "deduplicated")
+
+# Listing entries handed to a worker at a time, and the fields they keep
+_BATCH_OBJECTS = 1000
+_LISTING_FIELDS = ("Key", "ETag", "Size", "LastModified")
+
+# Provider budgets that the worker processes split between them
+_RATE_LIMIT_SETTINGS = (
+    "OPENAI_REQUESTS_PER_MINUTE",
+    "OPENAI_TOKENS_PER_MINUTE",
+    "HUGGINGFACE_REQUESTS_PER_MINUTE",
+    "HUGGINGFACE_TOKENS_PER_MINUTE",
+    "OLLAMA_REQUESTS_PER_MINUTE",
+    "OLLAMA_TOKENS_PER_MINUTE",
+)
+
+# Per worker process, set by _init_worker
+_processor = None
+_cancel_event = None
+
+
+def hash_shard(key: str, count: int) -> int:
+    """The hash range, out of `count`, that a key belongs to."""
+    return zlib.crc32(key.encode("utf-8")) * count >> 32
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    keys = parser.add_mutually_exclusive_group()
+    keys.add_argument("--prefix", default="", help="Split the keys under this prefix by hash range")
+    keys.add_argument("--prefixes", nargs="+", help="Use each of these prefixes as one shard")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--shards", type=int, help="Hash ranges under --prefix, defaults to 4 per worker")
+    parser.add_argument(
+        "--checkpoint", default=".data/bulk_ingest_checkpoint.json",
+        help="File recording finished shards; an existing one is resumed",
+    )
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.prefixes and args.shards:
+        parser.error("--shards only applies to --prefix")
+    args.shards = args.shards or args.workers * 4
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    if settings.VECTOR_BACKEND == "local" and args.workers > 1:
+        parser.error("the local vector backend lives in one process, use --workers 1")
+    return args
+
+
+def plan_shards(prefix: str, prefixes: Optional[List[str]], shards: int) -> List[dict]:
+    """
+    Split the key space into shards.
+
+    Args:
+        prefix (str): Prefix whose keys are split by hash range.
+        prefixes (Optional[List[str]]): One shard per prefix instead, listed by
+            the worker that runs it. Only these prefixes are listed.
+        shards (int): Number of hash ranges under `prefix`.
+
+    Returns:
+        List[dict]: The "name", "prefix", and hash range "index" and "count" of
+            each shard. Prefix shards have no hash range.
+    """
+    if prefixes:
+        return [
+            {"name": prefix, "prefix": prefix, "index": None, "count": None}
+            for prefix in dict.fromkeys(prefixes)
+        ]
+    return [
+        {"name": f"{prefix}#{index}/{shards}", "prefix": prefix, "index": index, "count": shards}
+        for index in range(shards)
+    ]
+
+
+def load_checkpoint(path: str, shards: List[dict]) -> dict:
+    """
+    Load the checkpoint of this shard plan, or start a new one if the file does not exist.
+
+    Raises:
+        ValueError: If the checkpoint was written for a different shard plan.
+    """
+    names = [shard["name"] for shard in shards]
+    if not os.path.exists(path):
+        return {"shards": names, "completed": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("shards") != names:
+        raise ValueError(
+            f"Checkpoint {path} was written for a different key split. Pass the "
+            "original arguments to resume it, or a new --checkpoint path."
+        )
+    return checkpoint
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Replace the file in one step so a crash never leaves a partial checkpoint
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(temporary, path)
+
+
+def record_shard(checkpoint: dict, name: str, result: dict) -> bool:
+    """
+    Record a shard as finished in the checkpoint, unless it was cancelled or some
+    of its documents failed.
+
+    Args:
+        checkpoint (dict): The checkpoint, updated in place.
+        name (str): The shard name.
+        result (dict): The "stats", "seconds" and "cancelled" flag of its run.
+
+    Returns:
+        bool: Whether the shard was recorded as finished.
+    """
+    if result["cancelled"] or result["stats"].get("failed", 0):
+        return False
+    checkpoint["completed"][name] = {**result["stats"], "seconds": round(result["seconds"], 3)}
+    return True
+
+
+def shard_batches(
+    shards: List[dict], batch_size: int = _BATCH_OBJECTS
+) -> Iterator[Tuple[dict, Optional[List[dict]], bool]]:
+    """
+    Split the work of the given shards into items for the worker processes.
+
+    Prefix shards are one item each, without objects: the worker lists its
+    prefix. Hash-range shards share one listing of their prefix, made here, and
+    get its entries in batches of up to `batch_size`. The last batch of each
+    hash-range shard, possibly empty, follows once the listing is done.
+
+    Args:
+        shards (List[dict]): The shards to run, as planned by `plan_shards`.
+        batch_size (int): Listing entries per item.
+
+    Yields:
+        Tuple[dict, Optional[List[dict]], bool]: The shard, the listing entries to
+            process (None to list the shard's prefix), and whether this is the
+            shard's last item.
+    """
+    hashed = {shard["index"]: shard for shard in shards if shard["count"]}
+    for shard in shards:
+        if not shard["count"]:
+            yield shard, None, True
+    if not hashed:
+        return
+
+    from app.services.document_fetcher import list_objects
+
+    first = next(iter(hashed.values()))
+    batches: Dict[int, List[dict]] = {index: [] for index in hashed}
+    for page in list_objects(first["prefix"]):
+        for obj in page:
+            index = hash_shard(obj["Key"], first["count"])
+            # Keys of shards finished by an earlier run are not handed out
+            if index not in batches:
+                continue
+            batches[index].append({name: obj[name] for name in _LISTING_FIELDS if name in obj})
+            if len(batches[index]) >= batch_size:
+                yield hashed[index], batches[index], False
+                batches[index] = []
+    for index, objects in batches.items():
+        yield hashed[index], objects, True
+
+
+class _ShardRun:
+    """Progress of a shard whose batches are spread over the worker processes."""
+
+    def __init__(self):
+        self.stats = {name: 0 for name in _STAT_NAMES}
+        self.seconds = 0.0
+        self.batches = 0  # Submitted and not done yet
+        self.listed = False  # All of its batches were submitted
+        self.cancelled = False
+        self.error = False
+
+    @property
+    def done(self) -> bool:
+        return self.listed and self.batches == 0
+
+
+def run(args: argparse.Namespace) -> dict:
+    """
+    Process every shard that the checkpoint does not list as finished.
+
+    Hash-range shards under one prefix share a single listing made in this
+    process, which hands their keys to the workers in batches. At most two
+    batches per worker are queued, so the listing never runs far ahead.
+
+    Returns:
+        dict: Totals of this run, the elapsed seconds, the shards that finished,
+            the shards that raised ("failed_shards") and the shards left
+            unfinished because some of their documents failed ("incomplete").
+    """
+    shards = plan_shards(args.prefix, args.prefixes, args.shards)
+    checkpoint = load_checkpoint(args.checkpoint, shards)
+    pending = [shard for shard in shards if shard["name"] not in checkpoint["completed"]]
+    if len(pending) < len(shards):
+        logger.info(
+            f"Resuming from {args.checkpoint}: {len(shards) - len(pending)} of "
+            f"{len(shards)} shards already finished"
+        )
+
+    totals = {name: 0 for name in _STAT_NAMES}
+    finished, failed_shards, incomplete = [], [], []
+    runs = {shard["name"]: _ShardRun() for shard in pending}
+
+    def finish(name: str):
+        shard_run = runs[name]
+        if shard_run.error:
+            failed_shards.append(name)
+            return
+        result = {
+            "stats": shard_run.stats,
+            "seconds": shard_run.seconds,
+            "cancelled": shard_run.cancelled,
+        }
+        if not record_shard(checkpoint, name, result):
+            if not shard_run.cancelled:
+                logger.error(
+                    f"Shard {name} left unfinished: {shard_run.stats['failed']} documents failed"
+                )
+                incomplete.append(name)
+            return
+        finished.append(name)
+        save_checkpoint(args.checkpoint, checkpoint)
+        logger.info(
+            f"Shard {name} finished ({len(checkpoint['completed'])}/{len(shards)}): "
+            f"{shard_run.stats['processed']} documents in {shard_run.seconds:.1f}s"
+        )
+
+    context = multiprocessing.get_context("spawn")
+    cancel_event = context.Event()
+    started = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=min(args.workers, max(1, len(pending))),
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(args.workers, cancel_event),
+    ) as executor:
+        work = shard_batches(pending)
+        listing = True
+        futures = {}  # Future -> (shard name, last item of the shard)
+        not_done = set()
+        while listing or not_done:
+            try:
+                while listing and len(not_done) < args.workers * 2:
+                    try:
+                        item = next(work, None)
+                    except Exception as e:
+                        logger.error(f"Listing the bucket failed: {str(e)}")
+                        for name, shard_run in runs.items():
+                            if not shard_run.listed:
+                                shard_run.error = shard_run.listed = True
+                                if shard_run.done:
+                                    finish(name)
+                        item = None
+                    if item is None:
+                        listing = False
+                        break
+                    shard, objects, last = item
+                    runs[shard["name"]].batches += 1
+                    future = executor.submit(_run_shard, shard, objects)
+                    futures[future] = (shard["name"], last)
+                    not_done.add(future)
+                if not not_done:
+                    continue
+                done, not_done = wait(not_done, return_when=FIRST_COMPLETED)
+            except KeyboardInterrupt:
+                if cancel_event.is_set():
+                    raise
+                logger.warning(
+                    "Interrupted, stopping after the documents in progress. "
+                    "Press Ctrl+C again to exit immediately."
+                )
+                cancel_event.set()
+                listing = False
+                for future in not_done:
+                    future.cancel()
+                continue
+
+            for future in done:
+                name, last = futures.pop(future)
+                shard_run = runs[name]
+                shard_run.batches -= 1
+                shard_run.listed = shard_run.listed or last
+                if future.cancelled():
+                    shard_run.cancelled = True
+                else:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f"Shard {name} failed: {str(e)}")
+                        shard_run.error = True
+                    else:
+                        for stat in _STAT_NAMES:
+                            totals[stat] += result["stats"].get(stat, 0)
+                            shard_run.stats[stat] += result["stats"].get(stat, 0)
+                        shard_run.seconds += result["seconds"]
+                        shard_run.cancelled = shard_run.cancelled or result["cancelled"]
+                if shard_run.done:
+                    finish(name)
+
+    return {
+        "shards": len(shards),
+        "completed": len(checkpoint["completed"]),
+        "finished": finished,
+        "failed_shards": failed_shards,
+        "incomplete": incomplete,
+        "seconds": time.perf_counter() - started,
+        **totals,
+    }
+
+
+def format_report(report: dict) -> str:
+    seconds = max(report["seconds"], 1e-9)
+    unfinished = report["shards"] - report["completed"]
+    lines = [
+        f"Shards       {report['completed']} of {report['shards']} finished "
+        f"({len(report['finished'])} this run, {len(report['failed_shards'])} failed, "
+        f"{len(report['incomplete'])} with failed documents, {unfinished} left)",
+        f"Documents    {report['processed']} processed, {report['skipped']} skipped, "
+        f"{report['failed']} failed, {report['queued']} fetched",
+        f"Chunks       {report['chunks']} ({report['reused']} reused, "
+        f"{report['deduplicated']} deduplicated)",
+        f"Elapsed      {report['seconds']:.1f}s",
+        f"Throughput   {report['processed'] / seconds:.2f} documents/s, "
+        f"{report['chunks'] / seconds:.2f} chunks/s",
+    ]
+    if report["failed_shards"]:
+        lines.append(f"Failed       {', '.join(report['failed_shards'])}")
+    if report["incomplete"]:
+        lines.append(f"Incomplete   {', '.join(report['incomplete'])}")
+    return "\n".join(lines)
+
+
+def _init_worker(workers: int, cancel_event):
+    global _processor, _cancel_event
+    # The parent stops workers through the event, so they can finish cleanly
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for name in _RATE_LIMIT_SETTINGS:
+        budget = getattr(settings, name)
+        if budget > 0:
+            setattr(settings, name, max(1, budget // workers))
+
+    from app.services import dependencies
+
+    embedding_service = dependencies.get_embedding_service()
+    vector_store = dependencies.get_vector_store()
+    document_tracker = dependencies.get_document_tracker(vector_store=vector_store)
+    _processor = dependencies.get_document_processor(
+        embedding_service=embedding_service,
+        vector_store=vector_store,
+        document_tracker=document_tracker,
+        dedup_index=dependencies.get_chunk_dedup_index(),
+    )
+    _cancel_event = cancel_event
+
+
+def _run_shard(shard: dict, objects: Optional[List[dict]] = None) -> dict:
+    started = time.perf_counter()
+    stats: Dict[str, int] = {}
+    _processor.process_documents(
+        shard["prefix"], stats=stats, cancel_event=_cancel_event, objects=objects
+    )
+    return {
+        "stats": stats,
+        "seconds": time.perf_counter() - started,
+        "cancelled": _cancel_event.is_set(),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    try:
+        report = run(args)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    print(format_report(report))
+    return 0 if report["completed"] == report["shards"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
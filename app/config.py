@@ -7,13 +7,35 @@ load_dotenv()
 
 class Settings(BaseSettings):
     OPENAI_API_KEY: str
-    PINECONE_API_KEY: str
-    PINECONE_ENVIRONMENT: str
+    PINECONE_API_KEY: str = ""  # Not needed with VECTOR_BACKEND=local
+    PINECONE_ENVIRONMENT: str = ""
     VECTOR_DIMENSION: int
     PINECONE_INDEX: str = "xd-embedding-index"
     PINECONE_CLOUD: str = "aws"
     PINECONE_REGION: str = "us-east-1"
 
+    PINECONE_USE_GRPC: bool = False  # Requires pinecone[grpc]
+    PINECONE_ASYNC_QUERIES: bool = True  # Query with the asyncio client, requires pinecone[asyncio]
+
+    # Vector Upserts
+    VECTOR_UPSERT_BATCH_SIZE: int = 100
+    VECTOR_UPSERT_MAX_BYTES: int = 1_500_000  # Pinecone rejects requests over 2 MB
+    VECTOR_UPSERT_CONCURRENCY: int = 4
+    VECTOR_UPSERT_MAX_RETRIES: int = 4
+
+    # Vector Backend ("pinecone" or "local")
+    VECTOR_BACKEND: str = "pinecone"
+    LOCAL_INDEX_PATH: str = ".data/vector_index"  # Empty to keep the index in memory only
+    LOCAL_ANN_MIN_VECTORS: int = 20000  # Namespaces this large use the IVF index
+    LOCAL_ANN_NPROBE: int = 8
+    LOCAL_INDEX_FLUSH_INTERVAL_SECONDS: float = 30.0
+    LOCAL_INDEX_QUANTIZATION: str = "none"  # none, float16 or int8
+
+    # Dimensionality reduction of stored and queried vectors, see app/vector_reduction.py
+    VECTOR_REDUCTION: str = "none"  # none, truncate (Matryoshka models only) or pca
+    VECTOR_REDUCED_DIMENSION: int = 0  # Dimension stored in the index when reducing
+    VECTOR_PCA_PATH: str = ".data/vector_pca.npz"  # Written by app.vector_reduction fit-pca
+
     # Ollama Configurations
     OLLAMA_BASE_URL: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 
@@ -23,9 +45,18 @@ class Settings(BaseSettings):
     S3_REGION: str
     S3_BUCKET: str
     S3_ENDPOINT: str
+    S3_FETCH_WORKERS: int = 8
+    S3_PREFETCH_DEPTH: int = 16
 
     # Application Settings
     LOG_LEVEL: str  # Added LOG_LEVEL
+    WARMUP_ON_STARTUP: bool = False
+    WARMUP_EMBEDDING_PROVIDERS: str = "openai"  # Comma-separated
+
+    # Observability
+    METRICS_ENABLED: bool = True  # Serve /metrics and record HTTP request latency
+    PROFILER_ENABLED: bool = False  # Allow starting the sampling profiler over HTTP
+    PROFILER_MAX_SECONDS: float = 300.0
 
     OLLAMA_EMDEDDING_MODEL: str = os.getenv(
         "OLLAMA_EMBEDDING_MODEL", "mxbai-embed-large"
@@ -37,6 +68,71 @@ class Settings(BaseSettings):
         "HUGGINGFACE_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
     )
 
+    # Multi-process HuggingFace inference (0 runs the model in the request thread)
+    HF_INFERENCE_WORKERS: int = 0
+    HF_INFERENCE_THREADS_PER_WORKER: int = 1
+    HF_INFERENCE_BATCH_SIZE: int = 32
+
+    # Embedding Batching
+    EMBEDDING_BATCH_SIZE: int = 100
+    EMBEDDING_BATCH_MAX_TOKENS: int = 50000
+    EMBEDDING_MAX_RETRIES: int = 3  # Attempts per provider call
+
+    # Provider scheduling: rate limits (0 for unlimited) and adaptive concurrency
+    OPENAI_REQUESTS_PER_MINUTE: int = 3000
+    OPENAI_TOKENS_PER_MINUTE: int = 1_000_000
+    HUGGINGFACE_REQUESTS_PER_MINUTE: int = 0
+    HUGGINGFACE_TOKENS_PER_MINUTE: int = 0
+    OLLAMA_REQUESTS_PER_MINUTE: int = 0
+    OLLAMA_TOKENS_PER_MINUTE: int = 0
+    EMBEDDING_INITIAL_CONCURRENCY: int = 4
+    EMBEDDING_MAX_CONCURRENCY: int = 16
+    EMBEDDING_TARGET_LATENCY_SECONDS: float = 30.0  # Slower calls reduce concurrency
+    EMBEDDING_BACKOFF_MAX_SECONDS: float = 60.0
+
+    # Text Splitting
+    SPLIT_STREAMING_MIN_BYTES: int = 8_000_000  # Larger objects are read and split incrementally
+    SPLIT_STREAM_READ_BYTES: int = 1_048_576
+    SPLIT_WORKERS: int = 0  # Processes splitting documents in parallel, 0 splits in-process
+    INGEST_EMBED_CONCURRENCY: int = 4  # Embedding batches in flight per ingestion run, 0 embeds inline
+
+    # Document Tracker ("vector_store" or "manifest")
+    DOCUMENT_TRACKER_BACKEND: str = "vector_store"
+    DOCUMENT_MANIFEST_PATH: str = ".data/manifest.sqlite3"  # Must be on persistent storage
+    DOCUMENT_MANIFEST_ALLOW_EPHEMERAL: bool = False  # Allow a manifest on tmpfs or overlay
+
+    # Chunk Deduplication ("none", "exact" or "near")
+    CHUNK_DEDUP: str = "none"
+    CHUNK_DEDUP_PATH: str = ".data/chunk_dedup.sqlite3"
+    CHUNK_DEDUP_THRESHOLD: float = 0.9  # Estimated Jaccard similarity for "near" duplicates
+
+    # Search Result Cache
+    SEARCH_CACHE_ENABLED: bool = True
+    SEARCH_CACHE_TTL_SECONDS: float = 300.0
+    SEARCH_CACHE_MAX_ENTRIES: int = 1024
+    SEARCH_BATCH_MAX_QUERIES: int = 100
+    VECTOR_QUERY_CONCURRENCY: int = 8  # Concurrent vector queries per batch search
+
+    # Ingestion Jobs
+    INGESTION_MAX_CONCURRENT_JOBS: int = 2
+    INGESTION_JOB_HISTORY: int = 100
+
+    # Micro-batching of concurrent single-text requests
+    EMBEDDING_MICRO_BATCHING: bool = True
+    EMBEDDING_BATCHER_MAX_CONCURRENCY: int = 4
+    OPENAI_BATCH_MAX_SIZE: int = 64
+    OPENAI_BATCH_MAX_WAIT_MS: float = 5.0
+    HUGGINGFACE_BATCH_MAX_SIZE: int = 32
+    HUGGINGFACE_BATCH_MAX_WAIT_MS: float = 10.0
+    OLLAMA_BATCH_MAX_SIZE: int = 16
+    OLLAMA_BATCH_MAX_WAIT_MS: float = 10.0
+
+    # Embedding Cache
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 10000
+    EMBEDDING_CACHE_PATH: str = ".cache/embeddings.sqlite3"  # Empty for memory only
+    EMBEDDING_CACHE_QUANTIZATION: str = "none"  # none, float16 or int8
+
     class ConfigDict:  # Changed to ConfigDict
         env_file = ".env"
 
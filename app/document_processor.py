@@ -1,119 +1,867 @@
-from typing import List, Dict
+import hashlib
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Iterator, List, Dict, Optional, Set, Tuple
 
+import numpy as np
+
+from app.config import settings
+from app.services.chunk_dedup import ChunkDedupIndex, DedupSession
 from app.services.document_fetcher import fetch_parsed_documents
-from app.services.document_tracker import DocumentTracker
+from app.services.document_tracker import BaseDocumentTracker
 from app.services.embedding import EmbeddingService
-from app.vector_store import VectorStore
+from app.services.text_splitting import (
+    StreamingTextSplitter,
+    split_in_worker,
+    split_worker_initializer,
+)
+from app.utils import metrics
+from app.utils.retry import estimate_tokens
+from app.utils.vectors import valid_rows
+from app.vector_store import BufferedVectorWriter, VectorStore
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 from app.utils.logger import logger
 
+# Vectors fetched per request when carrying over unchanged chunks
+_FETCH_BATCH_SIZE = 100
+# Referencing documents listed in a stored chunk's metadata; the count covers all of them
+_MAX_DUPLICATE_SOURCES = 20
+
+
+def _chunk_id(document_key: str, chunk_index: int) -> str:
+    return f"{document_key}_chunk_{chunk_index}"
+
+
+def _chunk_hash(chunk: str) -> str:
+    # 128 bits, as exact deduplication matches chunks across the whole corpus by
+    # this hash
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:32]
+
+
+def _document_hash(chunk_hash: str) -> str:
+    # 64 bits is plenty to tell the chunks of one document apart; trackers store
+    # only these, which keeps the hash lists within Pinecone's metadata limit
+    return chunk_hash[:16]
+
+
+class _PendingDocument:
+    """
+    Embedded chunks of a document whose batches are still being processed.
+
+    Chunks are added as the splitter produces them, so the chunk count is only
+    known once the document is sealed.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        source: Optional[dict] = None,
+        previous_hashes: Optional[List[str]] = None,
+        dedup: Optional[DedupSession] = None,
+    ):
+        self.key = key
+        self.source = source or {}  # ETag, size and last-modified of the S3 object
+        self.previous_hashes = previous_hashes or []  # Of the processed version, if any
+        self.previous_positions: Dict[str, int] = {}
+        for j, value in enumerate(self.previous_hashes):
+            if value:
+                self.previous_positions.setdefault(value, j)
+        self.chunk_hashes: List[str] = []
+        self.deferred: Dict[int, str] = {}  # Chunks that may reuse a stored vector
+        self.dedup = dedup  # Deduplication session of the run, if enabled
+        self.claimed: List[int] = []  # Chunks no stored chunk duplicates
+        self.references: Dict[int, str] = {}  # Duplicate chunks and the chunk ID they reuse
+        self.invalid: List[int] = []  # Chunks whose embedding was invalid
+        self.remaining = 0
+        self.sealed = False
+        self.reused = 0
+        self.failed = False
+        self.chunk_ids: List[str] = []
+        self.embeddings: List[np.ndarray] = []  # Rows of the batch matrices, not copies
+        self.metadata: List[dict] = []
+
+    @property
+    def total_chunks(self) -> int:
+        return len(self.chunk_hashes)
+
+    @property
+    def complete(self) -> bool:
+        return self.sealed and self.remaining == 0
+
+    @property
+    def stale_ids(self) -> List[str]:
+        """Chunk IDs of the previous version beyond the new chunk count."""
+        return [
+            _chunk_id(self.key, j) for j in range(self.total_chunks, len(self.previous_hashes))
+        ]
+
+    @property
+    def superseded_ids(self) -> List[str]:
+        """
+        Chunk IDs of the previous version that get no new vector: the chunk is now
+        a duplicate reference, or its new content could not be embedded.
+        """
+        return [
+            _chunk_id(self.key, i)
+            for i in [*self.references, *self.invalid]
+            if i < len(self.previous_hashes)
+        ]
+
+    def new_chunk(self, chunk: str) -> int:
+        """Register the next chunk and return its index."""
+        self.chunk_hashes.append(_chunk_hash(chunk))
+        self.remaining += 1
+        return self.total_chunks - 1
+
+    def add_chunk(self, chunk_index: int, chunk: str, embedding: np.ndarray):
+        self.chunk_ids.append(_chunk_id(self.key, chunk_index))
+        self.embeddings.append(embedding)
+        self.metadata.append(
+            {
+                "source_key": self.key,
+                "chunk_index": chunk_index,
+                "total_chunks": None,  # Filled in once the document is complete
+                "content_hash": self.chunk_hashes[chunk_index],
+                "content": chunk[:200],  # Store preview of content
+            }
+        )
+
+
+class _ChunkBatch:
+    """
+    Chunks waiting to be embedded together, possibly from several documents, the
+    earlier batches of the run that are still being embedded, and the run's
+    deduplication session.
+    """
+
+    def __init__(self, dedup: Optional[DedupSession] = None):
+        self.items: List[Tuple[_PendingDocument, int, str]] = []
+        self.tokens = 0
+        self.in_flight: deque = deque()  # (items, Future of their embeddings)
+        self.dedup = dedup
+
 
 class DocumentProcessor:
     def __init__(
         self,
         embedding_service: EmbeddingService,
         vector_store: VectorStore,
-        document_tracker: DocumentTracker,
+        document_tracker: BaseDocumentTracker,
         chunk_size: int = 1000,
         chunk_overlap: int = 200,
+        batch_size: Optional[int] = None,
+        batch_max_tokens: Optional[int] = None,
+        split_workers: Optional[int] = None,
+        embed_concurrency: Optional[int] = None,
+        dedup_index: Optional[ChunkDedupIndex] = None,
     ):
         self.embedding_service = embedding_service
         self.vector_store = vector_store
         self.document_tracker = document_tracker
+        self.dedup_index = dedup_index
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size, chunk_overlap=chunk_overlap
         )
+        self.streaming_splitter = StreamingTextSplitter(self.text_splitter)
+        self.batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        self.batch_max_tokens = batch_max_tokens or settings.EMBEDDING_BATCH_MAX_TOKENS
+        self.split_workers = (
+            settings.SPLIT_WORKERS if split_workers is None else split_workers
+        )
+        self.embed_concurrency = (
+            settings.INGEST_EMBED_CONCURRENCY if embed_concurrency is None else embed_concurrency
+        )
+        self._split_pool: Optional[ProcessPoolExecutor] = None
+        self._split_pool_lock = threading.Lock()
+        self._embed_executor: Optional[ThreadPoolExecutor] = None
+        self._embed_executor_lock = threading.Lock()
+
+    def close(self):
+        """Stop the splitting worker processes and embedding threads, if they were started."""
+        if self._split_pool is not None:
+            self._split_pool.shutdown(wait=True, cancel_futures=True)
+            self._split_pool = None
+        if self._embed_executor is not None:
+            self._embed_executor.shutdown(wait=True, cancel_futures=True)
+            self._embed_executor = None
 
-    def process_documents(self, prefix: str = "") -> Dict[str, int]:
+    def process_documents(
+        self,
+        prefix: str = "",
+        stats: Optional[Dict[str, int]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        objects: Optional[Iterable[dict]] = None,
+    ) -> Dict[str, int]:
         """
         Process new documents from S3 and store their embeddings in Pinecone.
+
+        Chunks from consecutive documents are packed into embedding batches capped
+        by both item count and estimated token count. Embedded documents are
+        streamed into a buffered vector writer.
+
+        The stages overlap, each with its own workers and a bound on the work it
+        holds, so a slow stage holds back the ones before it:
+
+        - fetch: up to S3_FETCH_WORKERS downloads, S3_PREFETCH_DEPTH documents ahead
+        - split: in-process and lazy, or SPLIT_WORKERS processes, two documents each
+        - embed: up to INGEST_EMBED_CONCURRENCY batches in flight
+        - upsert: up to VECTOR_UPSERT_CONCURRENCY buffered writes in flight
+
+        Embedding results and write confirmations are applied on the calling
+        thread, and a document is marked processed only once all of its vectors
+        are confirmed written.
+
+        For a changed document whose chunk hashes were recorded, only chunks with
+        new content are embedded. Chunks that moved reuse their stored vector,
+        chunks left in place are not rewritten, and chunk IDs beyond the new chunk
+        count are deleted before the document is marked processed.
+
+        With a deduplication index, a chunk that duplicates a stored chunk of
+        another document, exactly or (in "near" mode) by MinHash similarity, is
+        neither embedded nor stored: the index records a reference to the stored
+        chunk ID instead, and the stored chunk's metadata lists the referencing
+        documents under "duplicate_sources". A duplicate of a chunk this run is
+        still writing waits for that write. Documents whose referenced chunks
+        changed or were deleted are ingested again at the end of the run.
+
+        Args:
+            prefix (str): Only process keys starting with this prefix.
+            stats (Optional[Dict[str, int]]): Dictionary updated in place as the run
+                progresses, so callers can observe live statistics. "failed" counts
+                the documents that could not be downloaded, split, embedded or
+                written; they stay unprocessed for the next run to retry.
+            cancel_event (Optional[threading.Event]): Stops the run when set.
+                Documents that are not fully embedded yet stay unprocessed.
+            objects (Optional[Iterable[dict]]): S3 listing entries to process instead
+                of listing the prefix, as in the pages of `list_objects`.
+
         Returns statistics about the processing.
         """
-        stats = {"processed": 0, "skipped": 0, "chunks": 0}
+        if stats is None:
+            stats = {}
+        for name in ("queued", "processed", "skipped", "failed", "chunks", "reused", "deduplicated"):
+            stats.setdefault(name, 0)
 
-        # Get list of processed documents
-        processed_docs = self.document_tracker.get_processed_documents()
+        # Fetch new and changed documents, checking each listing page against the tracker
+        documents = fetch_parsed_documents(
+            prefix, document_tracker=self.document_tracker, progress=stats, objects=objects
+        )
 
-        # Fetch new documents
-        documents = fetch_parsed_documents(prefix, processed_docs)
+        writer = self.vector_store.buffered_writer()
+        batch = _ChunkBatch(self.dedup_index.session() if self.dedup_index is not None else None)
+        requeued: Set[str] = set()
+        try:
+            while documents is not None:
+                if self._ingest_documents(documents, batch, stats, writer, cancel_event, prefix):
+                    # Partially embedded documents stay unprocessed
+                    self._drop_in_flight(batch)
+                    batch = _ChunkBatch()
+                while True:
+                    if batch.items:
+                        self._embed_batch(batch, stats, writer)
+                    self._collect_embeddings(batch, stats, writer, keep=0)
+                    writer.flush()
+                    # Duplicates released by the last writes may need embedding after all
+                    if not self._resolve_duplicates(batch, stats, writer):
+                        break
+                documents = self._requeued_documents(batch, stats, requeued)
+        finally:
+            # Also reached when a stage raises: stop the embedding work still running
+            # and write what is buffered, so finished documents are still marked
+            self._drop_in_flight(batch)
+            writer.close()
+        self.vector_store.flush()
 
-        for doc in documents:
-            try:
-                # Split document into chunks
-                chunks = self.text_splitter.split_text(doc["content"])
+        cache_stats = self.embedding_service.cache_stats()
+        if cache_stats:
+            logger.info(f"Embedding cache stats: {cache_stats}")
+        return stats
 
-                if not chunks:
+    def _ingest_documents(
+        self,
+        documents: Iterator[dict],
+        batch: _ChunkBatch,
+        stats: Dict[str, int],
+        writer: BufferedVectorWriter,
+        cancel_event: Optional[threading.Event],
+        prefix: str,
+    ) -> bool:
+        """
+        Split fetched documents and queue their chunks for embedding, finalizing
+        the documents that need no more embeddings.
+
+        Returns:
+            bool: Whether the run was cancelled before all documents were consumed.
+        """
+        split_documents = self._split_documents(documents)
+        try:
+            for doc, chunks in split_documents:
+                if cancel_event is not None and cancel_event.is_set():
+                    logger.info(f"Processing of prefix '{prefix}' cancelled")
+                    return True
+
+                previous_hashes, lookup_failed = [], False
+                if doc.get("previously_processed"):
+                    try:
+                        with metrics.DOCUMENT_TRACKER_SECONDS.labels("get_chunk_hashes").time():
+                            previous_hashes = self.document_tracker.get_chunk_hashes(doc["key"])
+                    except Exception as e:
+                        logger.error(f"Error fetching chunk hashes of {doc['key']}: {str(e)}")
+                        lookup_failed = True
+                pending = _PendingDocument(
+                    doc["key"],
+                    source={
+                        "etag": doc.get("etag"),
+                        "size": doc.get("size"),
+                        "last_modified": doc.get("last_modified"),
+                    },
+                    previous_hashes=previous_hashes,
+                    dedup=batch.dedup,
+                )
+                if lookup_failed:
+                    pending.failed = True
+                    chunks = ()  # Left unsplit; the next run tries again
+                try:
+                    for chunk in chunks:
+                        i = pending.new_chunk(chunk)
+                        if _document_hash(pending.chunk_hashes[i]) in pending.previous_positions:
+                            # Decided once the final chunk count is known
+                            pending.deferred[i] = chunk
+                        else:
+                            self._deduplicate(batch, pending, i, chunk, stats, writer)
+                except Exception as e:
+                    logger.error(f"Error splitting document {doc['key']}: {str(e)}")
+                    pending.failed = True
+
+                if pending.total_chunks == 0 and not pending.failed:
                     logger.warning(f"No content to process for document: {doc['key']}")
                     stats["skipped"] += 1
+                    metrics.INGESTED_DOCUMENTS.labels("empty").inc()
                     continue
 
-                # Process each chunk
-                embeddings = []
-                chunk_ids = []
-                metadata_list = []
-
-                for i, chunk in enumerate(chunks):
-                    print(i)
-                    logger.debug(f"Processing chunk {i} of document {doc['key']}")
-                    # Generate embedding
-                    embedding = self.embedding_service.get_openai_embeddings(chunk)
-
-                    # Validate embedding
-                    if not self._is_valid_embedding(embedding):
-                        logger.warning(
-                            f"Invalid embedding for chunk {i} of document {doc['key']}. Skipping."
-                        )
-                        stats["skipped"] += 1
-                        continue
+                pending.sealed = True
+                if pending.failed:
+                    pending.remaining -= len(pending.deferred)
+                elif pending.deferred:
+                    for i in self._reuse_chunks(pending, stats):
+                        self._deduplicate(batch, pending, i, pending.deferred[i], stats, writer)
+                pending.deferred = {}
+                if pending.complete:
+                    self._finalize_document(pending, stats, writer)
+                self._collect_embeddings(batch, stats, writer)
+                self._resolve_duplicates(batch, stats, writer)
 
-                    # Prepare metadata
-                    metadata = {
-                        "source_key": doc["key"],
-                        "chunk_index": i,
-                        "total_chunks": len(chunks),
-                        "content": chunk[:200],  # Store preview of content
-                    }
-
-                    chunk_ids.append(f"{doc['key']}_chunk_{i}")
-                    embeddings.append(embedding)
-                    metadata_list.append(metadata)
-
-                if embeddings:
-                    # Store embeddings in Pinecone
-                    self.vector_store.upsert_embeddings(
-                        ids=chunk_ids, embeddings=embeddings, metadata=metadata_list
-                    )
-                    logger.info(
-                        f"Upserted {len(embeddings)} embeddings for document: {doc['key']}"
+        finally:
+            split_documents.close()
+        return False
+
+    def _requeued_documents(
+        self, batch: _ChunkBatch, stats: Dict[str, int], requeued: Set[str]
+    ) -> Optional[Iterator[dict]]:
+        """
+        Fetch the documents that the run's deduplication forgot because chunks they
+        referenced changed or were deleted, so they are ingested again in the same
+        run. A document is requeued at most once per run.
+
+        Returns:
+            Optional[Iterator[dict]]: The fetched documents, None if there are none.
+        """
+        if batch.dedup is None:
+            return None
+        keys = batch.dedup.take_forgotten() - requeued
+        if not keys:
+            return None
+        requeued |= keys
+        logger.info(f"Ingesting {len(keys)} documents again whose referenced chunks changed")
+        # Not checked against the tracker: one may have been marked again since it was forgotten
+        return fetch_parsed_documents(
+            progress=stats, objects=[{"Key": key} for key in sorted(keys)]
+        )
+
+    @staticmethod
+    def _drop_in_flight(batch: _ChunkBatch):
+        """Cancel the embedding batches not started yet, and wait for the running ones."""
+        for _, future in batch.in_flight:
+            future.cancel()
+        wait([future for _, future in batch.in_flight])
+        batch.in_flight.clear()
+
+    def _embed_batch(self, batch: _ChunkBatch, stats: Dict[str, int], writer: BufferedVectorWriter):
+        """
+        Hand the pending chunks of `batch` to the embedding stage and start a new batch.
+
+        Waits for an earlier batch to finish first if INGEST_EMBED_CONCURRENCY
+        batches are already in flight. With no concurrency the batch is embedded
+        right away.
+        """
+        items = batch.items
+        batch.items, batch.tokens = [], 0
+        executor = self._get_embed_executor()
+        if executor is None:
+            self._apply_embeddings(items, self._embed_items(items), stats, writer)
+            return
+        self._collect_embeddings(batch, stats, writer, keep=self.embed_concurrency - 1)
+        batch.in_flight.append((items, executor.submit(self._embed_items, items)))
+
+    def _collect_embeddings(
+        self,
+        batch: _ChunkBatch,
+        stats: Dict[str, int],
+        writer: BufferedVectorWriter,
+        keep: Optional[int] = None,
+    ):
+        """
+        Apply the embedding batches that have finished.
+
+        Args:
+            batch (_ChunkBatch): The run's batch, holding the batches in flight.
+            stats (Dict[str, int]): Processing statistics to update.
+            writer (BufferedVectorWriter): Writer that completed documents go to.
+            keep (Optional[int]): Wait until at most this many batches are still in
+                flight. None only applies the ones already done.
+        """
+        while batch.in_flight:
+            done = [entry for entry in batch.in_flight if entry[1].done()]
+            if not done:
+                if keep is None or len(batch.in_flight) <= keep:
+                    return
+                with metrics.INGEST_STAGE_WAIT_SECONDS.labels("embed").time():
+                    wait([future for _, future in batch.in_flight], return_when=FIRST_COMPLETED)
+                continue
+            for entry in done:
+                batch.in_flight.remove(entry)
+                items, future = entry
+                self._apply_embeddings(items, future.result(), stats, writer)
+
+    def _embed_items(self, items: List[Tuple[_PendingDocument, int, str]]) -> Optional[np.ndarray]:
+        """Embed the chunks of a batch, or return None if the provider call failed."""
+        logger.debug(f"Embedding batch of {len(items)} chunks")
+        try:
+            return self.embedding_service.embed_documents([chunk for _, _, chunk in items])
+        except Exception as e:
+            logger.error(f"Error embedding batch of {len(items)} chunks: {str(e)}")
+            return None
+
+    def _apply_embeddings(
+        self,
+        batch: List[Tuple[_PendingDocument, int, str]],
+        embeddings: Optional[np.ndarray],
+        stats: Dict[str, int],
+        writer: BufferedVectorWriter,
+    ):
+        """
+        Hand each vector of an embedded batch back to its document.
+
+        Args:
+            batch (List[Tuple[_PendingDocument, int, str]]): Document, chunk index
+                and chunk text for every chunk in the batch.
+            embeddings (Optional[np.ndarray]): One row per chunk, None if embedding failed.
+            stats (Dict[str, int]): Processing statistics to update.
+            writer (BufferedVectorWriter): Writer that completed documents go to.
+        """
+        # Validate the whole batch at once: rows must be finite and not all zeros
+        valid = valid_rows(embeddings) if embeddings is not None else None
+        for position, (pending, i, chunk) in enumerate(batch):
+            if embeddings is None:
+                pending.failed = True
+            elif not valid[position]:
+                logger.warning(
+                    f"Invalid embedding for chunk {i} of document {pending.key}. Skipping."
+                )
+                stats["skipped"] += 1
+                pending.chunk_hashes[i] = ""  # Never counts as unchanged next time
+                pending.invalid.append(i)  # Its previous vector is deleted once processed
+            else:
+                pending.add_chunk(i, chunk, embeddings[position])
+
+            pending.remaining -= 1
+            if pending.complete:
+                self._finalize_document(pending, stats, writer)
+
+    def _deduplicate(
+        self,
+        batch: _ChunkBatch,
+        pending: _PendingDocument,
+        chunk_index: int,
+        chunk: str,
+        stats: Dict[str, int],
+        writer: BufferedVectorWriter,
+    ):
+        """
+        Add a chunk to the batch, unless it duplicates a chunk of another document
+        that is stored, or that this run claimed and is still writing.
+        """
+        session = pending.dedup
+        if session is None:
+            self._add_to_batch(batch, pending, chunk_index, chunk, stats, writer)
+            return
+        content_hash = pending.chunk_hashes[chunk_index]
+        signature = session.index.signature(chunk)
+        found = session.find(pending.key, content_hash, signature)
+        if found is None:
+            session.claim(_chunk_id(pending.key, chunk_index), pending.key, content_hash, signature)
+            pending.claimed.append(chunk_index)
+            self._add_to_batch(batch, pending, chunk_index, chunk, stats, writer)
+        elif session.is_claimed(found):
+            session.wait(found, (pending, chunk_index, chunk))
+        else:
+            self._add_reference(pending, chunk_index, found, stats)
+
+    def _add_reference(
+        self, pending: _PendingDocument, chunk_index: int, chunk_id: str, stats: Dict[str, int]
+    ):
+        pending.references[chunk_index] = chunk_id
+        pending.remaining -= 1
+        stats["deduplicated"] += 1
+        metrics.DEDUPLICATED_CHUNKS.inc()
+
+    def _resolve_duplicates(
+        self, batch: _ChunkBatch, stats: Dict[str, int], writer: BufferedVectorWriter
+    ) -> bool:
+        """
+        Hand back the duplicates whose claimed chunk was settled: as a reference
+        if it was written, or to be deduplicated again if it was not.
+
+        Returns:
+            bool: Whether any duplicates were waiting to be handed back.
+        """
+        if batch.dedup is None:
+            return False
+        ready = batch.dedup.take_ready()
+        for (pending, i, chunk), found in ready:
+            if found is not None:
+                self._add_reference(pending, i, found, stats)
+            elif pending.failed:
+                pending.remaining -= 1
+            else:
+                self._deduplicate(batch, pending, i, chunk, stats, writer)
+            if pending.complete:
+                self._finalize_document(pending, stats, writer)
+        return bool(ready)
+
+    def _add_to_batch(
+        self,
+        batch: _ChunkBatch,
+        pending: _PendingDocument,
+        chunk_index: int,
+        chunk: str,
+        stats: Dict[str, int],
+        writer: BufferedVectorWriter,
+    ):
+        """Add a chunk to the batch, embedding the batch first if the chunk would overflow it."""
+        tokens = estimate_tokens(chunk)
+        if batch.items and (
+            len(batch.items) >= self.batch_size
+            or batch.tokens + tokens > self.batch_max_tokens
+        ):
+            self._embed_batch(batch, stats, writer)
+        batch.items.append((pending, chunk_index, chunk))
+        batch.tokens += tokens
+
+    def _split_documents(self, documents: Iterator[dict]) -> Iterator[Tuple[dict, Iterable[str]]]:
+        """
+        Pair each document with a lazy iterable of its chunks, in document order.
+
+        Streamed documents are split as they are read. With split workers, other
+        documents are split ahead on the process pool, up to two per worker.
+        """
+        pool = self._get_split_pool()
+        in_flight: deque = deque()
+        try:
+            for doc in documents:
+                if doc.get("stream") is not None:
+                    while in_flight:
+                        yield _split_result(*in_flight.popleft())
+                    yield doc, _timed_chunks(
+                        self.streaming_splitter.split_stream(doc["stream"]), "stream"
                     )
+                elif pool is None:
+                    yield doc, _timed_chunks(self._split_lazily(doc.pop("content")), "inline")
                 else:
-                    logger.warning(
-                        f"No valid embeddings to upsert for document: {doc['key']}"
-                    )
+                    content = doc.pop("content")
+                    try:
+                        future = pool.submit(split_in_worker, content)
+                    except BrokenProcessPool as e:
+                        logger.error(f"Split worker pool failed, splitting in-process: {str(e)}")
+                        self.close()
+                        pool = None
+                        yield doc, _timed_chunks(self._split_lazily(content), "inline")
+                        continue
+                    in_flight.append((doc, future))
+                    while len(in_flight) > 2 * self.split_workers:
+                        yield _split_result(*in_flight.popleft())
+            while in_flight:
+                yield _split_result(*in_flight.popleft())
+        finally:
+            documents.close()
+            for _, future in in_flight:
+                future.cancel()
 
-                # Mark document as processed
-                self.document_tracker.mark_as_processed(doc["key"])
+    def _split_lazily(self, text: str) -> Iterator[str]:
+        # A generator, so splitting errors surface while the chunks are consumed
+        yield from self.text_splitter.split_text(text)
 
-                stats["processed"] += 1
-                stats["chunks"] += len(embeddings)
-                logger.info(
-                    f"Processed document: {doc['key']} into {len(embeddings)} valid chunks"
+    def _get_embed_executor(self) -> Optional[ThreadPoolExecutor]:
+        if self.embed_concurrency <= 0:
+            return None
+        with self._embed_executor_lock:
+            if self._embed_executor is None:
+                self._embed_executor = ThreadPoolExecutor(
+                    max_workers=self.embed_concurrency, thread_name_prefix="ingest-embed"
                 )
-            except Exception as e:
-                logger.error(f"Error processing document {doc['key']}: {str(e)}")
-                stats["skipped"] += 1
+            return self._embed_executor
 
-        return stats
+    def _get_split_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.split_workers <= 0:
+            return None
+        with self._split_pool_lock:
+            if self._split_pool is None:
+                initializer, initargs = split_worker_initializer(self.text_splitter)
+                self._split_pool = ProcessPoolExecutor(
+                    max_workers=self.split_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=initializer,
+                    initargs=initargs,
+                )
+            return self._split_pool
+
+    def _finalize_document(
+        self,
+        pending: _PendingDocument,
+        stats: Dict[str, int],
+        writer: BufferedVectorWriter,
+    ):
+        """
+        Queue the embeddings of a fully embedded document for writing.
 
-    def _is_valid_embedding(self, embedding: List[float]) -> bool:
+        Documents with a failed batch are left unmarked so the next run retries them.
+
+        Args:
+            pending (_PendingDocument): The document to finalize.
+            stats (Dict[str, int]): Processing statistics to update.
+            writer (BufferedVectorWriter): Writer that stores the vectors.
         """
-        Validate that the embedding contains at least one non-zero value.
+        if pending.failed:
+            logger.error(
+                f"Processing failed for document {pending.key}. It will be retried on the next run."
+            )
+            stats["failed"] += 1
+            metrics.INGESTED_DOCUMENTS.labels("failed").inc()
+            self._settle_duplicates(pending)
+            return
+
+        if not pending.embeddings and not pending.reused and not pending.references:
+            logger.warning(f"No valid embeddings to upsert for document: {pending.key}")
+
+        for metadata in pending.metadata:
+            metadata["total_chunks"] = pending.total_chunks
+
+        writer.add(
+            pending.chunk_ids,
+            pending.embeddings,
+            pending.metadata,
+            on_written=lambda: self._mark_processed(pending, stats),
+            on_failed=lambda error: self._record_write_failure(pending, stats, error),
+        )
+
+    def _mark_processed(self, pending: _PendingDocument, stats: Dict[str, int]):
+        """Mark a document as processed once all of its vectors are written."""
+        try:
+            self._settle_duplicates(pending, written=True)
+            # Drop chunks the new version no longer has or stores no vector for,
+            # then mark document as processed
+            removed_ids = pending.stale_ids + pending.superseded_ids
+            if removed_ids:
+                self.vector_store.delete(removed_ids)
+            with metrics.DOCUMENT_TRACKER_SECONDS.labels("mark_as_processed").time():
+                self.document_tracker.mark_as_processed(
+                    pending.key,
+                    chunk_hashes=[_document_hash(value) for value in pending.chunk_hashes],
+                    **pending.source,
+                )
+
+            stats["processed"] += 1
+            metrics.INGESTED_DOCUMENTS.labels("processed").inc()
+            stats["chunks"] += len(pending.embeddings)
+            logger.info(
+                f"Processed document: {pending.key} into {len(pending.embeddings)} valid chunks"
+                + (
+                    f" ({pending.reused} unchanged chunks reused, "
+                    f"{len(removed_ids)} removed)"
+                    if pending.reused or removed_ids
+                    else ""
+                )
+                + (
+                    f" ({len(pending.references)} duplicate chunks referenced)"
+                    if pending.references
+                    else ""
+                )
+            )
+        except Exception as e:
+            logger.error(f"Error processing document {pending.key}: {str(e)}")
+            stats["failed"] += 1
+            metrics.INGESTED_DOCUMENTS.labels("failed").inc()
+
+    def _record_write_failure(
+        self, pending: _PendingDocument, stats: Dict[str, int], error: str
+    ):
+        logger.error(
+            f"Error upserting embeddings for document {pending.key}: {error}. "
+            f"It will be retried on the next run."
+        )
+        stats["failed"] += 1
+        metrics.INGESTED_DOCUMENTS.labels("failed").inc()
+        self._settle_duplicates(pending)
+
+    def _settle_duplicates(self, pending: _PendingDocument, written: bool = False):
+        """
+        Update the deduplication index once a document is finished.
+
+        Written chunks are registered, so later chunks can reference them, and
+        claims on chunks that were not written are released. Chunk IDs that are
+        deleted are dropped from the index, and the new references recorded.
+        Documents whose references pointed at chunks that now hold other content,
+        or are deleted, are forgotten by the tracker and ingested again at the end
+        of the run.
+        """
+        if pending.dedup is None:
+            return
+        stored = []
+        if written:
+            stored = [
+                (chunk_id, metadata["content_hash"])
+                for chunk_id, metadata in zip(pending.chunk_ids, pending.metadata)
+            ]
+        stored_ids = {chunk_id for chunk_id, _ in stored}
+        released = [
+            _chunk_id(pending.key, i)
+            for i in pending.claimed
+            if _chunk_id(pending.key, i) not in stored_ids
+        ]
+        forgotten: Set[str] = pending.dedup.settle(pending.key, stored, released)
+        if written:
+            index = pending.dedup.index
+            removed_ids = pending.stale_ids + pending.superseded_ids
+            forgotten |= index.remove(removed_ids)
+            touched = index.update_references(
+                pending.key,
+                pending.total_chunks,
+                stored_ids,
+                [
+                    (_chunk_id(pending.key, i), i, chunk_id)
+                    for i, chunk_id in pending.references.items()
+                ],
+            )
+            self._record_duplicate_sources(index, touched - set(removed_ids))
+        if forgotten:
+            self.document_tracker.forget(forgotten)
+            pending.dedup.forgotten |= forgotten
+
+    def _record_duplicate_sources(self, index: ChunkDedupIndex, chunk_ids: Set[str]):
+        """
+        Set "duplicate_sources" (the first _MAX_DUPLICATE_SOURCES referencing
+        document keys) and "duplicate_count" on the metadata of stored chunks, so
+        search results name every document a chunk stands for.
+        """
+        if not chunk_ids:
+            return
+        self.vector_store.update_metadata(
+            {
+                chunk_id: {
+                    "duplicate_sources": sources[:_MAX_DUPLICATE_SOURCES],
+                    "duplicate_count": len(sources),
+                }
+                for chunk_id, sources in index.duplicate_sources(chunk_ids).items()
+            }
+        )
+
+    def _reuse_chunks(self, pending: _PendingDocument, stats: Dict[str, int]) -> List[int]:
+        """
+        Carry over the vectors of the deferred chunks, whose content the processed
+        version of the document already had.
+
+        A chunk with the same hash at the same index (and an unchanged chunk count)
+        needs no write at all. A chunk whose hash appears at another index reuses
+        the vector stored under that index. Vectors that cannot be fetched are
+        embedded again.
 
         Args:
-            embedding (List[float]): The embedding vector to validate.
+            pending (_PendingDocument): The new, sealed version of the document.
+            stats (Dict[str, int]): Processing statistics to update.
 
         Returns:
-            bool: True if valid, False otherwise.
+            List[int]: Indices of the deferred chunks that still need embedding.
         """
-        return any(value != 0.0 for value in embedding)
+        previous_hashes = pending.previous_hashes
+        same_layout = len(previous_hashes) == pending.total_chunks
+
+        to_fetch = {}
+        for i in sorted(pending.deferred):
+            value = _document_hash(pending.chunk_hashes[i])
+            if same_layout and previous_hashes[i] == value:
+                pending.remaining -= 1
+                pending.reused += 1
+            else:
+                to_fetch[i] = _chunk_id(pending.key, pending.previous_positions[value])
+
+        to_embed = []
+        vectors = self._fetch_vectors(list(set(to_fetch.values())))
+        for i, vector_id in to_fetch.items():
+            if vector_id in vectors:
+                pending.add_chunk(i, pending.deferred[i], vectors[vector_id])
+                pending.remaining -= 1
+                pending.reused += 1
+            else:
+                to_embed.append(i)
+
+        stats["reused"] += pending.reused
+        return to_embed
+
+    def _fetch_vectors(self, vector_ids: List[str]) -> Dict[str, np.ndarray]:
+        """Fetch stored vectors by ID, leaving out any that are missing or fail."""
+        vectors = {}
+        for start in range(0, len(vector_ids), _FETCH_BATCH_SIZE):
+            try:
+                results = self.vector_store.fetch(vector_ids[start : start + _FETCH_BATCH_SIZE])
+            except Exception as e:
+                logger.error(f"Error fetching vectors for reuse: {str(e)}")
+                continue
+            for vector_id, record in results.items():
+                values = record.get("values")
+                if values is not None and len(values):
+                    vectors[vector_id] = np.asarray(values, dtype=np.float32)
+        return vectors
+
+
+def _split_result(doc: dict, future: Future) -> Tuple[dict, Iterator[str]]:
+    return doc, _timed_chunks(_future_chunks(future), "pool")
+
+
+def _future_chunks(future: Future) -> Iterator[str]:
+    """Yield the chunks a split worker returns, raising its error while consumed."""
+    yield from future.result()
+
+
+def _timed_chunks(chunks: Iterator[str], mode: str) -> Iterator[str]:
+    """
+    Yield the chunks of a document, recording the time spent producing them, but
+    not the time the consumer spends between chunks, as one split observation.
+    """
+    elapsed, count = 0.0, 0
+    try:
+        while True:
+            started = time.perf_counter()
+            chunk = next(chunks, None)
+            elapsed += time.perf_counter() - started
+            if chunk is None:
+                return
+            count += 1
+            yield chunk
+    finally:
+        metrics.SPLIT_SECONDS.labels(mode).observe(elapsed)
+        metrics.SPLIT_CHUNKS.labels(mode).inc(count)
@@ -1,18 +1,43 @@
+import time
+
+_import_started = time.perf_counter()
+
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
-from app.routers import embed_file, search, embed_bucket
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.routers import embed_file, search, embed_bucket, metrics
+from app.services.dependencies import (
+    close_async_clients,
+    open_async_clients,
+    shutdown_services,
+    warmup_services,
+)
 from app.utils.logger import logger
+from app.utils.metrics import RequestMetricsMiddleware
 from fastapi import HTTPException
 
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
     logger.info("Starting Embedding Service...")
+    startup_started = time.perf_counter()
+    if settings.WARMUP_ON_STARTUP:
+        await run_in_threadpool(warmup_services)
+        await open_async_clients()
+    _app.state.startup_seconds = time.perf_counter() - _import_started
+    logger.info(
+        f"Embedding Service ready in {_app.state.startup_seconds:.2f}s "
+        f"(imports {startup_started - _import_started:.2f}s, "
+        f"warmup {time.perf_counter() - startup_started:.2f}s)"
+    )
     try:
         yield
     finally:
         logger.info("Shutting down Embedding Service...")
+        await close_async_clients()
+        shutdown_services()
 
 
 app = FastAPI(
@@ -23,6 +48,10 @@ app = FastAPI(
 app.include_router(embed_file.router, prefix="/api/v1")
 app.include_router(search.router, prefix="/api/v1")
 app.include_router(embed_bucket.router, prefix="/api/v1")
+app.include_router(metrics.debug_router, prefix="/api/v1")
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router)
+    app.add_middleware(RequestMetricsMiddleware)
 
 
 @app.exception_handler(Exception)
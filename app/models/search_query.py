@@ -1,7 +1,15 @@
-from pydantic import BaseModel
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
 
 
 class SearchQuery(BaseModel):
     query: str
     top_k: int = 10
     model: str = "mxbai-embed-large"
+    namespace: Optional[str] = None
+    filter: Optional[dict] = None
+
+
+class BatchSearchQuery(BaseModel):
+    queries: List[SearchQuery] = Field(min_length=1)
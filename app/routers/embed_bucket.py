@@ -1,31 +1,90 @@
 from fastapi import APIRouter, HTTPException, Depends
 from typing import Optional
-from app.document_processor import DocumentProcessor
-from app.services.dependencies import get_document_processor
+from app.services.dependencies import get_ingestion_job_manager
+from app.services.ingestion_jobs import IngestionJobManager
 from app.utils.logger import logger
 
 router = APIRouter()
 
 
-@router.post("/embed-bucket")
+@router.post("/embed-bucket", status_code=202)
 def process_documents(
     prefix: Optional[str] = "",
-    document_processor: DocumentProcessor = Depends(get_document_processor),
+    job_manager: IngestionJobManager = Depends(get_ingestion_job_manager),
 ):
     """
-    Endpoint to process documents and generate embeddings.
+    Endpoint to start processing documents and generating embeddings in the background.
 
     Args:
         prefix (Optional[str]): Optional prefix to filter documents.
-        document_processor (DocumentProcessor): Singleton instance of DocumentProcessor.
+        job_manager (IngestionJobManager): Singleton instance of IngestionJobManager.
 
     Returns:
-        dict: Status and statistics of the processing operation.
+        dict: Status and ID of the queued ingestion job.
     """
     try:
-        print("processing documents")
-        stats = document_processor.process_documents(prefix)
-        return {"status": "success", "stats": stats}
+        job = job_manager.submit(prefix or "")
+        return {"status": "accepted", "job_id": job.id}
     except Exception as e:
-        logger.error(f"Error processing documents: {str(e)}")
+        logger.error(f"Error submitting ingestion job: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.get("/embed-bucket/jobs")
+def list_jobs(
+    limit: int = 20,
+    job_manager: IngestionJobManager = Depends(get_ingestion_job_manager),
+):
+    """
+    Endpoint to list recent ingestion jobs, newest first.
+
+    Args:
+        limit (int): Maximum number of jobs to return.
+        job_manager (IngestionJobManager): Singleton instance of IngestionJobManager.
+
+    Returns:
+        dict: Recent jobs with their status and statistics.
+    """
+    return {"jobs": [job.to_dict() for job in job_manager.list_jobs(limit)]}
+
+
+@router.get("/embed-bucket/jobs/{job_id}")
+def get_job(
+    job_id: str,
+    job_manager: IngestionJobManager = Depends(get_ingestion_job_manager),
+):
+    """
+    Endpoint to report the live status of an ingestion job.
+
+    Args:
+        job_id (str): The ID returned when the job was submitted.
+        job_manager (IngestionJobManager): Singleton instance of IngestionJobManager.
+
+    Returns:
+        dict: Job status, statistics, throughput and ETA.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
+
+
+@router.post("/embed-bucket/jobs/{job_id}/cancel")
+def cancel_job(
+    job_id: str,
+    job_manager: IngestionJobManager = Depends(get_ingestion_job_manager),
+):
+    """
+    Endpoint to cancel a queued or running ingestion job.
+
+    Args:
+        job_id (str): The ID returned when the job was submitted.
+        job_manager (IngestionJobManager): Singleton instance of IngestionJobManager.
+
+    Returns:
+        dict: Job status after the cancellation request.
+    """
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
@@ -0,0 +1,76 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse, Response
+
+from app.config import settings
+from app.utils.metrics import CONTENT_TYPE, REGISTRY
+from app.utils.profiler import profiler
+
+router = APIRouter()
+debug_router = APIRouter(prefix="/debug/profiler")
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Endpoint exposing the service metrics in the Prometheus text format.
+
+    Returns:
+        Response: Per-stage latency histograms and counters for ingestion,
+            embedding providers, the vector store and HTTP routes.
+    """
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@debug_router.post("/start")
+def start_profiler(interval_ms: float = 10.0, duration_seconds: Optional[float] = 60.0):
+    """
+    Endpoint to start the sampling profiler. Requires PROFILER_ENABLED.
+
+    Args:
+        interval_ms (float): Time between stack samples.
+        duration_seconds (Optional[float]): Stop automatically after this long,
+            capped by PROFILER_MAX_SECONDS.
+
+    Returns:
+        dict: Profiler status.
+    """
+    _require_profiler()
+    duration = min(duration_seconds or settings.PROFILER_MAX_SECONDS, settings.PROFILER_MAX_SECONDS)
+    try:
+        profiler.start(interval_ms=interval_ms, duration_seconds=duration)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profiler.status()
+
+
+@debug_router.post("/stop")
+def stop_profiler():
+    """
+    Endpoint to stop the sampling profiler, keeping its report.
+
+    Returns:
+        dict: Profiler status.
+    """
+    _require_profiler()
+    profiler.stop()
+    return profiler.status()
+
+
+@debug_router.get("")
+def profiler_report():
+    """
+    Endpoint returning the sampled stacks in collapsed format, for flamegraph.pl
+    or speedscope. Can be read while the profiler is running.
+
+    Returns:
+        PlainTextResponse: One line per distinct stack with its sample count.
+    """
+    _require_profiler()
+    return PlainTextResponse(profiler.collapsed())
+
+
+def _require_profiler():
+    if not settings.PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler is disabled.")
@@ -1,20 +1,31 @@
+from typing import Optional
+
+import numpy as np
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 
 from app.services.embedding import EmbeddingService
+from app.services.provider_scheduler import PRIORITY_INTERACTIVE, EmbeddingUnavailableError
+from app.services.search_cache import SearchCache
 from app.vector_store import VectorStore
 from app.utils.logger import logger
-from app.services.dependencies import get_embedding_service, get_vector_store
-from app.models.search_query import SearchQuery
+from app.services.dependencies import (
+    get_embedding_service,
+    get_search_cache,
+    get_vector_store,
+)
+from app.config import settings
+from app.models.search_query import BatchSearchQuery, SearchQuery
 
 router = APIRouter()
 
 
 @router.post("/search")
-def search_documents(
+async def search_documents(
     query: SearchQuery,
     embedding_service: EmbeddingService = Depends(get_embedding_service),
     vector_store: VectorStore = Depends(get_vector_store),
+    search_cache: Optional[SearchCache] = Depends(get_search_cache),
 ):
     """
     Endpoint to search for documents based on a query.
@@ -23,16 +34,124 @@ def search_documents(
         query (SearchQueryModel): The search query parameters.
         embedding_service (EmbeddingService): Singleton instance of EmbeddingService.
         vector_store (VectorStore): Singleton instance of VectorStore.
+        search_cache (Optional[SearchCache]): Singleton result cache, None if disabled.
 
     Returns:
         dict: Search results containing matching documents.
     """
     try:
-        query_embedding = embedding_service.get_openai_embeddings(query.query)
-        results = vector_store.query_embeddings(
-            vector=query_embedding, top_k=query.top_k
+        # Read the generation before querying so a concurrent upsert invalidates the entry
+        generation = vector_store.generation(query.namespace)
+        cache_key = SearchCache.make_key(
+            query.query, query.top_k, query.model, query.namespace, query.filter
+        )
+        if search_cache is not None:
+            cached = search_cache.get(cache_key, generation)
+            if cached is not None:
+                return {"results": cached}
+
+        query_embedding = await embedding_service.aembed_query(query.query)
+        results = await vector_store.aquery_embeddings(
+            vector=query_embedding,
+            top_k=query.top_k,
+            namespace=query.namespace,
+            filter=query.filter,
         )
+        # A zero vector means the embedding call failed; don't cache its results
+        if search_cache is not None and np.any(query_embedding):
+            search_cache.put(cache_key, generation, results.matches)
         return {"results": results.matches}
+    except EmbeddingUnavailableError as e:
+        logger.error(f"Error embedding search query: {str(e)}")
+        raise HTTPException(status_code=503, detail="Embedding provider unavailable.")
     except Exception as e:
         logger.error(f"Error searching documents: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.post("/search/batch")
+async def search_documents_batch(
+    batch: BatchSearchQuery,
+    embedding_service: EmbeddingService = Depends(get_embedding_service),
+    vector_store: VectorStore = Depends(get_vector_store),
+    search_cache: Optional[SearchCache] = Depends(get_search_cache),
+):
+    """
+    Endpoint to run many searches in one request.
+
+    Query texts that miss the result cache are embedded with one batched provider
+    call, then the vector queries run concurrently. A failed query gets an error
+    entry and does not fail the others.
+
+    Args:
+        batch (BatchSearchQuery): The search queries, each shaped like a `/search` body.
+        embedding_service (EmbeddingService): Singleton instance of EmbeddingService.
+        vector_store (VectorStore): Singleton instance of VectorStore.
+        search_cache (Optional[SearchCache]): Singleton result cache, None if disabled.
+
+    Returns:
+        dict: One entry per query, in input order, with either "results" or "error".
+    """
+    queries = batch.queries
+    if len(queries) > settings.SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.SEARCH_BATCH_MAX_QUERIES} queries per batch.",
+        )
+
+    responses = [None] * len(queries)
+    generations = [vector_store.generation(query.namespace) for query in queries]
+    cache_keys = [
+        SearchCache.make_key(query.query, query.top_k, query.model, query.namespace, query.filter)
+        for query in queries
+    ]
+    pending = []
+    for i, query in enumerate(queries):
+        cached = search_cache.get(cache_keys[i], generations[i]) if search_cache else None
+        if cached is not None:
+            responses[i] = {"results": cached, "error": None}
+        elif not query.query.strip():
+            responses[i] = {"results": None, "error": "Query text is empty."}
+        else:
+            pending.append(i)
+
+    if pending:
+        texts = list(dict.fromkeys(queries[i].query for i in pending))
+        try:
+            embeddings = await embedding_service.aembed_documents(
+                texts, priority=PRIORITY_INTERACTIVE
+            )
+            rows = {text: embeddings[row] for row, text in enumerate(texts)}
+        except Exception as e:
+            logger.error(f"Error embedding batch of {len(texts)} search queries: {str(e)}")
+            rows = {}
+
+        to_query = []
+        for i in pending:
+            vector = rows.get(queries[i].query)
+            if vector is None or not np.any(vector):
+                responses[i] = {"results": None, "error": "Failed to embed the query."}
+            else:
+                to_query.append(i)
+
+        results = await vector_store.aquery_many(
+            [
+                {
+                    "vector": rows[queries[i].query],
+                    "top_k": queries[i].top_k,
+                    "namespace": queries[i].namespace,
+                    "filter": queries[i].filter,
+                }
+                for i in to_query
+            ]
+        )
+        for i, result in zip(to_query, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error searching documents for batch query {i}: {str(result)}")
+                responses[i] = {"results": None, "error": "Search failed."}
+                continue
+            if search_cache is not None:
+                search_cache.put(cache_keys[i], generations[i], result.matches)
+            responses[i] = {"results": result.matches, "error": None}
+
+    return {"results": responses}
@@ -0,0 +1,471 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.utils.logger import logger
+
+DEDUP_MODES = ("none", "exact", "near")
+
+# SQLite caps the number of bound parameters per statement
+_LOOKUP_BATCH_SIZE = 500
+_SHINGLE_WORDS = 3
+_SHINGLE_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+class MinHasher:
+    """
+    MinHash signatures of word shingles, and the LSH buckets they fall in.
+
+    With `bands` bands of `num_perm / bands` rows, two chunks share a bucket with
+    probability 1 - (1 - J^rows)^bands for Jaccard similarity J: near certain
+    above 0.9 and rare below 0.5 with the defaults.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: (a * x + b) mod 2^64, keeping the high 32 bits
+        self._a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * 2 + 1
+        self._b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        words = text.lower().split() or [""]
+        hashes = np.fromiter(
+            (zlib.crc32(word.encode("utf-8")) for word in words),
+            dtype=np.uint64,
+            count=len(words),
+        )
+        # Combine the hashes of consecutive words into one hash per shingle
+        count = max(1, len(words) - _SHINGLE_WORDS + 1)
+        shingles = np.zeros(count, dtype=np.uint64)
+        for offset in range(min(_SHINGLE_WORDS, len(words))):
+            shingles = shingles * _SHINGLE_MULTIPLIER + hashes[offset : offset + count]
+        permuted = np.outer(np.unique(shingles), self._a) + self._b
+        return (permuted.min(axis=0) >> np.uint64(32)).astype(np.uint32)
+
+    def buckets(self, signature: np.ndarray) -> List[int]:
+        """One signed 64-bit bucket per band, salted with the band index."""
+        buckets = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows : (band + 1) * self.rows]
+            digest = hashlib.blake2b(bytes([band]) + rows.tobytes(), digest_size=8).digest()
+            buckets.append(int.from_bytes(digest, "little", signed=True))
+        return buckets
+
+    @staticmethod
+    def similarity(first: np.ndarray, second: np.ndarray) -> float:
+        """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+        return float(np.mean(first == second))
+
+
+class ChunkDedupIndex:
+    """
+    Persistent SQLite index of the chunks stored in the vector store, and of the
+    chunks that reference one of them instead of storing a vector.
+
+    `chunks` maps each stored chunk ID to its content hash and, in "near" mode,
+    its MinHash signature, whose LSH buckets are in `buckets`. `refs` maps the
+    chunk ID a duplicate would have had to the stored chunk ID it reuses. When a
+    stored chunk's content changes or it is removed, the references to it are
+    dropped and the documents holding them are returned, so they can be ingested
+    again. The index is local to the host; the documents referencing a stored
+    chunk are also recorded in its vector metadata, see `duplicate_sources`.
+
+    Chunks are only matched across documents.
+    """
+
+    def __init__(self, path: str, mode: str = "exact", threshold: float = 0.9):
+        if mode not in DEDUP_MODES or mode == "none":
+            raise ValueError(f"Unknown chunk deduplication mode: {mode}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.mode = mode
+        self.threshold = threshold
+        self.hasher = MinHasher()
+        self._lock = threading.Lock()
+        # Bulk-ingest worker processes share the index; wait out their write locks
+        self._db = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                document_key TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                signature BLOB
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_by_hash ON chunks (content_hash)")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS buckets (
+                bucket INTEGER NOT NULL,
+                chunk_id TEXT NOT NULL,
+                PRIMARY KEY (bucket, chunk_id)
+            ) WITHOUT ROWID
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS buckets_by_chunk ON buckets (chunk_id)")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS refs (
+                chunk_id TEXT PRIMARY KEY,
+                document_key TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                canonical_id TEXT NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS refs_by_document ON refs (document_key)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS refs_by_canonical ON refs (canonical_id)")
+        self._db.commit()
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature of a chunk in "near" mode, None otherwise."""
+        return self.hasher.signature(text) if self.mode == "near" else None
+
+    def session(self) -> "DedupSession":
+        return DedupSession(self)
+
+    def find(
+        self, document_key: str, content_hash: str, signature: Optional[np.ndarray]
+    ) -> Optional[str]:
+        """
+        Find a stored chunk of another document with the same content, or with an
+        estimated Jaccard similarity of at least `threshold`.
+
+        Returns:
+            Optional[str]: The stored chunk ID, None if there is none.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT chunk_id FROM chunks WHERE content_hash = ? AND document_key != ? LIMIT 1",
+                (content_hash, document_key),
+            ).fetchone()
+            if row is not None or signature is None:
+                return row[0] if row is not None else None
+            buckets = self.hasher.buckets(signature)
+            rows = self._db.execute(
+                f"SELECT DISTINCT c.chunk_id, c.signature FROM buckets b "
+                f"JOIN chunks c ON c.chunk_id = b.chunk_id "
+                f"WHERE b.bucket IN ({','.join('?' * len(buckets))}) AND c.document_key != ?",
+                [*buckets, document_key],
+            ).fetchall()
+        best, best_similarity = None, self.threshold
+        for chunk_id, blob in rows:
+            candidate = np.frombuffer(blob, dtype=np.uint32)
+            if len(candidate) != len(signature):
+                continue  # Written with other MinHash parameters
+            similarity = self.hasher.similarity(signature, candidate)
+            if similarity >= best_similarity:
+                best, best_similarity = chunk_id, similarity
+        return best
+
+    def register(
+        self,
+        document_key: str,
+        chunks: List[Tuple[str, str, Optional[np.ndarray]]],
+    ) -> Set[str]:
+        """
+        Record chunks that were written to the vector store.
+
+        Args:
+            document_key (str): The document the chunks belong to.
+            chunks (List[Tuple[str, str, Optional[np.ndarray]]]): Chunk ID, content
+                hash and signature (None to only match exact duplicates) of each chunk.
+
+        Returns:
+            Set[str]: Documents whose references to these chunk IDs were dropped
+                because the chunks now hold other content.
+        """
+        with self._lock, self._db:
+            previous = dict(
+                self._select(
+                    "SELECT chunk_id, content_hash FROM chunks",
+                    "chunk_id",
+                    [chunk_id for chunk_id, _, _ in chunks],
+                )
+            )
+            changed = [
+                chunk_id
+                for chunk_id, content_hash, _ in chunks
+                if chunk_id in previous and previous[chunk_id] != content_hash
+            ]
+            dropped = self._drop_references(changed)
+            if self.mode == "near":
+                # Reused and moved chunks were not hashed this run; they keep the
+                # signature stored for their content
+                chunks = [
+                    (chunk_id, content_hash, self._stored_signature(content_hash))
+                    if signature is None
+                    else (chunk_id, content_hash, signature)
+                    for chunk_id, content_hash, signature in chunks
+                ]
+            self._db.executemany(
+                "DELETE FROM buckets WHERE chunk_id = ?", [(chunk_id,) for chunk_id, _, _ in chunks]
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, document_key, content_hash, signature) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        chunk_id,
+                        document_key,
+                        content_hash,
+                        signature.tobytes() if signature is not None else None,
+                    )
+                    for chunk_id, content_hash, signature in chunks
+                ],
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO buckets (bucket, chunk_id) VALUES (?, ?)",
+                [
+                    (bucket, chunk_id)
+                    for chunk_id, _, signature in chunks
+                    if signature is not None
+                    for bucket in self.hasher.buckets(signature)
+                ],
+            )
+        return dropped
+
+    def remove(self, chunk_ids: Iterable[str]) -> Set[str]:
+        """
+        Forget chunks that were deleted from the vector store.
+
+        Returns:
+            Set[str]: Documents whose references to these chunks were dropped.
+        """
+        rows = [(chunk_id,) for chunk_id in chunk_ids]
+        with self._lock, self._db:
+            dropped = self._drop_references([row[0] for row in rows])
+            self._db.executemany("DELETE FROM buckets WHERE chunk_id = ?", rows)
+            self._db.executemany("DELETE FROM chunks WHERE chunk_id = ?", rows)
+        return dropped
+
+    def update_references(
+        self,
+        document_key: str,
+        total_chunks: int,
+        stored_ids: Iterable[str],
+        references: List[Tuple[str, int, str]],
+    ) -> Set[str]:
+        """
+        Record the references of a processed document.
+
+        References of chunks beyond `total_chunks` or now stored in their own right
+        are dropped; those of unchanged chunks are kept.
+
+        Args:
+            document_key (str): The processed document.
+            total_chunks (int): Chunk count of the processed version.
+            stored_ids (Iterable[str]): Chunk IDs of the document written to the vector store.
+            references (List[Tuple[str, int, str]]): Chunk ID, chunk index and
+                referenced stored chunk ID of each duplicate chunk.
+
+        Returns:
+            Set[str]: Stored chunk IDs whose referencing documents may have changed:
+                those the document referenced before or references now, and its
+                own rewritten chunks that other documents reference.
+        """
+        stored_ids = list(stored_ids)
+        with self._lock, self._db:
+            touched = {
+                row[0]
+                for row in self._db.execute(
+                    "SELECT DISTINCT canonical_id FROM refs WHERE document_key = ?",
+                    (document_key,),
+                )
+            }
+            self._db.execute(
+                "DELETE FROM refs WHERE document_key = ? AND chunk_index >= ?",
+                (document_key, total_chunks),
+            )
+            self._db.executemany(
+                "DELETE FROM refs WHERE chunk_id = ?", [(chunk_id,) for chunk_id in stored_ids]
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO refs (chunk_id, document_key, chunk_index, canonical_id) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (chunk_id, document_key, chunk_index, canonical_id)
+                    for chunk_id, chunk_index, canonical_id in references
+                ],
+            )
+            touched.update(canonical_id for _, _, canonical_id in references)
+            referenced = self._select(
+                "SELECT DISTINCT canonical_id FROM refs", "canonical_id", stored_ids
+            )
+            touched.update(row[0] for row in referenced)
+        return touched
+
+    def duplicate_sources(self, chunk_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        Look up the documents that reference stored chunks.
+
+        Returns:
+            Dict[str, List[str]]: The sorted referencing document keys of each
+                chunk ID, empty for chunks nothing references.
+        """
+        chunk_ids = list(chunk_ids)
+        with self._lock:
+            rows = self._select(
+                "SELECT canonical_id, document_key FROM refs", "canonical_id", chunk_ids
+            )
+        sources: Dict[str, Set[str]] = {chunk_id: set() for chunk_id in chunk_ids}
+        for chunk_id, document_key in rows:
+            sources[chunk_id].add(document_key)
+        return {chunk_id: sorted(keys) for chunk_id, keys in sources.items()}
+
+    def _stored_signature(self, content_hash: str) -> Optional[np.ndarray]:
+        row = self._db.execute(
+            "SELECT signature FROM chunks WHERE content_hash = ? AND signature IS NOT NULL LIMIT 1",
+            (content_hash,),
+        ).fetchone()
+        return np.frombuffer(row[0], dtype=np.uint32) if row is not None else None
+
+    def _drop_references(self, canonical_ids: List[str]) -> Set[str]:
+        if not canonical_ids:
+            return set()
+        documents = {
+            row[0]
+            for row in self._select("SELECT document_key FROM refs", "canonical_id", canonical_ids)
+        }
+        self._db.executemany(
+            "DELETE FROM refs WHERE canonical_id = ?", [(chunk_id,) for chunk_id in canonical_ids]
+        )
+        return documents
+
+    def _select(self, query: str, column: str, values: List[str]) -> List[tuple]:
+        rows = []
+        for start in range(0, len(values), _LOOKUP_BATCH_SIZE):
+            batch = values[start : start + _LOOKUP_BATCH_SIZE]
+            rows.extend(
+                self._db.execute(
+                    f"{query} WHERE {column} IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+            )
+        return rows
+
+
+class DedupSession:
+    """
+    Deduplication state of one ingestion run.
+
+    Chunks the run is about to store are claimed, so later chunks of the run can
+    match them before they are written. A duplicate of a claimed chunk waits for
+    it: once the claim is settled, the duplicate is handed back through `ready`
+    with the stored chunk ID, or with None if the claimed chunk was not written
+    after all. Only used from the thread running the ingestion.
+    """
+
+    def __init__(self, index: ChunkDedupIndex):
+        self.index = index
+        self._claims: Dict[str, Tuple[str, str, Optional[np.ndarray]]] = {}
+        self._by_hash: Dict[str, str] = {}
+        self._by_bucket: Dict[int, List[str]] = {}
+        self._waiting: Dict[str, List[Any]] = {}
+        self.ready: List[Tuple[Any, Optional[str]]] = []
+        # Documents forgotten by the tracker because their references were dropped
+        self.forgotten: Set[str] = set()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(items) for items in self._waiting.values())
+
+    def find(
+        self, document_key: str, content_hash: str, signature: Optional[np.ndarray]
+    ) -> Optional[str]:
+        """Find a stored or claimed chunk of another document that this chunk duplicates."""
+        found = self.index.find(document_key, content_hash, signature)
+        if found is not None:
+            return found
+        claimed = self._by_hash.get(content_hash)
+        if claimed in self._claims and self._claims[claimed][0] != document_key:
+            return claimed
+        if signature is None:
+            return None
+        best, best_similarity = None, self.index.threshold
+        for bucket in self.index.hasher.buckets(signature):
+            for chunk_id in self._by_bucket.get(bucket, ()):
+                claim = self._claims.get(chunk_id)
+                if claim is None or claim[0] == document_key:
+                    continue
+                similarity = self.index.hasher.similarity(signature, claim[2])
+                if similarity >= best_similarity:
+                    best, best_similarity = chunk_id, similarity
+        return best
+
+    def is_claimed(self, chunk_id: str) -> bool:
+        return chunk_id in self._claims
+
+    def claim(
+        self,
+        chunk_id: str,
+        document_key: str,
+        content_hash: str,
+        signature: Optional[np.ndarray],
+    ):
+        self._claims[chunk_id] = (document_key, content_hash, signature)
+        if self._by_hash.get(content_hash) not in self._claims:
+            self._by_hash[content_hash] = chunk_id
+        if signature is not None:
+            for bucket in self.index.hasher.buckets(signature):
+                self._by_bucket.setdefault(bucket, []).append(chunk_id)
+
+    def wait(self, chunk_id: str, item: Any):
+        """Hand `item` back through `ready` once the claim on `chunk_id` is settled."""
+        self._waiting.setdefault(chunk_id, []).append(item)
+
+    def settle(
+        self,
+        document_key: str,
+        written: List[Tuple[str, str]],
+        released: Iterable[str] = (),
+    ) -> Set[str]:
+        """
+        Record the chunks of a document that were written, and release the claims
+        of those that were not.
+
+        Args:
+            document_key (str): The document.
+            written (List[Tuple[str, str]]): Chunk ID and content hash of each chunk
+                written to the vector store.
+            released (Iterable[str]): Claimed chunk IDs that were not written.
+
+        Returns:
+            Set[str]: Documents whose references were dropped, see `ChunkDedupIndex.register`.
+        """
+        chunks = []
+        for chunk_id, content_hash in written:
+            claim = self._claims.pop(chunk_id, None)
+            chunks.append((chunk_id, content_hash, claim[2] if claim is not None else None))
+            self.ready.extend((item, chunk_id) for item in self._waiting.pop(chunk_id, ()))
+        for chunk_id in released:
+            self._claims.pop(chunk_id, None)
+            self.ready.extend((item, None) for item in self._waiting.pop(chunk_id, ()))
+        dropped = self.index.register(document_key, chunks) if chunks else set()
+        if dropped:
+            logger.info(
+                f"Chunks of {document_key} changed content; {len(dropped)} documents "
+                f"referencing them will be ingested again"
+            )
+        return dropped
+
+    def take_ready(self) -> List[Tuple[Any, Optional[str]]]:
+        ready, self.ready = self.ready, []
+        return ready
+
+    def take_forgotten(self) -> Set[str]:
+        forgotten, self.forgotten = self.forgotten, set()
+        return forgotten
@@ -1,14 +1,25 @@
+from typing import Optional
+
 from fastapi import Depends
 from app.services.embedding import EmbeddingService
 from app.vector_store import VectorStore
-from app.services.document_tracker import DocumentTracker
+from app.services.document_tracker import BaseDocumentTracker, DocumentTracker
+from app.services.manifest_tracker import ManifestDocumentTracker
+from app.services.chunk_dedup import ChunkDedupIndex
 from app.document_processor import DocumentProcessor
+from app.services.ingestion_jobs import IngestionJobManager
+from app.services.search_cache import SearchCache
+from app.config import settings
+from app.utils.logger import logger
 
 # Singleton instances initialized as None
 _embedding_service_instance = None
 _vector_store_instance = None
 _document_tracker_instance = None
+_chunk_dedup_index_instance = None
 _document_processor_instance = None
+_ingestion_job_manager_instance = None
+_search_cache_instance = None
 
 
 def get_embedding_service() -> EmbeddingService:
@@ -31,22 +42,58 @@ def get_vector_store() -> VectorStore:
     return _vector_store_instance
 
 
+def get_search_cache() -> Optional[SearchCache]:
+    """
+    Provides a singleton instance of SearchCache, or None if it is disabled.
+    """
+    global _search_cache_instance
+    if _search_cache_instance is None and settings.SEARCH_CACHE_ENABLED:
+        _search_cache_instance = SearchCache(
+            max_entries=settings.SEARCH_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.SEARCH_CACHE_TTL_SECONDS,
+        )
+    return _search_cache_instance
+
+
 def get_document_tracker(
     vector_store: VectorStore = Depends(get_vector_store),
-) -> DocumentTracker:
+) -> BaseDocumentTracker:
     """
-    Provides a singleton instance of DocumentTracker.
+    Provides a singleton document tracker: the vector store namespace by default,
+    which every replica shares, or the local SQLite manifest when
+    DOCUMENT_TRACKER_BACKEND=manifest.
     """
     global _document_tracker_instance
     if _document_tracker_instance is None:
-        _document_tracker_instance = DocumentTracker(vector_store=vector_store)
+        if settings.DOCUMENT_TRACKER_BACKEND == "manifest":
+            _document_tracker_instance = ManifestDocumentTracker(
+                path=settings.DOCUMENT_MANIFEST_PATH,
+                allow_ephemeral=settings.DOCUMENT_MANIFEST_ALLOW_EPHEMERAL,
+            )
+        else:
+            _document_tracker_instance = DocumentTracker(vector_store=vector_store)
     return _document_tracker_instance
 
 
+def get_chunk_dedup_index() -> Optional[ChunkDedupIndex]:
+    """
+    Provides a singleton instance of ChunkDedupIndex, or None if CHUNK_DEDUP is "none".
+    """
+    global _chunk_dedup_index_instance
+    if _chunk_dedup_index_instance is None and settings.CHUNK_DEDUP != "none":
+        _chunk_dedup_index_instance = ChunkDedupIndex(
+            path=settings.CHUNK_DEDUP_PATH,
+            mode=settings.CHUNK_DEDUP,
+            threshold=settings.CHUNK_DEDUP_THRESHOLD,
+        )
+    return _chunk_dedup_index_instance
+
+
 def get_document_processor(
     embedding_service: EmbeddingService = Depends(get_embedding_service),
     vector_store: VectorStore = Depends(get_vector_store),
-    document_tracker: DocumentTracker = Depends(get_document_tracker),
+    document_tracker: BaseDocumentTracker = Depends(get_document_tracker),
+    dedup_index: Optional[ChunkDedupIndex] = Depends(get_chunk_dedup_index),
 ) -> DocumentProcessor:
     """
     Provides a singleton instance of DocumentProcessor.
@@ -57,5 +104,73 @@ def get_document_processor(
             embedding_service=embedding_service,
             vector_store=vector_store,
             document_tracker=document_tracker,
+            dedup_index=dedup_index,
         )
     return _document_processor_instance
+
+
+def get_ingestion_job_manager(
+    document_processor: DocumentProcessor = Depends(get_document_processor),
+) -> IngestionJobManager:
+    """
+    Provides a singleton instance of IngestionJobManager.
+    """
+    global _ingestion_job_manager_instance
+    if _ingestion_job_manager_instance is None:
+        _ingestion_job_manager_instance = IngestionJobManager(
+            document_processor=document_processor,
+            max_concurrent_jobs=settings.INGESTION_MAX_CONCURRENT_JOBS,
+            max_history=settings.INGESTION_JOB_HISTORY,
+        )
+    return _ingestion_job_manager_instance
+
+
+def warmup_services():
+    """
+    Creates the singletons and preloads the configured embedding providers and the
+    vector backend, so the first request does not pay for it.
+    """
+    providers = [
+        provider.strip()
+        for provider in settings.WARMUP_EMBEDDING_PROVIDERS.split(",")
+        if provider.strip()
+    ]
+    get_embedding_service().warmup(providers)
+    vector_store = get_vector_store()
+    vector_store.warmup()
+    get_document_tracker(vector_store=vector_store)
+
+
+async def open_async_clients():
+    """
+    Opens the async clients, whose keep-alive connection pools belong to the running
+    event loop. Called from the app's lifespan when WARMUP_ON_STARTUP is set; otherwise
+    the first async query opens them.
+    """
+    try:
+        await get_vector_store().aopen()
+    except Exception as e:
+        # Queries fall back to threads; a broken backend fails them on first use instead
+        logger.warning(f"Could not open async vector store clients: {e}")
+
+
+async def close_async_clients():
+    if _vector_store_instance is not None:
+        await _vector_store_instance.aclose()
+
+
+def shutdown_services():
+    """
+    Cancels unfinished ingestion jobs, persists buffered vector writes and stops
+    splitting and embedding worker processes, for the singletons that were ever created.
+    """
+    global _ingestion_job_manager_instance
+    if _ingestion_job_manager_instance is not None:
+        _ingestion_job_manager_instance.shutdown()
+        _ingestion_job_manager_instance = None
+    if _document_processor_instance is not None:
+        _document_processor_instance.close()
+    if _vector_store_instance is not None:
+        _vector_store_instance.flush()
+    if _embedding_service_instance is not None:
+        _embedding_service_instance.close()
@@ -1,32 +1,234 @@
+import codecs
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional
+
 import boto3
+from botocore.config import Config
 from app.config import settings
+from app.services.document_tracker import BaseDocumentTracker
+from app.utils import metrics
 from app.utils.logger import logger  # Assuming logger is available for logging
 
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=settings.S3_ACCESS_KEY,
-    aws_secret_access_key=settings.S3_SECRET_KEY,
-    region_name=settings.S3_REGION,
-)
-
-
-def fetch_parsed_documents(prefix="", processed_documents=None):
-    """Fetch new parsed documents from S3 bucket."""
-    if processed_documents is None:
-        processed_documents = []
-    documents = []
-    response = s3_client.list_objects_v2(Bucket=settings.S3_BUCKET, Prefix=prefix)
-
-    for obj in response.get("Contents", []):
-        file_key = obj["Key"]
-        if file_key in processed_documents:
-            logger.info(f"Skipping already processed document: {file_key}")  # Log the skipped document
-            continue  # Skip already processed documents
-
-        file_obj = s3_client.get_object(Bucket=settings.S3_BUCKET, Key=file_key)
-        content = file_obj["Body"].read().decode("utf-8")
-        documents.append(
-            {"key": file_key, "content": content}
-        )  # Store key with content
-        print(f"Fetched document: {file_key}")
-    return documents
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """Return the shared S3 client, creating it on first use. boto3 clients are thread-safe."""
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = boto3.client(
+                    "s3",
+                    aws_access_key_id=settings.S3_ACCESS_KEY,
+                    aws_secret_access_key=settings.S3_SECRET_KEY,
+                    region_name=settings.S3_REGION,
+                    # One pooled keep-alive connection per download worker, and per
+                    # document in flight since large ones keep their body open
+                    # until they are read, plus one for the listing
+                    config=Config(
+                        max_pool_connections=max(
+                            10, settings.S3_FETCH_WORKERS, settings.S3_PREFETCH_DEPTH + 1
+                        ),
+                        tcp_keepalive=True,
+                    ),
+                )
+    return _s3_client
+
+
+def fetch_parsed_documents(
+    prefix: str = "",
+    processed_documents: Optional[Iterable[str]] = None,
+    document_tracker: Optional[BaseDocumentTracker] = None,
+    max_workers: Optional[int] = None,
+    prefetch_depth: Optional[int] = None,
+    progress: Optional[Dict[str, int]] = None,
+    objects: Optional[Iterable[dict]] = None,
+) -> Iterator[dict]:
+    """
+    Stream new parsed documents from the S3 bucket.
+
+    Keys are listed page by page and downloaded on a bounded thread pool. At most
+    `prefetch_depth` downloads are in flight or waiting to be consumed at any time,
+    so memory stays flat regardless of the bucket size. Documents are yielded in
+    the order their downloads complete.
+
+    Args:
+        prefix (str): Only fetch keys starting with this prefix.
+        processed_documents (Optional[Iterable[str]]): Keys to skip.
+        document_tracker (Optional[BaseDocumentTracker]): When given, each listing
+            page is checked against the tracker in bulk, and objects whose ETag or
+            size changed since they were processed are fetched again.
+        max_workers (Optional[int]): Download threads, defaults to S3_FETCH_WORKERS.
+        prefetch_depth (Optional[int]): Max documents in flight, defaults to S3_PREFETCH_DEPTH.
+        progress (Optional[Dict[str, int]]): Its "queued" count is incremented for
+            every key scheduled for download, and its "failed" count for every
+            download that raised and every key of a page the tracker could not check.
+        objects (Optional[Iterable[dict]]): Listing entries ("Key", "ETag", "Size"
+            and "LastModified") to fetch instead of listing the prefix, for
+            example one hash range of a listing made by the caller.
+
+    Yields:
+        dict: The document key, its decoded content, and the ETag, size and
+            last-modified time of the object version that was read. Objects of at
+            least SPLIT_STREAMING_MIN_BYTES have no "content"; their text is read
+            lazily from the "stream" iterator instead.
+    """
+    processed = set(processed_documents or ())
+    max_workers = max_workers or settings.S3_FETCH_WORKERS
+    prefetch_depth = max(prefetch_depth or settings.S3_PREFETCH_DEPTH, max_workers)
+
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="s3-fetch"
+    ) as executor:
+        in_flight = {}  # Future -> key
+        try:
+            pages = list_objects(prefix) if objects is None else _pages(objects)
+            for obj in _list_unprocessed(pages, processed, document_tracker, progress):
+                file_key = obj["Key"]
+                in_flight[executor.submit(_download_document, obj)] = file_key
+                if progress is not None:
+                    progress["queued"] = progress.get("queued", 0) + 1
+                if len(in_flight) >= prefetch_depth:
+                    yield from _completed_documents(in_flight, progress)
+
+            while in_flight:
+                yield from _completed_documents(in_flight, progress)
+        finally:
+            # Stop queued downloads if the consumer stops early
+            for future in in_flight:
+                future.cancel()
+
+
+def list_objects(prefix: str = "") -> Iterator[List[dict]]:
+    """
+    List the bucket under a prefix.
+
+    Args:
+        prefix (str): Only list keys starting with this prefix.
+
+    Yields:
+        List[dict]: The listing entries of each page: "Key", "ETag", "Size" and
+            "LastModified".
+    """
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    pages = iter(paginator.paginate(Bucket=settings.S3_BUCKET, Prefix=prefix))
+    while True:
+        with metrics.FETCH_SECONDS.labels("list").time():
+            page = next(pages, None)
+        if page is None:
+            return
+        yield page.get("Contents", [])
+
+
+def _pages(objects: Iterable[dict], page_size: int = 1000) -> Iterator[List[dict]]:
+    """Group listing entries given by the caller into pages, as the listing returns them."""
+    page = []
+    for obj in objects:
+        page.append(obj)
+        if len(page) >= page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def _list_unprocessed(
+    pages: Iterable[List[dict]],
+    processed: set,
+    document_tracker: Optional[BaseDocumentTracker],
+    progress: Optional[Dict[str, int]] = None,
+) -> Iterator[dict]:
+    """Yield the listing entries that still need to be processed."""
+    for page in pages:
+        objects = [obj for obj in page if obj["Key"] not in processed]
+        if document_tracker is not None:
+            try:
+                with metrics.DOCUMENT_TRACKER_SECONDS.labels("filter_unprocessed").time():
+                    objects = document_tracker.filter_unprocessed(objects)
+            except Exception as e:
+                # Neither skip nor re-ingest the page; the next run checks it again
+                logger.error(f"Error checking {len(objects)} listed documents: {str(e)}")
+                metrics.INGESTED_DOCUMENTS.labels("failed").inc(len(objects))
+                if progress is not None:
+                    progress["failed"] = progress.get("failed", 0) + len(objects)
+                continue
+        skipped = len(page) - len(objects)
+        if skipped:
+            logger.info(f"Skipping {skipped} already processed documents")  # Log the skipped documents
+        yield from objects
+
+
+def _download_document(obj: dict) -> dict:
+    file_key = obj["Key"]
+    started = time.perf_counter()
+    file_obj = get_s3_client().get_object(Bucket=settings.S3_BUCKET, Key=file_key)
+    size = file_obj.get("ContentLength", obj.get("Size"))
+    content, stream = None, None
+    if size is not None and size >= settings.SPLIT_STREAMING_MIN_BYTES:
+        # Leave the body open; the consumer decodes it piece by piece
+        stream = iter_text(file_obj["Body"])
+    else:
+        data = file_obj["Body"].read()
+        metrics.FETCH_BYTES.inc(len(data))
+        content = data.decode("utf-8")
+    metrics.FETCH_SECONDS.labels("download").observe(time.perf_counter() - started)
+    logger.debug(f"Fetched document: {file_key}")
+    # Record the version that was actually read, which may be newer than the listing
+    last_modified = file_obj.get("LastModified", obj.get("LastModified"))
+    return {
+        "key": file_key,
+        "content": content,
+        "stream": stream,
+        "etag": file_obj.get("ETag", obj.get("ETag")),
+        "size": size,
+        "last_modified": last_modified.isoformat() if last_modified else None,
+        "previously_processed": obj.get("PreviouslyProcessed", False),
+    }  # Store key with content and the object version
+
+
+def iter_text(body, read_bytes: Optional[int] = None) -> Iterator[str]:
+    """
+    Decode a streaming S3 body as UTF-8, one read at a time.
+
+    Multi-byte characters cut by a read boundary are completed with the next read.
+
+    Args:
+        body: The `Body` of a `get_object` response.
+        read_bytes (Optional[int]): Bytes per read, defaults to SPLIT_STREAM_READ_BYTES.
+
+    Yields:
+        str: Consecutive pieces of the decoded text.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for data in body.iter_chunks(read_bytes or settings.SPLIT_STREAM_READ_BYTES):
+            metrics.FETCH_BYTES.inc(len(data))
+            text = decoder.decode(data)
+            if text:
+                yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+    finally:
+        body.close()
+
+
+def _completed_documents(
+    in_flight: dict, progress: Optional[Dict[str, int]] = None
+) -> Iterator[dict]:
+    """Wait for at least one download to finish and yield the finished documents."""
+    with metrics.INGEST_STAGE_WAIT_SECONDS.labels("fetch").time():
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+    for future in done:
+        file_key = in_flight.pop(future)
+        try:
+            yield future.result()
+        except Exception as e:
+            logger.error(f"Error fetching document {file_key}: {str(e)}")
+            metrics.INGESTED_DOCUMENTS.labels("failed").inc()
+            if progress is not None:
+                progress["failed"] = progress.get("failed", 0) + 1
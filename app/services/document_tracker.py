@@ -1,21 +1,134 @@
+import random
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
 from app.vector_store import VectorStore
 from app.utils.logger import logger
+from app.utils.retry import is_transient
+
+
+class BaseDocumentTracker(ABC):
+    """
+    Records which S3 objects have been ingested, together with the ETag, size and
+    last-modified time they had at the time, so changed objects can be re-ingested
+    and unchanged ones skipped.
+    """
+
+    @abstractmethod
+    def mark_as_processed(
+        self,
+        document_key: str,
+        etag: Optional[str] = None,
+        size: Optional[int] = None,
+        last_modified: Optional[str] = None,
+        chunk_hashes: Optional[List[str]] = None,
+    ):
+        """
+        Mark a document as processed.
+
+        `chunk_hashes` holds the content hash of every chunk, by chunk index, so a
+        later version of the document only needs its changed chunks re-embedded.
+        """
+
+    @abstractmethod
+    def get_records(self, document_keys: Iterable[str]) -> Dict[str, dict]:
+        """
+        Look up the records of many documents at once.
+
+        Returns:
+            Dict[str, dict]: `{"etag", "size", "last_modified"}` for each processed key.
+        """
+
+    @abstractmethod
+    def get_chunk_hashes(self, document_key: str) -> List[str]:
+        """Return the chunk hashes recorded for a document, empty if none were."""
+
+    @abstractmethod
+    def get_processed_documents(self) -> list:
+        """Get all processed document keys."""
+
+    @abstractmethod
+    def forget(self, document_keys: Iterable[str]):
+        """Drop the records of documents, so the next run over their prefix ingests them again."""
+
+    def is_processed(self, document_key: str) -> bool:
+        """Check if a document has been processed."""
+        return bool(self.are_processed([document_key]))
+
+    def are_processed(self, document_keys: Iterable[str]) -> Set[str]:
+        """Return the subset of keys that have been processed."""
+        return set(self.get_records(document_keys))
 
+    def filter_unprocessed(self, objects: List[dict]) -> List[dict]:
+        """
+        Keep the S3 listing entries that are new or changed since they were processed.
 
-class DocumentTracker:
-    def __init__(self, vector_store: VectorStore):
+        An object counts as changed when its ETag or size differs from the record.
+        Records without an ETag predate change tracking and are treated as unchanged.
+        Changed entries are flagged with `PreviouslyProcessed` so their chunk hashes
+        are only looked up for documents that have some.
+
+        Args:
+            objects (List[dict]): `list_objects_v2` entries with Key, ETag and Size.
+
+        Returns:
+            List[dict]: The entries that need to be (re-)ingested.
+        """
+        records = self.get_records([obj["Key"] for obj in objects])
+        unprocessed = []
+        for obj in objects:
+            record = records.get(obj["Key"])
+            if record is None:
+                unprocessed.append(obj)
+            elif record.get("etag") and (
+                record["etag"] != obj.get("ETag") or record.get("size") != obj.get("Size")
+            ):
+                logger.info(f"Document changed since it was processed: {obj['Key']}")
+                unprocessed.append({**obj, "PreviouslyProcessed": True})
+        return unprocessed
+
+
+class DocumentTracker(BaseDocumentTracker):
+    """Tracker that stores one placeholder vector per document in a Pinecone namespace."""
+
+    # Pinecone caps metadata at 40 KB per vector; longer hash lists are not stored
+    max_chunk_hashes = 1500
+
+    def __init__(
+        self, vector_store: VectorStore, fetch_batch_size: int = 100, max_retries: int = 3
+    ):
         self.vector_store = vector_store
         self.processed_namespace = "processed_docs"
+        self.fetch_batch_size = fetch_batch_size
+        self.max_retries = max_retries
 
-    def mark_as_processed(self, document_key: str):
+    def mark_as_processed(
+        self,
+        document_key: str,
+        etag: Optional[str] = None,
+        size: Optional[int] = None,
+        last_modified: Optional[str] = None,
+        chunk_hashes: Optional[List[str]] = None,
+    ):
         """Mark a document as processed in Pinecone."""
         try:
             # Ensure at least one non-zero value in the vector
-            placeholder_vector = [1.0] + [0.0] * (self.vector_store.dimension - 1)
+            placeholder_vector = np.zeros((1, self.vector_store.dimension), dtype=np.float32)
+            placeholder_vector[0, 0] = 1.0
+            metadata = {"processed": True, "type": "tracker"}
+            # Pinecone metadata cannot hold nulls
+            for name, value in (("etag", etag), ("size", size), ("last_modified", last_modified)):
+                if value is not None:
+                    metadata[name] = value
+            if chunk_hashes and len(chunk_hashes) <= self.max_chunk_hashes:
+                metadata["chunk_hashes"] = list(chunk_hashes)
             self.vector_store.upsert_embeddings(
                 ids=[document_key],
-                embeddings=[placeholder_vector],  # Updated placeholder vector
-                metadata=[{"processed": True, "type": "tracker"}],
+                embeddings=placeholder_vector,
+                metadata=[metadata],
                 namespace=self.processed_namespace,
             )
         except Exception as e:
@@ -24,27 +137,64 @@ class DocumentTracker:
             )
             raise  # Re-raise the exception after logging
 
-    def is_processed(self, document_key: str) -> bool:
-        """Check if a document has been processed."""
-        try:
-            results = self.vector_store.index.fetch(
-                [document_key], namespace=self.processed_namespace
-            )
-            return bool(results.get("vectors", {}))
-        except Exception as e:
-            logger.error(f"Error checking if document {document_key} is processed: {str(e)}")
-            return False  # Return False if an error occurs
+    def get_records(self, document_keys: Iterable[str]) -> Dict[str, dict]:
+        """
+        Fetch tracker vectors in batches and return their records.
+
+        Raises:
+            Exception: If a batch cannot be fetched, after retrying transient
+                errors; a partial answer would re-ingest the missing documents.
+        """
+        document_keys = list(document_keys)
+        records = {}
+        for start in range(0, len(document_keys), self.fetch_batch_size):
+            results = self._fetch(document_keys[start : start + self.fetch_batch_size])
+            for key, vector in results.items():
+                metadata = vector.get("metadata") or {}
+                records[key] = {
+                    "etag": metadata.get("etag"),
+                    "size": metadata.get("size"),
+                    "last_modified": metadata.get("last_modified"),
+                }
+        return records
+
+    def get_chunk_hashes(self, document_key: str) -> List[str]:
+        record = self._fetch([document_key]).get(document_key) or {}
+        return list((record.get("metadata") or {}).get("chunk_hashes") or [])
+
+    def _fetch(self, document_keys: List[str]) -> Dict[str, dict]:
+        """Fetch tracker vectors, retrying transient errors with backoff."""
+        for attempt in range(self.max_retries):
+            try:
+                return self.vector_store.fetch(document_keys, namespace=self.processed_namespace)
+            except Exception as e:
+                if not is_transient(e) or attempt == self.max_retries - 1:
+                    logger.error(f"Error fetching {len(document_keys)} tracker records: {str(e)}")
+                    raise
+                delay = min(30.0, 0.5 * 2**attempt) * random.uniform(0.5, 1.0)
+                logger.warning(
+                    f"Fetching tracker records failed on attempt {attempt + 1}, "
+                    f"retrying in {delay:.2f}s: {str(e)}"
+                )
+                time.sleep(delay)
 
     def get_processed_documents(self) -> list:
         """Get all processed document keys."""
         try:
-            results = self.vector_store.index.query(
-                vector=[0] * self.vector_store.dimension,
+            results = self.vector_store.query_embeddings(
+                vector=np.zeros(self.vector_store.dimension, dtype=np.float32),
                 namespace=self.processed_namespace,
                 top_k=10000,
-                include_metadata=True,
             )
             return [match.id for match in results.matches]
         except Exception as e:
             logger.error(f"Error retrieving processed documents: {str(e)}")
             return []  # Return an empty list if an error occurs
+
+    def forget(self, document_keys: Iterable[str]):
+        document_keys = list(document_keys)
+        for start in range(0, len(document_keys), self.fetch_batch_size):
+            self.vector_store.delete(
+                document_keys[start : start + self.fetch_batch_size],
+                namespace=self.processed_namespace,
+            )
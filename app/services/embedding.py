@@ -1,58 +1,367 @@
-from langchain_ollama import OllamaEmbeddings
-from langchain_openai import OpenAIEmbeddings
-from langchain_huggingface import HuggingFaceEmbeddings
 from app.config import settings
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.embedding_cache import EmbeddingCache
+from app.services.provider_scheduler import (
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    ProviderScheduler,
+)
+from app.utils import metrics
+from app.utils.retry import estimate_tokens
+from app.vector_reduction import VectorReducer, create_reducer, stored_dimension
+import asyncio
 import logging
+import threading
 import time
-from requests.exceptions import RequestException
-from typing import List
+import numpy as np
+from typing import Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
 
+def _create_provider(provider: str):
+    """Import and build a provider client. Imports are deferred so unused SDKs never load."""
+    if provider == "openai":
+        from langchain_openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(model=settings.OPENAI_EMBEDDING_MODEL)
+    if provider == "huggingface":
+        if settings.HF_INFERENCE_WORKERS > 0:
+            from app.services.hf_inference import HuggingFaceInferenceEngine
+
+            return HuggingFaceInferenceEngine(
+                model_name=settings.HUGGINGFACE_EMBEDDING_MODEL,
+                workers=settings.HF_INFERENCE_WORKERS,
+                threads_per_worker=settings.HF_INFERENCE_THREADS_PER_WORKER,
+                batch_size=settings.HF_INFERENCE_BATCH_SIZE,
+            )
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        return HuggingFaceEmbeddings(model_name=settings.HUGGINGFACE_EMBEDDING_MODEL)
+    if provider == "ollama":
+        from langchain_ollama import OllamaEmbeddings
+
+        return OllamaEmbeddings(
+            model=settings.OLLAMA_EMDEDDING_MODEL, base_url=settings.OLLAMA_BASE_URL
+        )
+    raise ValueError(f"Unknown embedding provider: {provider}")
+
+
 class EmbeddingService:
     def __init__(self):
-        self.openai_embed = OpenAIEmbeddings(model=settings.OPENAI_EMBEDDING_MODEL)
-        self.hf_embed = HuggingFaceEmbeddings(
-            model_name=settings.HUGGINGFACE_EMBEDDING_MODEL
-        )
-        self.ollama_embed = OllamaEmbeddings(
-            model=settings.OLLAMA_EMDEDDING_MODEL, base_url=settings.OLLAMA_BASE_URL
+        # Provider clients (and HuggingFace model weights) are created on first use
+        self._providers = {}
+        self._providers_lock = threading.Lock()
+        self._models = {
+            "openai": settings.OPENAI_EMBEDDING_MODEL,
+            "huggingface": settings.HUGGINGFACE_EMBEDDING_MODEL,
+            "ollama": settings.OLLAMA_EMDEDDING_MODEL,
+        }
+        self.cache: Optional[EmbeddingCache] = None
+        if settings.EMBEDDING_CACHE_ENABLED:
+            self.cache = EmbeddingCache(
+                max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+                path=settings.EMBEDDING_CACHE_PATH or None,
+                quantization=settings.EMBEDDING_CACHE_QUANTIZATION,
+            )
+        # Max batch size and max wait (ms) for coalescing concurrent requests
+        self._batch_limits = {
+            "openai": (settings.OPENAI_BATCH_MAX_SIZE, settings.OPENAI_BATCH_MAX_WAIT_MS),
+            "huggingface": (
+                settings.HUGGINGFACE_BATCH_MAX_SIZE,
+                settings.HUGGINGFACE_BATCH_MAX_WAIT_MS,
+            ),
+            "ollama": (settings.OLLAMA_BATCH_MAX_SIZE, settings.OLLAMA_BATCH_MAX_WAIT_MS),
+        }
+        self._batchers: Dict[str, EmbeddingBatcher] = {}
+        self._batchers_lock = threading.Lock()
+        # Requests and tokens per minute allowed by each provider, 0 for unlimited
+        self._rate_limits = {
+            "openai": (settings.OPENAI_REQUESTS_PER_MINUTE, settings.OPENAI_TOKENS_PER_MINUTE),
+            "huggingface": (
+                settings.HUGGINGFACE_REQUESTS_PER_MINUTE,
+                settings.HUGGINGFACE_TOKENS_PER_MINUTE,
+            ),
+            "ollama": (settings.OLLAMA_REQUESTS_PER_MINUTE, settings.OLLAMA_TOKENS_PER_MINUTE),
+        }
+        self._schedulers: Dict[str, ProviderScheduler] = {}
+        self._schedulers_lock = threading.Lock()
+        # Applied to every embedding returned, after the cache, which keeps full vectors
+        self.reducer: Optional[VectorReducer] = create_reducer()
+
+    @property
+    def openai_embed(self):
+        return self._get_provider("openai")
+
+    @property
+    def hf_embed(self):
+        return self._get_provider("huggingface")
+
+    @property
+    def ollama_embed(self):
+        return self._get_provider("ollama")
+
+    def warmup(self, providers: List[str]):
+        """
+        Create the given provider clients ahead of the first request.
+
+        Args:
+            providers (List[str]): Provider names, e.g. ["openai"].
+        """
+        for provider in providers:
+            started = time.perf_counter()
+            self._get_provider(provider)
+            logger.info(
+                f"Loaded {provider} embedding provider in {time.perf_counter() - started:.2f}s"
+            )
+
+    def close(self):
+        """Stop provider resources that own processes, such as the HuggingFace worker pool."""
+        for scheduler in list(self._schedulers.values()):
+            scheduler.close()
+        for provider in list(self._providers.values()):
+            if hasattr(provider, "close"):
+                provider.close()
+
+    def get_openai_embeddings(self, text: str) -> np.ndarray:
+        """
+        Embed a query text, as interactive traffic that is scheduled ahead of ingestion.
+
+        Raises:
+            EmbeddingUnavailableError: If the provider still fails after all retries.
+        """
+        if not text.strip():
+            logger.warning("Empty or whitespace-only text received for embedding.")
+            return self._zero_vector()
+        return self._cached_embed_query("openai", text)
+
+    def get_huggingface_embeddings(self, text: str) -> np.ndarray:
+        return self._cached_embed_query("huggingface", text)
+
+    def get_ollama_embeddings(self, text: str) -> np.ndarray:
+        return self._cached_embed_query("ollama", text)
+
+    def embed_documents(
+        self, texts: List[str], provider: str = "openai", priority: int = PRIORITY_BULK
+    ) -> np.ndarray:
+        """
+        Embed a batch of texts with a single provider call.
+
+        Empty or whitespace-only texts are not sent to the provider and come back
+        as zero vectors, so the output always lines up with the input. The call
+        goes through the provider's scheduler, which keeps it within the rate
+        limits and retries transient failures with jittered backoff. Provider
+        output is converted to float32 once, here, and stays a NumPy array through
+        the rest of the pipeline. With VECTOR_REDUCTION set, the vectors are
+        reduced to VECTOR_REDUCED_DIMENSION.
+
+        Args:
+            texts (List[str]): The texts to embed.
+            provider (str): One of "openai", "huggingface" or "ollama".
+            priority (int): PRIORITY_INTERACTIVE for requests a user waits on,
+                PRIORITY_BULK (the default) for ingestion.
+
+        Returns:
+            np.ndarray: A (len(texts), stored dimension) float32 array, in input order.
+
+        Raises:
+            ValueError: If the provider is unknown or returns the wrong number of embeddings.
+            EmbeddingUnavailableError: If the provider still fails after all retries.
+        """
+        if provider not in self._models:
+            raise ValueError(f"Unknown embedding provider: {provider}")
+        cached, positions = self._lookup_cached(provider, texts)
+        results = None
+        if positions:
+            batch = self._provider_batch(provider, texts, positions)
+            results = self._scheduler(provider).run(batch, priority)
+        return self._reduce(self._combine(provider, texts, cached, positions, results))
+
+    async def aembed_documents(
+        self, texts: List[str], provider: str = "openai", priority: int = PRIORITY_BULK
+    ) -> np.ndarray:
+        """
+        Async `embed_documents`: the provider call is awaited instead of holding a
+        thread while it runs. Calls still go through the provider's scheduler, so
+        sync and async callers share its rate limits and concurrency.
+        """
+        if provider not in self._models:
+            raise ValueError(f"Unknown embedding provider: {provider}")
+        cached, positions = await self._off_loop(self._lookup_cached, provider, texts)
+        results = None
+        if positions:
+            batch = self._provider_batch(provider, texts, positions)
+            results = await asyncio.wrap_future(self._scheduler(provider).submit(batch, priority))
+        embeddings = await self._off_loop(
+            self._combine, provider, texts, cached, positions, results
         )
+        return self._reduce(embeddings)
+
+    async def aembed_query(self, text: str, provider: str = "openai") -> np.ndarray:
+        """
+        Async `get_openai_embeddings` for any provider, through the same cache and
+        micro-batcher.
 
-    def get_openai_embeddings(self, text: str) -> List[float]:
+        Raises:
+            EmbeddingUnavailableError: If the provider still fails after all retries.
+        """
         if not text.strip():
             logger.warning("Empty or whitespace-only text received for embedding.")
             return self._zero_vector()
+        if self.cache is not None:
+            cached = await self._off_loop(self.cache.get, self._cache_key(provider, text))
+            if cached is not None:
+                return self._reduce(cached)
+        batcher = self._batcher(provider)
+        if batcher is not None:
+            return await batcher.aembed(text)
+        embeddings = await self.aembed_documents([text], provider, priority=PRIORITY_INTERACTIVE)
+        return embeddings[0]
+
+    def cache_stats(self) -> Dict[str, int]:
+        """
+        Report the embedding cache counters.
+
+        Returns:
+            Dict[str, int]: Hit, miss and eviction counters, empty if caching is disabled.
+        """
+        return self.cache.stats() if self.cache is not None else {}
 
-        retries = 3
-        for attempt in range(retries):
-            try:
-                embedding = self.openai_embed.embed_query(text)
-                if not embedding:
-                    logger.warning("Received empty embedding from OpenAI.")
-                    return self._zero_vector()
-                return embedding
-            except RequestException as e:
-                logger.error(f"RequestException on attempt {attempt + 1}: {str(e)}")
-                time.sleep(2**attempt)  # Exponential backoff
-            except Exception as e:
-                logger.error(f"Unexpected error generating OpenAI embeddings: {str(e)}")
-                break
-        logger.error("Failed to generate valid embeddings after multiple attempts.")
-        return self._zero_vector()
-
-    def get_huggingface_embeddings(self, text: str) -> list:
-        return self.hf_embed.embed_query(text)
-
-    def get_ollama_embeddings(self, text: str) -> list:
-        return self.ollama_embed.embed_query(text)
-
-    def _zero_vector(self) -> List[float]:
-        """
-        Generate a zero vector based on the expected embedding dimension.
+    def _cached_embed_query(self, provider: str, text: str) -> np.ndarray:
+        cache_key = self._cache_key(provider, text)
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return self._reduce(cached)
+        batcher = self._batcher(provider)
+        if batcher is not None:
+            return batcher.embed(text)
+        return self.embed_documents([text], provider, priority=PRIORITY_INTERACTIVE)[0]
+
+    async def _off_loop(self, function, *args):
+        """
+        Run a cache-touching call on a worker thread when the cache has a SQLite
+        tier, so disk reads and commits never block the event loop. Memory-only
+        lookups are cheap enough to run inline.
+        """
+        if self.cache is not None and self.cache.persistent:
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+    def _lookup_cached(
+        self, provider: str, texts: List[str]
+    ) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """Split non-empty texts into cached vectors by position and positions to embed."""
+        positions = [i for i, text in enumerate(texts) if text.strip()]
+        if self.cache is None or not positions:
+            return {}, positions
+        keys = {i: self._cache_key(provider, texts[i]) for i in positions}
+        found = self.cache.get_many(set(keys.values()))
+        cached = {i: found[keys[i]] for i in positions if keys[i] in found}
+        positions = [i for i in positions if i not in cached]
+        metrics.EMBEDDING_CACHE_LOOKUPS.labels(provider, "hit").inc(len(cached))
+        metrics.EMBEDDING_CACHE_LOOKUPS.labels(provider, "miss").inc(len(positions))
+        return cached, positions
+
+    def _provider_batch(self, provider: str, texts: List[str], positions: List[int]) -> List[str]:
+        batch = [texts[i] for i in positions]
+        metrics.EMBEDDING_BATCH_SIZE.labels(provider).observe(len(batch))
+        metrics.EMBEDDING_TOKENS.labels(provider).inc(sum(estimate_tokens(text) for text in batch))
+        return batch
+
+    def _combine(
+        self,
+        provider: str,
+        texts: List[str],
+        cached: Dict[int, np.ndarray],
+        positions: List[int],
+        results: Optional[list],
+    ) -> np.ndarray:
+        """Assemble provider results and cached vectors in input order, caching the new ones."""
+        if results is None:
+            dimension = len(next(iter(cached.values()))) if cached else settings.VECTOR_DIMENSION
+            embeddings = np.zeros((len(texts), dimension), dtype=np.float32)
+        else:
+            results = np.asarray(results, dtype=np.float32)
+            embeddings = np.zeros((len(texts), results.shape[1]), dtype=np.float32)
+            embeddings[positions] = results
+            if self.cache is not None:
+                self.cache.put_many(
+                    (self._cache_key(provider, texts[position]), results[row])
+                    for row, position in enumerate(positions)
+                    if results[row].any()
+                )
+        for i, vector in cached.items():
+            embeddings[i] = vector
+        return embeddings
+
+    def _get_provider(self, provider: str):
+        if provider not in self._providers:
+            with self._providers_lock:
+                if provider not in self._providers:
+                    self._providers[provider] = _create_provider(provider)
+        return self._providers[provider]
+
+    def _batcher(self, provider: str) -> Optional[EmbeddingBatcher]:
+        """
+        Return the request-coalescing batcher of a provider, creating it on first use.
+
+        Batched requests go through `embed_documents` as interactive traffic, so
+        they share its cache, scheduling and empty-text handling.
+        """
+        if not settings.EMBEDDING_MICRO_BATCHING:
+            return None
+        with self._batchers_lock:
+            if provider not in self._batchers:
+                max_batch_size, max_wait_ms = self._batch_limits[provider]
+                self._batchers[provider] = EmbeddingBatcher(
+                    lambda texts: self.embed_documents(
+                        texts, provider, priority=PRIORITY_INTERACTIVE
+                    ),
+                    max_batch_size=max_batch_size,
+                    max_wait_ms=max_wait_ms,
+                    max_concurrency=settings.EMBEDDING_BATCHER_MAX_CONCURRENCY,
+                    name=provider,
+                )
+            return self._batchers[provider]
+
+    def _scheduler(self, provider: str) -> ProviderScheduler:
+        """Return the rate-limiting scheduler of a provider, creating it on first use."""
+        with self._schedulers_lock:
+            if provider not in self._schedulers:
+                requests_per_minute, tokens_per_minute = self._rate_limits[provider]
+                self._schedulers[provider] = ProviderScheduler(
+                    provider,
+                    lambda batch: self._call_provider(provider, batch),
+                    requests_per_minute=requests_per_minute,
+                    tokens_per_minute=tokens_per_minute,
+                    initial_concurrency=settings.EMBEDDING_INITIAL_CONCURRENCY,
+                    max_concurrency=settings.EMBEDDING_MAX_CONCURRENCY,
+                    max_attempts=settings.EMBEDDING_MAX_RETRIES,
+                    target_latency_seconds=settings.EMBEDDING_TARGET_LATENCY_SECONDS,
+                    backoff_max_seconds=settings.EMBEDDING_BACKOFF_MAX_SECONDS,
+                )
+            return self._schedulers[provider]
+
+    def _call_provider(self, provider: str, batch: List[str]) -> list:
+        results = self._get_provider(provider).embed_documents(batch)
+        if len(results) != len(batch):
+            raise ValueError(
+                f"Expected {len(batch)} embeddings from {provider}, got {len(results)}"
+            )
+        return results
+
+    def _reduce(self, embeddings: np.ndarray) -> np.ndarray:
+        return embeddings if self.reducer is None else self.reducer.reduce(embeddings)
+
+    def _cache_key(self, provider: str, text: str) -> str:
+        return EmbeddingCache.make_key(provider, self._models[provider], text)
+
+    def _zero_vector(self) -> np.ndarray:
+        """
+        Generate a zero vector of the stored dimension.
 
         Returns:
-            List[float]: A zero vector.
+            np.ndarray: A float32 zero vector.
         """
-        return [0.0] * settings.VECTOR_DIMENSION
+        return np.zeros(stored_dimension(), dtype=np.float32)
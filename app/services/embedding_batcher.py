@@ -0,0 +1,93 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List
+
+import numpy as np
+
+from app.utils.logger import logger
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-text embedding requests into batched provider calls.
+
+    Callers block in `embed` while a collector thread gathers requests until
+    `max_batch_size` texts are waiting or `max_wait_ms` has passed since the first
+    one arrived. The batch is then embedded with one call and each caller gets its
+    own vector back. Up to `max_concurrency` batches can be in flight at once.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        max_concurrency: int = 4,
+        name: str = "embedding",
+    ):
+        self.embed_batch = embed_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._requests: "queue.Queue" = queue.Queue()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix=f"{name}-batch"
+        )
+        threading.Thread(
+            target=self._collect, name=f"{name}-batcher", daemon=True
+        ).start()
+
+    def embed(self, text: str) -> np.ndarray:
+        """
+        Embed one text as part of the next batch.
+
+        Args:
+            text (str): The text to embed.
+
+        Returns:
+            np.ndarray: The float32 embedding of the text.
+
+        Raises:
+            Exception: The error raised by the batched provider call.
+        """
+        future: Future = Future()
+        self._requests.put((text, future))
+        return future.result()
+
+    async def aembed(self, text: str) -> np.ndarray:
+        """Like `embed`, but awaits the batch instead of blocking the calling thread."""
+        future: Future = Future()
+        self._requests.put((text, future))
+        return await asyncio.wrap_future(future)
+
+    def _collect(self):
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[tuple]):
+        # Identical texts in one batch are embedded once
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        logger.debug(
+            f"{self.name} batcher sending {len(texts)} texts for {len(batch)} requests"
+        )
+        try:
+            embeddings = dict(zip(texts, self.embed_batch(texts)))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for text, future in batch:
+            future.set_result(embeddings[text])
@@ -0,0 +1,174 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from app.utils.logger import logger
+from app.utils.vectors import QUANTIZATION_MODES, dequantize, quantize
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache with an in-memory LRU tier and an optional
+    SQLite tier that survives restarts.
+
+    Keys are derived from the provider, the model and a hash of the
+    whitespace-normalized text, so identical chunks share one entry no matter which
+    document or request they came from. Vectors are stored as float32, or as
+    float16 / int8 codes when `quantization` is set, in both tiers.
+    """
+
+    def __init__(
+        self, max_entries: int = 10000, path: Optional[str] = None, quantization: str = "none"
+    ):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {quantization}")
+        self.max_entries = max_entries
+        self.quantization = quantization
+        # Each entry holds (codes, scale) as produced by `quantize`
+        self._memory: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._db = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Bulk ingestion workers share the file; wait for each other's writes
+            self._db = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            # Caches written before quantization support hold plain float32 blobs
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(embeddings)")}
+            if "dtype" not in columns:
+                self._db.execute(
+                    "ALTER TABLE embeddings ADD COLUMN dtype TEXT NOT NULL DEFAULT 'float32'"
+                )
+                self._db.execute(
+                    "ALTER TABLE embeddings ADD COLUMN scale REAL NOT NULL DEFAULT 1.0"
+                )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(provider: str, model: str, text: str) -> str:
+        """
+        Build the cache key for a text embedded by a given provider and model.
+
+        Args:
+            provider (str): The embedding provider name.
+            model (str): The embedding model name.
+            text (str): The text being embedded.
+
+        Returns:
+            str: A hex digest identifying the (provider, model, text) triple.
+        """
+        normalized = " ".join(text.split())
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return f"{provider}:{model}:{digest}"
+
+    @property
+    def persistent(self) -> bool:
+        """Whether lookups and writes may touch the SQLite tier."""
+        return self._db is not None
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for a key, or None on a miss."""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Look up many keys at once, consulting the disk tier only for memory misses.
+
+        Args:
+            keys (Iterable[str]): The cache keys to look up.
+
+        Returns:
+            Dict[str, np.ndarray]: The float32 embeddings found, by key.
+        """
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._decode(*self._memory[key])
+                    self._stats["memory_hits"] += 1
+                else:
+                    missing.append(key)
+
+            if missing and self._db is not None:
+                for start in range(0, len(missing), 500):
+                    batch = missing[start : start + 500]
+                    rows = self._db.execute(
+                        "SELECT key, vector, dtype, scale FROM embeddings "
+                        f"WHERE key IN ({','.join('?' * len(batch))})",
+                        batch,
+                    ).fetchall()
+                    for key, blob, dtype, scale in rows:
+                        codes = np.frombuffer(blob, dtype=dtype)
+                        found[key] = self._decode(codes, scale)
+                        self._remember(key, codes, scale)
+                        self._stats["disk_hits"] += 1
+
+            self._stats["misses"] += sum(1 for key in missing if key not in found)
+        return found
+
+    def put(self, key: str, embedding):
+        """Store an embedding in both tiers."""
+        self.put_many([(key, embedding)])
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]):
+        """
+        Store many embeddings in both tiers.
+
+        Args:
+            items (Iterable[Tuple[str, np.ndarray]]): Key and embedding pairs.
+        """
+        items = list(items)
+        if not items:
+            return
+        keys = [key for key, _ in items]
+        codes, scales = quantize(
+            np.stack([np.asarray(embedding, dtype=np.float32) for _, embedding in items]),
+            self.quantization,
+        )
+        with self._lock:
+            for key, row, scale in zip(keys, codes, scales):
+                self._remember(key, row, float(scale))
+            if self._db is not None:
+                try:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, vector, dtype, scale) "
+                        "VALUES (?, ?, ?, ?)",
+                        [
+                            (key, row.tobytes(), row.dtype.name, float(scale))
+                            for key, row, scale in zip(keys, codes, scales)
+                        ],
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Error writing embeddings to the disk cache: {str(e)}")
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, miss and eviction counters plus the current memory tier size."""
+        with self._lock:
+            return {**self._stats, "memory_entries": len(self._memory)}
+
+    @staticmethod
+    def _decode(codes: np.ndarray, scale: float) -> np.ndarray:
+        # Copy so callers never share a buffer with the cache
+        return dequantize(codes.reshape(1, -1), np.float32([scale]))[0].copy()
+
+    def _remember(self, key: str, codes: np.ndarray, scale: float):
+        # Caller holds the lock
+        self._memory[key] = (codes.copy(), scale)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import List
+
+import numpy as np
+
+from app.utils.logger import logger
+
+# Model loaded once per worker process by _init_worker
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int):
+    """Pin the worker's intra-op threads and load the model once per process."""
+    global _worker_model
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from sentence_transformers import SentenceTransformer
+
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+
+def _worker_dimension() -> int:
+    return int(_worker_model.get_sentence_embedding_dimension())
+
+
+def _encode_into(shm_name: str, count: int, dimension: int, rows: List[int], texts: List[str]) -> int:
+    """Encode a batch and write its float32 vectors into the given rows of shared memory."""
+    # Workers share the parent's resource tracker, which unlinks the block only
+    # when the parent does
+    shm = SharedMemory(name=shm_name)
+    try:
+        output = np.ndarray((count, dimension), dtype=np.float32, buffer=shm.buf)
+        output[rows] = _worker_model.encode(
+            texts, batch_size=len(texts), convert_to_numpy=True
+        ).astype(np.float32, copy=False)
+        del output
+    finally:
+        shm.close()
+    return len(rows)
+
+
+class HuggingFaceInferenceEngine:
+    """
+    Runs a sentence-transformers model in a pool of CPU worker processes.
+
+    Inputs are sorted by length and cut into batches of similar length to reduce
+    padding. Batches are spread over the workers, which write float32 vectors
+    straight into a shared-memory block instead of pickling them back. Exposes
+    the `embed_documents`/`embed_query` interface of LangChain embeddings, so it
+    can stand in for `HuggingFaceEmbeddings`.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        workers: int = 2,
+        threads_per_worker: int = 1,
+        batch_size: int = 32,
+    ):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, threads_per_worker),
+        )
+        self.dimension = self._pool.submit(_worker_dimension).result()
+        logger.info(
+            f"Started {workers} HuggingFace inference workers for {model_name} "
+            f"({threads_per_worker} threads each, dimension {self.dimension})"
+        )
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed many texts across the worker pool.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            np.ndarray: A (len(texts), dimension) float32 array, in input order.
+        """
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [order[i : i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+
+        shm = SharedMemory(create=True, size=len(texts) * self.dimension * 4)
+        try:
+            futures = [
+                self._pool.submit(
+                    _encode_into,
+                    shm.name,
+                    len(texts),
+                    self.dimension,
+                    rows,
+                    [texts[i] for i in rows],
+                )
+                for rows in batches
+            ]
+            for future in futures:
+                future.result()
+            output = np.ndarray(
+                (len(texts), self.dimension), dtype=np.float32, buffer=shm.buf
+            ).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+        return output
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed_documents([text])[0]
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,189 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from app.document_processor import DocumentProcessor
+from app.utils.logger import logger
+
+
+class IngestionJob:
+    """State and live statistics of one background `/embed-bucket` run."""
+
+    def __init__(self, prefix: str):
+        self.id = uuid.uuid4().hex
+        self.prefix = prefix
+        self.status = "queued"
+        self.stats = {
+            "queued": 0,
+            "processed": 0,
+            "skipped": 0,
+            "failed": 0,
+            "chunks": 0,
+            "reused": 0,
+            "deduplicated": 0,
+        }
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+        self.future: Optional[Future] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def to_dict(self) -> dict:
+        """
+        Summarize the job for API responses.
+
+        Throughput is measured since the job started. The ETA is an estimate based
+        on the keys listed so far, so it grows while the listing is still running.
+
+        Returns:
+            dict: Job status, statistics, throughput and ETA.
+        """
+        stats = dict(self.stats)
+        elapsed = None
+        docs_per_second = chunks_per_second = eta_seconds = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            if elapsed > 0:
+                docs_per_second = stats["processed"] / elapsed
+                chunks_per_second = stats["chunks"] / elapsed
+            if not self.is_finished and docs_per_second:
+                remaining = max(stats["queued"] - stats["processed"] - stats["failed"], 0)
+                eta_seconds = round(remaining / docs_per_second, 1)
+
+        return {
+            "job_id": self.id,
+            "prefix": self.prefix,
+            "status": self.status,
+            "stats": stats,
+            "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+            "docs_per_second": round(docs_per_second, 3) if docs_per_second is not None else None,
+            "chunks_per_second": round(chunks_per_second, 3) if chunks_per_second is not None else None,
+            "eta_seconds": eta_seconds,
+            "error": self.error,
+            "created_at": _isoformat(self.created_at),
+            "started_at": _isoformat(self.started_at),
+            "finished_at": _isoformat(self.finished_at),
+        }
+
+
+class IngestionJobManager:
+    """
+    Runs `DocumentProcessor.process_documents` calls on a background executor and
+    keeps a bounded history of recent jobs.
+    """
+
+    def __init__(
+        self,
+        document_processor: DocumentProcessor,
+        max_concurrent_jobs: int = 2,
+        max_history: int = 100,
+    ):
+        self.document_processor = document_processor
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_jobs, thread_name_prefix="ingestion-job"
+        )
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, prefix: str = "") -> IngestionJob:
+        """
+        Queue a new ingestion job for a prefix.
+
+        Args:
+            prefix (str): Only process keys starting with this prefix.
+
+        Returns:
+            IngestionJob: The queued job.
+        """
+        job = IngestionJob(prefix)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        job.future = self._executor.submit(self._run, job)
+        logger.info(f"Queued ingestion job {job.id} for prefix '{prefix}'")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, limit: int = 20) -> List[IngestionJob]:
+        """Return the most recent jobs, newest first."""
+        with self._lock:
+            return list(reversed(self._jobs.values()))[:limit]
+
+    def cancel(self, job_id: str) -> Optional[IngestionJob]:
+        """
+        Cancel a queued or running job.
+
+        A queued job is cancelled right away. A running job stops before its next
+        document, and documents that were not fully written stay unprocessed.
+
+        Args:
+            job_id (str): The job to cancel.
+
+        Returns:
+            Optional[IngestionJob]: The job, or None if it does not exist.
+        """
+        job = self.get(job_id)
+        if job is None or job.is_finished:
+            return job
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.status = "cancelled"
+            job.finished_at = time.time()
+        else:
+            job.status = "cancelling"
+        logger.info(f"Cancellation requested for ingestion job {job.id}")
+        return job
+
+    def shutdown(self):
+        """Cancel all unfinished jobs and wait for running ones to stop."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            self.cancel(job.id)
+        self._executor.shutdown(wait=True)
+
+    def _run(self, job: IngestionJob):
+        if job.cancel_event.is_set():
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            self.document_processor.process_documents(
+                job.prefix, stats=job.stats, cancel_event=job.cancel_event
+            )
+            job.status = "cancelled" if job.cancel_event.is_set() else "succeeded"
+        except Exception as e:
+            logger.error(f"Ingestion job {job.id} failed: {str(e)}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+        logger.info(f"Ingestion job {job.id} {job.status}: {job.stats}")
+
+    def _prune(self):
+        # Caller holds the lock; drop the oldest finished jobs beyond the history limit
+        excess = len(self._jobs) - self.max_history
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.is_finished]:
+            if excess <= 0:
+                break
+            del self._jobs[job_id]
+            excess -= 1
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
@@ -0,0 +1,146 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from app.services.document_tracker import BaseDocumentTracker
+from app.utils.logger import logger
+
+# SQLite caps the number of bound parameters per statement
+_LOOKUP_BATCH_SIZE = 500
+# Filesystems whose contents are lost when the container or host restarts
+_EPHEMERAL_FILESYSTEMS = {"tmpfs", "ramfs", "overlay", "aufs"}
+
+
+class ManifestDocumentTracker(BaseDocumentTracker):
+    """
+    Tracker backed by a local SQLite manifest keyed by document key.
+
+    Lookups are primary-key reads, a whole S3 listing page is checked with a
+    handful of queries, and nothing is written to the vector index. Chunk hashes
+    live in a separate `chunks` table keyed by document and chunk index.
+    """
+
+    def __init__(self, path: str, allow_ephemeral: bool = False):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        filesystem = filesystem_type(path)
+        if filesystem in _EPHEMERAL_FILESYSTEMS and not allow_ephemeral:
+            # A lost manifest means re-embedding the whole bucket on the next run
+            raise ValueError(
+                f"Document manifest {path} is on a {filesystem} filesystem, which does not "
+                "survive a restart. Point DOCUMENT_MANIFEST_PATH at a persistent volume, use "
+                "DOCUMENT_TRACKER_BACKEND=vector_store, or set "
+                "DOCUMENT_MANIFEST_ALLOW_EPHEMERAL=true."
+            )
+        self._lock = threading.Lock()
+        # Bulk-ingest worker processes share the manifest; wait out their write locks
+        self._db = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                key TEXT PRIMARY KEY,
+                etag TEXT,
+                size INTEGER,
+                last_modified TEXT,
+                processed_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                key TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (key, chunk_index)
+            ) WITHOUT ROWID
+            """
+        )
+        self._db.commit()
+
+    def mark_as_processed(
+        self,
+        document_key: str,
+        etag: Optional[str] = None,
+        size: Optional[int] = None,
+        last_modified: Optional[str] = None,
+        chunk_hashes: Optional[List[str]] = None,
+    ):
+        """Record a document, the object version that was processed and its chunk hashes."""
+        try:
+            # The connection context commits both tables together or rolls back
+            with self._lock, self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO documents (key, etag, size, last_modified, processed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (document_key, etag, size, last_modified, time.time()),
+                )
+                if chunk_hashes is not None:
+                    self._db.execute("DELETE FROM chunks WHERE key = ?", (document_key,))
+                    self._db.executemany(
+                        "INSERT INTO chunks (key, chunk_index, hash) VALUES (?, ?, ?)",
+                        [(document_key, i, value) for i, value in enumerate(chunk_hashes)],
+                    )
+        except sqlite3.Error as e:
+            logger.error(
+                f"Error marking document {document_key} as processed: {str(e)}"
+            )
+            raise  # Re-raise the exception after logging
+
+    def get_records(self, document_keys: Iterable[str]) -> Dict[str, dict]:
+        document_keys = list(document_keys)
+        records = {}
+        with self._lock:
+            for start in range(0, len(document_keys), _LOOKUP_BATCH_SIZE):
+                batch = document_keys[start : start + _LOOKUP_BATCH_SIZE]
+                rows = self._db.execute(
+                    f"SELECT key, etag, size, last_modified FROM documents "
+                    f"WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, etag, size, last_modified in rows:
+                    records[key] = {
+                        "etag": etag,
+                        "size": size,
+                        "last_modified": last_modified,
+                    }
+        return records
+
+    def get_chunk_hashes(self, document_key: str) -> List[str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT hash FROM chunks WHERE key = ? ORDER BY chunk_index", (document_key,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_processed_documents(self) -> list:
+        """Get all processed document keys."""
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT key FROM documents")]
+
+    def forget(self, document_keys: Iterable[str]):
+        rows = [(key,) for key in document_keys]
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM documents WHERE key = ?", rows)
+            self._db.executemany("DELETE FROM chunks WHERE key = ?", rows)
+
+
+def filesystem_type(path: str) -> Optional[str]:
+    """Type of the filesystem holding `path`, from /proc/mounts, or None without /proc."""
+    try:
+        with open("/proc/mounts", "r", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) > 2]
+    except OSError:
+        return None
+    directory = os.path.realpath(os.path.dirname(os.path.abspath(path)))
+    best, best_type = "", None
+    for mount_point, mount_type in mounts:
+        # The longest mount point containing the directory is the one it lives on
+        inside = directory == mount_point or directory.startswith(mount_point.rstrip("/") + "/")
+        if inside and len(mount_point) >= len(best):
+            best, best_type = mount_point, mount_type
+    return best_type
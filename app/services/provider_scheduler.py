@@ -0,0 +1,282 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from app.utils import metrics
+from app.utils.logger import logger
+from app.utils.retry import error_status, estimate_tokens, is_transient
+
+# Lower values are dispatched first
+PRIORITY_INTERACTIVE = 0  # /search and /embed-file requests
+PRIORITY_BULK = 1  # Ingestion
+
+
+class EmbeddingUnavailableError(RuntimeError):
+    """Raised when a provider call still fails after all retries."""
+
+
+class TokenBucket:
+    """
+    Budget of `per_minute` units refilled continuously, holding at most one
+    minute's worth. A budget of 0 means unlimited.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def delay(self, amount: float, reserve: float = 0.0) -> float:
+        """
+        Seconds until `amount` can be taken while leaving `reserve` of the capacity
+        (a fraction) untouched, 0 if it can be taken now. Requests larger than the
+        capacity only wait for a full bucket.
+        """
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        needed = min(amount, self.capacity) + reserve * self.capacity
+        needed = min(needed, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        if not self.unlimited:
+            self._refill()
+            self.tokens -= amount  # May go negative for oversized requests
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class _Job:
+    def __init__(self, texts: List[str], priority: int, tokens: int):
+        self.texts = texts
+        self.priority = priority
+        self.tokens = tokens
+        self.attempts = 0
+        self.future: Future = Future()
+
+
+class ProviderScheduler:
+    """
+    Schedules calls to one embedding provider within its rate limits.
+
+    - Requests-per-minute and tokens-per-minute budgets are tracked with token
+      buckets, so calls are held back before the provider has to reject them.
+    - Concurrency adapts AIMD-style: it grows by about one slot per round of
+      successful calls and is halved on a rate-limit response, or cut by 10% when
+      calls get slower than the target latency.
+    - Failed calls are re-queued with exponentially growing, jittered
+      backoff (or the provider's Retry-After), so they hold no worker or
+      concurrency slot while waiting.
+    - Interactive calls are dispatched before bulk ones. Bulk calls also leave one
+      concurrency slot and part of each budget for interactive calls.
+
+    Callers get a Future from `submit`, or block on `run`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        call: Callable[[List[str]], list],
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        initial_concurrency: int = 4,
+        min_concurrency: int = 1,
+        max_concurrency: int = 16,
+        max_attempts: int = 3,
+        target_latency_seconds: float = 30.0,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 60.0,
+        interactive_reserve: float = 0.1,
+    ):
+        self.name = name
+        self.call = call
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.limit = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self.max_attempts = max(1, max_attempts)
+        self.target_latency = target_latency_seconds
+        self.backoff_base = backoff_base_seconds
+        self.backoff_max = backoff_max_seconds
+        self.interactive_reserve = interactive_reserve
+        self.in_flight = 0
+        self._ready: list = []  # (priority, sequence, job)
+        self._delayed: list = []  # (not_before, sequence, job)
+        self._sequence = itertools.count()
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix=f"{name}-provider"
+        )
+        self._closed = False
+        threading.Thread(target=self._dispatch_loop, name=f"{name}-scheduler", daemon=True).start()
+
+    def submit(self, texts: List[str], priority: int = PRIORITY_BULK) -> Future:
+        """
+        Queue a provider call.
+
+        Args:
+            texts (List[str]): The texts to embed in one call.
+            priority (int): PRIORITY_INTERACTIVE or PRIORITY_BULK.
+
+        Returns:
+            Future: Resolves to the provider result, or to EmbeddingUnavailableError
+                once all attempts failed. Errors that are not worth retrying are
+                passed through as they are.
+        """
+        job = _Job(texts, priority, sum(estimate_tokens(text) for text in texts))
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f"The {self.name} scheduler is closed")
+            heapq.heappush(self._ready, (priority, next(self._sequence), job))
+            self._condition.notify()
+        return job.future
+
+    def run(self, texts: List[str], priority: int = PRIORITY_BULK) -> list:
+        """Queue a provider call and wait for its result."""
+        return self.submit(texts, priority).result()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            jobs = [job for _, _, job in self._ready + self._delayed]
+            self._ready, self._delayed = [], []
+            self._condition.notify()
+        for job in jobs:
+            job.future.set_exception(RuntimeError(f"The {self.name} scheduler is closed"))
+        self._executor.shutdown(wait=False)
+
+    def _dispatch_loop(self):
+        with self._condition:
+            while not self._closed:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, sequence, job = heapq.heappop(self._delayed)
+                    heapq.heappush(self._ready, (job.priority, sequence, job))
+
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                if self._ready:
+                    job = self._ready[0][2]
+                    wait = self._admission_delay(job)
+                    if wait == 0.0:
+                        heapq.heappop(self._ready)
+                        self.requests.take(1)
+                        self.tokens.take(job.tokens)
+                        self.in_flight += 1
+                        try:
+                            self._executor.submit(self._execute, job)
+                        except RuntimeError as e:
+                            # The interpreter is shutting down; fail the job rather than this thread
+                            self.in_flight -= 1
+                            job.future.set_exception(e)
+                        continue
+                    if wait is not None:
+                        timeout = wait if timeout is None else min(timeout, wait)
+                self._condition.wait(timeout)
+
+    def _admission_delay(self, job: _Job) -> Optional[float]:
+        """
+        Seconds until the job may start, 0 if it can start now, or None if it waits
+        for a concurrency slot to free up. Caller holds the condition.
+        """
+        bulk = job.priority != PRIORITY_INTERACTIVE
+        limit = int(self.limit)
+        if bulk and limit > 1:
+            limit -= 1  # Keep a slot for interactive calls
+        if self.in_flight >= limit:
+            return None
+        reserve = self.interactive_reserve if bulk else 0.0
+        return max(self.requests.delay(1, reserve), self.tokens.delay(job.tokens, reserve))
+
+    def _execute(self, job: _Job):
+        job.attempts += 1
+        started = time.perf_counter()
+        try:
+            result = self.call(job.texts)
+        except Exception as e:
+            latency = time.perf_counter() - started
+            metrics.EMBEDDING_REQUEST_SECONDS.labels(self.name).observe(latency)
+            self._on_failure(job, e)
+            return
+        latency = time.perf_counter() - started
+        metrics.EMBEDDING_REQUEST_SECONDS.labels(self.name).observe(latency)
+        with self._condition:
+            self.in_flight -= 1
+            if latency > self.target_latency:
+                self._decrease(0.9)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+                metrics.EMBEDDING_CONCURRENCY_LIMIT.labels(self.name).set(self.limit)
+            self._condition.notify()
+        job.future.set_result(result)
+
+    def _on_failure(self, job: _Job, error: Exception):
+        rate_limited = error_status(error) == 429 or "RateLimit" in type(error).__name__
+        retry = is_transient(error) and job.attempts < self.max_attempts
+        with self._condition:
+            self.in_flight -= 1
+            if rate_limited:
+                self._decrease(0.5)
+            if retry:
+                delay = _retry_after(error)
+                if delay is None:
+                    cap = min(self.backoff_max, self.backoff_base * 2 ** (job.attempts - 1))
+                    delay = random.uniform(cap / 2, cap)
+                heapq.heappush(
+                    self._delayed, (time.monotonic() + delay, next(self._sequence), job)
+                )
+            self._condition.notify()
+
+        if retry:
+            metrics.EMBEDDING_RETRIES.labels(self.name).inc()
+            logger.warning(
+                f"{self.name} call of {len(job.texts)} texts failed on attempt {job.attempts}, "
+                f"retrying in {delay:.2f}s: {str(error)}"
+            )
+            return
+        metrics.EMBEDDING_ERRORS.labels(self.name).inc()
+        logger.error(
+            f"{self.name} call of {len(job.texts)} texts failed after {job.attempts} "
+            f"attempts: {str(error)}"
+        )
+        if is_transient(error):
+            error = EmbeddingUnavailableError(
+                f"{self.name} embedding failed after {job.attempts} attempts: {str(error)}"
+            )
+        job.future.set_exception(error)
+
+    def _decrease(self, factor: float):
+        # At most once per second, so one burst of failures counts as one signal
+        now = time.monotonic()
+        if now - self._last_decrease >= 1.0:
+            self.limit = max(float(self.min_concurrency), self.limit * factor)
+            self._last_decrease = now
+            metrics.EMBEDDING_CONCURRENCY_LIMIT.labels(self.name).set(self.limit)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """The delay a rate-limit response asks for, if it carries a Retry-After header."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        value = float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+    return value * random.uniform(1.0, 1.2)
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+
+class SearchCache:
+    """
+    TTL- and size-bounded LRU cache of `/search` results.
+
+    Every entry remembers the `VectorStore` write generation of its namespace at
+    the time the query ran. An entry whose generation no longer matches is treated
+    as a miss, so results never outlive an upsert into their namespace. Generations
+    are per process, so writes made by another worker are only picked up once the
+    TTL expires.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(
+        query: str,
+        top_k: int,
+        model: str,
+        namespace: Optional[str] = None,
+        filter: Optional[dict] = None,
+    ) -> Hashable:
+        """Build the cache key for a search request."""
+        return (
+            query,
+            top_k,
+            model,
+            namespace or "",
+            json.dumps(filter, sort_keys=True) if filter else "",
+        )
+
+    def get(self, key: Hashable, generation: int) -> Optional[object]:
+        """
+        Return cached results if they are fresh and were computed at `generation`.
+
+        Args:
+            key (Hashable): The key from `make_key`.
+            generation (int): The current write generation of the namespace.
+
+        Returns:
+            Optional[object]: The cached results, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, entry_generation, results = entry
+                if entry_generation != generation:
+                    del self._entries[key]
+                    self._stats["invalidations"] += 1
+                elif expires_at < time.monotonic():
+                    del self._entries[key]
+                    self._stats["evictions"] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return results
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: Hashable, generation: int, results: object):
+        """Cache results computed at the given namespace generation."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, generation, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, miss, eviction and invalidation counters plus the current size."""
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries)}
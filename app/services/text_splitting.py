@@ -0,0 +1,152 @@
+from collections import deque
+from typing import Iterable, Iterator, List, Optional
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# Splitter of a process-pool worker, created once by _init_split_worker
+_worker_splitter: Optional[RecursiveCharacterTextSplitter] = None
+
+
+def _init_split_worker(chunk_size: int, chunk_overlap: int):
+    global _worker_splitter
+    _worker_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+
+
+def split_in_worker(text: str) -> List[str]:
+    """Split a document in a process-pool worker set up by `split_worker_initializer`."""
+    return _worker_splitter.split_text(text)
+
+
+def split_worker_initializer(splitter: RecursiveCharacterTextSplitter):
+    """Return the (initializer, initargs) pair for a pool splitting like `splitter`."""
+    return _init_split_worker, (splitter._chunk_size, splitter._chunk_overlap)
+
+
+class _SplitMerger:
+    """
+    Incremental version of `TextSplitter._merge_splits`: the same sliding window,
+    fed one split at a time, emitting each chunk as soon as it is complete.
+    """
+
+    def __init__(self, splitter: RecursiveCharacterTextSplitter, separator: str = ""):
+        self.splitter = splitter
+        self.separator = separator
+        self.separator_len = splitter._length_function(separator)
+        self.current: deque = deque()
+        self.total = 0
+
+    def add(self, split: str) -> List[str]:
+        length = self.splitter._length_function
+        size, overlap = self.splitter._chunk_size, self.splitter._chunk_overlap
+        chunks = []
+        split_len = length(split)
+        if self.total + split_len + (self.separator_len if self.current else 0) > size:
+            if self.current:
+                chunk = self.splitter._join_docs(list(self.current), self.separator)
+                if chunk is not None:
+                    chunks.append(chunk)
+                while self.total > overlap or (
+                    self.total + split_len + (self.separator_len if self.current else 0) > size
+                    and self.total > 0
+                ):
+                    self.total -= length(self.current[0]) + (
+                        self.separator_len if len(self.current) > 1 else 0
+                    )
+                    self.current.popleft()
+        self.current.append(split)
+        self.total += split_len + (self.separator_len if len(self.current) > 1 else 0)
+        return chunks
+
+    def finish(self) -> List[str]:
+        """Emit the last chunk and start over, as the end of a `_merge_splits` call."""
+        if not self.current:
+            return []
+        chunk = self.splitter._join_docs(list(self.current), self.separator)
+        self.current.clear()
+        self.total = 0
+        return [chunk] if chunk is not None else []
+
+
+class StreamingTextSplitter:
+    """
+    Splits text that arrives in pieces, yielding the exact chunks
+    `RecursiveCharacterTextSplitter.split_text` would return for the whole text.
+
+    The recursive splitter first cuts the text on its top-level separator ("\\n\\n"),
+    merges the short parts with overlap and recursively splits the long ones. This
+    class finds the top-level cuts while reading, so only the current part and one
+    chunk of overlap are held in memory. Text without any top-level separator is
+    buffered and split as a whole, since the splitter would treat it as one part.
+    """
+
+    def __init__(self, splitter: RecursiveCharacterTextSplitter):
+        self.splitter = splitter
+
+    def supports_streaming(self) -> bool:
+        """Whether the splitter settings are ones the streaming path reproduces."""
+        splitter = self.splitter
+        return (
+            not splitter._is_separator_regex
+            and splitter._keep_separator in (True, "start")
+            and bool(splitter._separators)
+            and splitter._separators[0] != ""
+        )
+
+    def split_stream(self, pieces: Iterable[str]) -> Iterator[str]:
+        """
+        Yield the chunks of the concatenation of `pieces`, lazily.
+
+        Args:
+            pieces (Iterable[str]): Consecutive pieces of the text, of any size.
+
+        Yields:
+            str: The chunks, in order.
+        """
+        if not self.supports_streaming():
+            yield from self.splitter.split_text("".join(pieces))
+            return
+
+        separator = self.splitter._separators[0]
+        merger = _SplitMerger(self.splitter)
+        buffer = ""  # The current, incomplete part
+        scan_from = 0
+        found = False
+        for piece in pieces:
+            if not piece:
+                continue
+            buffer += piece
+            start = 0
+            while True:
+                match = buffer.find(separator, scan_from)
+                if match == -1:
+                    # A separator may straddle the next piece
+                    scan_from = max(scan_from, len(buffer) - len(separator) + 1)
+                    break
+                found = True
+                # Parts keep the separator at their start, like keep_separator=True
+                yield from self._split_part(buffer[start:match], merger)
+                start = match
+                scan_from = match + len(separator)
+            buffer = buffer[start:]
+            scan_from -= start
+
+        if not found:
+            yield from self.splitter.split_text(buffer)
+            return
+        yield from self._split_part(buffer, merger)
+        yield from merger.finish()
+
+    def _split_part(self, part: str, merger: _SplitMerger) -> Iterator[str]:
+        if part == "":
+            return
+        if self.splitter._length_function(part) < self.splitter._chunk_size:
+            yield from merger.add(part)
+            return
+        yield from merger.finish()
+        remaining_separators = self.splitter._separators[1:]
+        if not remaining_separators:
+            yield part
+        else:
+            yield from self.splitter._split_text(part, remaining_separators)
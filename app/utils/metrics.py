@@ -0,0 +1,348 @@
+"""
+In-process metrics rendered in the Prometheus text exposition format.
+
+Recording a sample costs one lock acquisition and a bisect, so instruments can
+sit on hot paths. Metric children are created per label combination on first
+use and kept for the life of the process; labels must have low cardinality.
+"""
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Seconds, from sub-millisecond cache and SQLite lookups to slow provider calls
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+_PREFIX = "embedding_service_"
+
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        return [f"{name}_total{labels} {_format(self._value)}"]
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0.0
+
+    def set(self, value: float):
+        self._value = value
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        return [f"{name}{labels} {_format(self._value)}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observe the duration of the block, in seconds, even if it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self._buckets + (math.inf,), counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_with_label(labels, 'le', _format(bound))} {cumulative}")
+        lines.append(f"{name}_sum{labels} {_format(total)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = _PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        REGISTRY.register(self)
+
+    def labels(self, *values) -> object:
+        """Return the child for one combination of label values, creating it on first use."""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for values, child in sorted(self._children.items()):
+            labels = ",".join(
+                f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)
+            )
+            lines.extend(child.samples(self.name, f"{{{labels}}}" if labels else ""))
+        return lines
+
+    def _new_child(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A monotonically increasing count, exposed as `<name>_total`."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+
+class Gauge(_Metric):
+    """A value that can go up and down, holding the last one set."""
+
+    kind = "gauge"
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# HTTP
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Latency of HTTP requests by route template, method and status code.",
+    ("route", "method", "status"),
+)
+
+# Ingestion stages
+FETCH_SECONDS = Histogram(
+    "fetch_duration_seconds",
+    "Time spent listing S3 pages and downloading objects.",
+    ("operation",),
+)
+FETCH_BYTES = Counter("fetch_bytes", "Bytes of S3 objects downloaded.")
+SPLIT_SECONDS = Histogram(
+    "split_duration_seconds",
+    "Time spent producing the chunks of each document: splitting in-process, reading "
+    "and splitting a streamed object, or waiting for a split worker.",
+    ("mode",),
+)
+SPLIT_CHUNKS = Counter("split_chunks", "Chunks produced by the text splitter.", ("mode",))
+INGEST_STAGE_WAIT_SECONDS = Histogram(
+    "ingest_stage_wait_seconds",
+    "Time the ingestion loop spent blocked on a stage: waiting for downloads (fetch), "
+    "for a free embedding slot (embed) or for a free upsert slot (upsert).",
+    ("stage",),
+)
+INGESTED_DOCUMENTS = Counter(
+    "ingested_documents", "Documents handled by ingestion runs, by outcome.", ("outcome",)
+)
+DEDUPLICATED_CHUNKS = Counter(
+    "deduplicated_chunks", "Chunks stored as a reference to a duplicate instead of embedded."
+)
+
+# Embedding providers
+EMBEDDING_REQUEST_SECONDS = Histogram(
+    "embedding_request_duration_seconds",
+    "Latency of embedding provider calls, per attempt.",
+    ("provider",),
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "embedding_batch_size",
+    "Texts sent per embedding provider call.",
+    ("provider",),
+    buckets=SIZE_BUCKETS,
+)
+EMBEDDING_TOKENS = Counter(
+    "embedding_tokens",
+    "Estimated tokens sent to embedding providers (about 4 characters per token).",
+    ("provider",),
+)
+EMBEDDING_RETRIES = Counter(
+    "embedding_retries", "Embedding provider calls that were retried.", ("provider",)
+)
+EMBEDDING_ERRORS = Counter(
+    "embedding_errors", "Embedding batches that failed after all retries.", ("provider",)
+)
+EMBEDDING_CONCURRENCY_LIMIT = Gauge(
+    "embedding_concurrency_limit",
+    "Provider calls currently allowed in flight by the adaptive scheduler.",
+    ("provider",),
+)
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "embedding_cache_lookups", "Embedding cache lookups by result.", ("provider", "result")
+)
+
+# Vector store and document tracker
+VECTOR_STORE_SECONDS = Histogram(
+    "vector_store_duration_seconds",
+    "Latency of vector backend requests, per upsert batch attempt.",
+    ("operation",),
+)
+VECTOR_STORE_VECTORS = Counter(
+    "vector_store_vectors", "Vectors sent to or requested from the backend.", ("operation",)
+)
+VECTOR_STORE_RETRIES = Counter(
+    "vector_store_retries", "Vector backend requests that were retried.", ("operation",)
+)
+DOCUMENT_TRACKER_SECONDS = Histogram(
+    "document_tracker_duration_seconds",
+    "Latency of document tracker lookups and updates.",
+    ("operation",),
+)
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording HTTP request latency.
+
+    Requests are labelled by route template (e.g. "/api/v1/embed-bucket/jobs/{job_id}")
+    rather than by path, so the number of series stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(_route_template(scope), scope["method"], status).observe(
+                time.perf_counter() - started
+            )
+
+
+def _route_template(scope) -> str:
+    """The path template of the matched route, with path parameters as placeholders."""
+    route = scope.get("route")
+    path_format = getattr(route, "path_format", None)
+    if path_format is None:
+        return "unmatched"
+    # Depending on the FastAPI version, routes of an included router hold their path
+    # without the router's prefix; take the prefix from the request path
+    path = scope["path"]
+    root_path = scope.get("root_path", "")
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path) :]
+    for i, char in enumerate(path):
+        if char == "/" and route.path_regex.match(path[i:]):
+            return path[:i] + path_format
+    return path_format
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _with_label(labels: str, name: str, value: str) -> str:
+    label = f'{name}="{value}"'
+    return f"{labels[:-1]},{label}}}" if labels else f"{{{label}}}"
@@ -0,0 +1,109 @@
+"""
+Sampling profiler that can be switched on and off in a running process.
+
+A background thread snapshots the stack of every other thread at a fixed
+interval and counts identical stacks. Nothing is instrumented, so the service
+runs at full speed while the profiler is off, and the cost while it is on is
+bounded by the sampling interval. Reports use the collapsed-stack format read
+by flamegraph.pl and speedscope.
+"""
+
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+_MAX_DEPTH = 128
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._interval = 0.0
+        self._started_at: Optional[float] = None
+        self._stopped_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval_ms: float = 10.0, duration_seconds: Optional[float] = None):
+        """
+        Start sampling, discarding the previous report.
+
+        Args:
+            interval_ms (float): Time between samples.
+            duration_seconds (Optional[float]): Stop automatically after this long.
+
+        Raises:
+            RuntimeError: If the profiler is already running.
+        """
+        with self._lock:
+            if self._thread is not None:
+                raise RuntimeError("The profiler is already running")
+            self._stacks = Counter()
+            self._samples = 0
+            self._interval = max(interval_ms, 1.0) / 1000.0
+            self._started_at, self._stopped_at = time.time(), None
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(duration_seconds,), name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop sampling and keep the report until the next start."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def status(self) -> Dict:
+        return {
+            "running": self.running,
+            "interval_ms": self._interval * 1000.0,
+            "samples": self._samples,
+            "started_at": self._started_at,
+            "stopped_at": self._stopped_at,
+        }
+
+    def collapsed(self) -> str:
+        """
+        Return the sampled stacks in collapsed format, one line per distinct stack:
+        frames from the thread entry point to the leaf, separated by ";", then the
+        number of samples.
+        """
+        stacks = self._stacks.copy()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def _run(self, duration_seconds: Optional[float]):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + duration_seconds if duration_seconds else None
+        while not self._stop.wait(self._interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = []
+                while frame is not None and len(frames) < _MAX_DEPTH:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                self._stacks[";".join(reversed(frames))] += 1
+            self._samples += 1
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        self._stopped_at = time.time()
+        with self._lock:
+            if self._thread is threading.current_thread():
+                self._thread = None
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,41 @@
+"""
+Helpers shared by the code paths that retry remote calls (embedding providers,
+the vector store) and by the ones that budget provider tokens.
+"""
+
+from typing import Optional
+
+# HTTP statuses worth retrying; other 4xx responses are caller errors. 409 is
+# retried as the OpenAI client does: writes here are idempotent upserts
+TRANSIENT_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """The HTTP status an error carries, if any."""
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether an error is worth retrying (throttling, server or network errors)."""
+    if isinstance(error, (ValueError, TypeError, KeyError)):
+        return False
+    status = error_status(error)
+    if status is not None:
+        return status in TRANSIENT_STATUSES
+    return True
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheaply estimate the number of tokens in a text (about 4 characters per token).
+
+    Args:
+        text (str): The text to estimate.
+
+    Returns:
+        int: The estimated token count.
+    """
+    return len(text) // 4 + 1
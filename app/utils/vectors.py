@@ -0,0 +1,71 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+QUANTIZATION_MODES = ("none", "float16", "int8")
+
+
+def as_float32_matrix(embeddings, dimension: Optional[int] = None) -> np.ndarray:
+    """
+    View or convert embeddings as a contiguous 2-D float32 array without copying
+    when they already are one.
+
+    Args:
+        embeddings: A 2-D array, a sequence of vectors or a single 1-D vector.
+        dimension (Optional[int]): Expected vector dimension, used for empty input.
+
+    Returns:
+        np.ndarray: A C-contiguous float32 array of shape (n, dimension).
+    """
+    matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1) if matrix.size else matrix.reshape(0, dimension or 0)
+    return matrix
+
+
+def valid_rows(matrix: np.ndarray) -> np.ndarray:
+    """Return a boolean mask of rows that are finite and not all zeros."""
+    matrix = as_float32_matrix(matrix)
+    return np.isfinite(matrix).all(axis=1) & (matrix != 0).any(axis=1)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row; zero rows are left as zeros."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def quantize(matrix: np.ndarray, mode: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Scalar-quantize float32 rows.
+
+    "float16" halves storage. "int8" stores each row as int8 codes with a float32
+    scale of max(|x|) / 127, a quarter of the float32 size.
+
+    Args:
+        matrix (np.ndarray): Float32 rows.
+        mode (str): One of "none", "float16" or "int8".
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The stored codes and one scale per row.
+    """
+    matrix = as_float32_matrix(matrix)
+    scales = np.ones(len(matrix), dtype=np.float32)
+    if mode == "none":
+        return matrix, scales
+    if mode == "float16":
+        return matrix.astype(np.float16), scales
+    if mode == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown quantization mode: {mode}")
+
+
+def dequantize(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """Reconstruct float32 rows from `quantize` output."""
+    matrix = codes.astype(np.float32, copy=False)
+    if codes.dtype == np.int8:
+        matrix *= scales.reshape(-1, 1)
+    return matrix
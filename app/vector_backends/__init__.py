@@ -0,0 +1,34 @@
+from app.vector_backends.base import QueryResult, ScoredVector, VectorBackend
+from app.config import settings
+
+
+def create_backend(name: str) -> VectorBackend:
+    """
+    Build the vector backend configured by `VECTOR_BACKEND`.
+
+    Args:
+        name (str): "pinecone" or "local".
+
+    Returns:
+        VectorBackend: The backend instance.
+    """
+    if name == "pinecone":
+        from app.vector_backends.pinecone_backend import PineconeBackend
+
+        return PineconeBackend()
+    if name == "local":
+        from app.vector_backends.local_backend import LocalBackend
+        from app.vector_reduction import stored_dimension
+
+        return LocalBackend(
+            dimension=stored_dimension(),
+            path=settings.LOCAL_INDEX_PATH or None,
+            ann_min_vectors=settings.LOCAL_ANN_MIN_VECTORS,
+            nprobe=settings.LOCAL_ANN_NPROBE,
+            flush_interval=settings.LOCAL_INDEX_FLUSH_INTERVAL_SECONDS,
+            quantization=settings.LOCAL_INDEX_QUANTIZATION,
+        )
+    raise ValueError(f"Unknown vector backend: {name}")
+
+
+__all__ = ["QueryResult", "ScoredVector", "VectorBackend", "create_backend"]
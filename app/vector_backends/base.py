@@ -0,0 +1,95 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+
+@dataclass
+class ScoredVector:
+    id: str
+    score: float
+    metadata: dict = field(default_factory=dict)
+    values: Optional[List[float]] = None
+
+
+@dataclass
+class QueryResult:
+    matches: List[ScoredVector] = field(default_factory=list)
+    namespace: str = ""
+
+
+class VectorBackend(ABC):
+    """
+    Storage engine behind `VectorStore`.
+
+    Backends store vectors with metadata under optional namespaces and answer
+    cosine-similarity queries against them.
+    """
+
+    # True while `aquery` can run on the event loop without blocking it
+    async_queries: bool = False
+
+    @abstractmethod
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: np.ndarray,
+        metadata: Optional[List[dict]] = None,
+        namespace: Optional[str] = None,
+    ):
+        """Insert or overwrite vectors by ID. Embeddings are float32 rows, one per ID."""
+
+    @abstractmethod
+    def query(
+        self,
+        vector: np.ndarray,
+        top_k: int = 10,
+        namespace: Optional[str] = None,
+        filter: Optional[dict] = None,
+        include_values: bool = False,
+    ) -> QueryResult:
+        """Return the `top_k` most similar vectors, best first."""
+
+    @abstractmethod
+    def fetch(self, ids: List[str], namespace: Optional[str] = None) -> Dict[str, dict]:
+        """Return `{"values": float32 array, "metadata": ...}` for each ID that exists."""
+
+    @abstractmethod
+    def delete(self, ids: List[str], namespace: Optional[str] = None):
+        """Delete vectors by ID. Missing IDs are ignored."""
+
+    async def aquery(
+        self,
+        vector: np.ndarray,
+        top_k: int = 10,
+        namespace: Optional[str] = None,
+        filter: Optional[dict] = None,
+        include_values: bool = False,
+    ) -> QueryResult:
+        """Async `query`, for backends that set `async_queries`."""
+        raise NotImplementedError(f"{type(self).__name__} has no async client")
+
+    def update_metadata(self, vector_id: str, metadata: dict, namespace: Optional[str] = None):
+        """Set metadata fields of a stored vector, keeping the others. Missing IDs are ignored."""
+        raise NotImplementedError(f"{type(self).__name__} cannot update metadata")
+
+    def list_ids(self, namespace: Optional[str] = None) -> Iterator[List[str]]:
+        """Yield the IDs stored in a namespace, a page at a time."""
+        raise NotImplementedError(f"{type(self).__name__} cannot list vector IDs")
+
+    def flush(self):
+        """Persist buffered writes. Backends that write through need not override this."""
+
+    def warmup(self):
+        """Open connections or load data ahead of the first request."""
+
+    async def aopen(self):
+        """
+        Create async clients on the running event loop. Called by `VectorStore` at
+        startup with WARMUP_ON_STARTUP, or before the first async query. Sets
+        `async_queries` once the client is usable.
+        """
+
+    async def aclose(self):
+        """Close the clients created by `aopen`."""
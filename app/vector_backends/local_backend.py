@@ -0,0 +1,506 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+import numpy as np
+
+from app.utils.logger import logger
+from app.utils.vectors import (
+    QUANTIZATION_MODES,
+    as_float32_matrix,
+    dequantize,
+    normalize_rows,
+    quantize,
+)
+from app.vector_backends.base import QueryResult, ScoredVector, VectorBackend
+
+DEFAULT_NAMESPACE_DIR = "__default__"
+# Rows dequantized at a time when scanning a quantized matrix
+_SCAN_BLOCK_ROWS = 65536
+_STORAGE_DTYPES = {"none": np.float32, "float16": np.float16, "int8": np.int8}
+# IDs per page yielded by list_ids
+_LIST_PAGE_SIZE = 1000
+# Names the files of a namespace's current snapshot; replaced last when saving
+_SNAPSHOT_MANIFEST = "snapshot.json"
+
+
+class _Namespace:
+    """
+    Vectors, IDs and metadata of one namespace.
+
+    Vectors are L2-normalized rows, so cosine similarity is a dot product. They are
+    stored as float32, or as float16 / int8 codes (with one scale per row) when
+    quantized. Persisted vectors are opened as a read-only memory map and only
+    copied into memory on the first write.
+    """
+
+    def __init__(self, dimension: int, path: Optional[str] = None, quantization: str = "none"):
+        self.dimension = dimension
+        self.path = path
+        self.quantization = quantization
+        self.ids: List[str] = []
+        self.metadata: List[dict] = []
+        self.id_to_row: Dict[str, int] = {}
+        self._vectors = np.zeros((0, dimension), dtype=_STORAGE_DTYPES[quantization])
+        self._scales = np.ones(0, dtype=np.float32)
+        self.dirty = False
+        self.ivf: Optional["_IVFIndex"] = None
+        if path and any(
+            os.path.exists(os.path.join(path, name)) for name in (_SNAPSHOT_MANIFEST, "vectors.npy")
+        ):
+            self._load()
+
+    @property
+    def count(self) -> int:
+        return len(self.ids)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """The stored rows, quantized codes included."""
+        return self._vectors[: self.count]
+
+    def rows(self, rows=None) -> np.ndarray:
+        """Return rows (all by default) as float32."""
+        if rows is None:
+            rows = slice(0, self.count)
+        elif isinstance(rows, slice):
+            rows = slice(rows.start, min(rows.stop, self.count))
+        return dequantize(self._vectors[rows], self._scales[rows])
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Dot products of the query with all rows, or with the given rows."""
+        if self._vectors.dtype == np.float32:
+            return (self.vectors if rows is None else self._vectors[rows]) @ query
+        # Dequantize in blocks so a scan never holds a full float32 copy
+        total = self.count if rows is None else len(rows)
+        scores = np.empty(total, dtype=np.float32)
+        for start in range(0, total, _SCAN_BLOCK_ROWS):
+            block = (
+                slice(start, min(start + _SCAN_BLOCK_ROWS, total))
+                if rows is None
+                else rows[start : start + _SCAN_BLOCK_ROWS]
+            )
+            scores[start : start + _SCAN_BLOCK_ROWS] = self.rows(block) @ query
+        return scores
+
+    def upsert(self, ids: List[str], embeddings: np.ndarray, metadata: List[dict]):
+        self._make_writable(self.count + len(ids))
+        codes, scales = quantize(embeddings, self.quantization)
+        for vector_id, vector, scale, meta in zip(ids, codes, scales, metadata):
+            row = self.id_to_row.get(vector_id)
+            if row is None:
+                row = self.count
+                self.id_to_row[vector_id] = row
+                self.ids.append(vector_id)
+                self.metadata.append(meta)
+                if self.ivf is not None and row < self.ivf.built_count:
+                    # Reuses a row freed by a delete, whose bucket was another vector's
+                    self.ivf.stale_rows.add(row)
+            else:
+                self.metadata[row] = meta
+                if self.ivf is not None:
+                    self.ivf.stale_rows.add(row)
+            self._vectors[row] = vector
+            self._scales[row] = scale
+        self.dirty = True
+
+    def delete(self, ids: List[str]):
+        rows = sorted(
+            (self.id_to_row[vector_id] for vector_id in ids if vector_id in self.id_to_row),
+            reverse=True,
+        )
+        if not rows:
+            return
+        self._make_writable(self.count)
+        for row in rows:
+            # Swap-remove: move the last row into the freed slot
+            last = self.count - 1
+            del self.id_to_row[self.ids[row]]
+            if row != last:
+                self._vectors[row] = self._vectors[last]
+                self._scales[row] = self._scales[last]
+                self.ids[row] = self.ids[last]
+                self.metadata[row] = self.metadata[last]
+                self.id_to_row[self.ids[row]] = row
+            self.ids.pop()
+            self.metadata.pop()
+            if self.ivf is not None:
+                self.ivf.remove_row(row, last)
+        self.dirty = True
+
+    def snapshot(self) -> Optional[dict]:
+        """
+        Copy the state to persist if there are unsaved changes, and mark it saved.
+        The caller holds the backend lock; `write_snapshot` then runs without it.
+        """
+        if not self.path or not self.dirty:
+            return None
+        exact_ivf = self.ivf is not None and self.ivf.is_exact_for(self.count)
+        state = {
+            "vectors": self.vectors.copy(),
+            "scales": self._scales[: self.count].copy(),
+            "ids": list(self.ids),
+            "metadata": list(self.metadata),
+            # Built once and never modified in place
+            "ivf": (self.ivf.centroids, self.ivf.assignments) if exact_ivf else None,
+        }
+        self.dirty = False
+        return state
+
+    def write_snapshot(self, state: dict):
+        """
+        Write a snapshot under a new generation of file names, then point
+        snapshot.json at it in one replace, so a crash leaves the previous
+        snapshot in place instead of files that disagree on the row count.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        generation = f"{time.time_ns():x}"
+        files = {
+            "vectors": f"vectors-{generation}.npy",
+            "scales": f"scales-{generation}.npy",
+            "ids": f"ids-{generation}.json",
+            "metadata": f"metadata-{generation}.json",
+        }
+        self._write(np.save, files["vectors"], state["vectors"])
+        self._write(np.save, files["scales"], state["scales"])
+        self._write(_dump_json, files["ids"], state["ids"])
+        self._write(_dump_json, files["metadata"], state["metadata"])
+        if state["ivf"] is not None:
+            files["ivf_centroids"] = f"ivf_centroids-{generation}.npy"
+            files["ivf_assignments"] = f"ivf_assignments-{generation}.npy"
+            self._write(np.save, files["ivf_centroids"], state["ivf"][0])
+            self._write(np.save, files["ivf_assignments"], state["ivf"][1])
+        manifest = {"count": len(state["ids"]), "files": files}
+        temporary = os.path.join(self.path, f"{_SNAPSHOT_MANIFEST}.tmp")
+        with open(temporary, "wb") as f:
+            _dump_json(f, manifest)
+        os.replace(temporary, os.path.join(self.path, _SNAPSHOT_MANIFEST))
+        # Earlier generations; a memory map of one stays readable once unlinked
+        current = {_SNAPSHOT_MANIFEST, *files.values()}
+        for name in os.listdir(self.path):
+            if name not in current:
+                os.remove(os.path.join(self.path, name))
+
+    def _write(self, writer, name: str, data):
+        with open(os.path.join(self.path, name), "wb") as f:
+            writer(f, data)
+
+    def _load(self):
+        manifest_path = os.path.join(self.path, _SNAPSHOT_MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            files, count = manifest["files"], manifest["count"]
+        else:
+            # Written before snapshot manifests
+            files = {name: f"{name}.npy" for name in ("vectors", "scales")}
+            files.update(ids="ids.json", metadata="metadata.json")
+            files.update(ivf_centroids="ivf_centroids.npy", ivf_assignments="ivf_assignments.npy")
+            count = None
+        path = {name: os.path.join(self.path, file) for name, file in files.items()}
+        self._vectors = np.load(path["vectors"], mmap_mode="r")
+        with open(path["ids"], "r", encoding="utf-8") as f:
+            self.ids = json.load(f)
+        with open(path["metadata"], "r", encoding="utf-8") as f:
+            self.metadata = json.load(f)
+        if os.path.exists(path["scales"]):
+            self._scales = np.load(path["scales"])
+        else:
+            self._scales = np.ones(len(self.ids), dtype=np.float32)
+        counts = {len(self._vectors), len(self._scales), len(self.ids), len(self.metadata)}
+        if count is not None:
+            counts.add(count)
+        if len(counts) != 1:
+            raise ValueError(
+                f"Local index at {self.path} is inconsistent: row counts {sorted(counts)}"
+            )
+        self.id_to_row = {vector_id: row for row, vector_id in enumerate(self.ids)}
+        stored = self._vectors.dtype
+        if stored != _STORAGE_DTYPES[self.quantization]:
+            # Saved with another quantization setting: convert once, save on next flush
+            logger.info(f"Converting local index at {self.path} from {stored} to {self.quantization}")
+            self._vectors, self._scales = quantize(self.rows(), self.quantization)
+            self.dirty = True
+        if "ivf_centroids" in path and os.path.exists(path["ivf_centroids"]):
+            assignments = np.load(path["ivf_assignments"])
+            if len(assignments) == self.count:
+                self.ivf = _IVFIndex(np.load(path["ivf_centroids"]), assignments)
+
+    def _make_writable(self, capacity: int):
+        """Copy a memory-mapped matrix into memory and grow it geometrically."""
+        writable = isinstance(self._vectors, np.ndarray) and not isinstance(
+            self._vectors, np.memmap
+        )
+        if writable and len(self._vectors) >= capacity:
+            return
+        new_capacity = max(capacity, 2 * len(self._vectors), 1024)
+        vectors = np.zeros((new_capacity, self.dimension), dtype=self._vectors.dtype)
+        vectors[: self.count] = self._vectors[: self.count]
+        scales = np.ones(new_capacity, dtype=np.float32)
+        scales[: self.count] = self._scales[: self.count]
+        self._vectors, self._scales = vectors, scales
+
+
+class _IVFIndex:
+    """
+    Inverted-file index: vectors are bucketed by their nearest k-means centroid and
+    a query only scores the buckets of its `nprobe` closest centroids.
+
+    Rows appended after the build, and rows overwritten since, are scored exactly.
+    """
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray):
+        self.centroids = centroids
+        self.assignments = assignments
+        self.built_count = len(assignments)
+        self.stale_rows = set()
+        self.removed = 0
+        order = np.argsort(assignments, kind="stable")
+        boundaries = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+        self.lists = [order[boundaries[i] : boundaries[i + 1]] for i in range(len(centroids))]
+
+    @classmethod
+    def build(cls, ns: _Namespace, iterations: int = 10, seed: int = 0) -> "_IVFIndex":
+        count = ns.count
+        nlist = max(1, int(np.sqrt(count)))
+        rng = np.random.default_rng(seed)
+        sample = ns.rows(np.sort(rng.choice(count, size=min(count, nlist * 64), replace=False)))
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for i in range(nlist):
+                members = sample[labels == i]
+                if len(members):
+                    centroids[i] = members.mean(axis=0)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        assignments = np.concatenate(
+            [
+                np.argmax(ns.rows(slice(start, start + _SCAN_BLOCK_ROWS)) @ centroids.T, axis=1)
+                for start in range(0, count, _SCAN_BLOCK_ROWS)
+            ]
+        ).astype(np.int32)
+        return cls(centroids, assignments)
+
+    def candidates(self, query: np.ndarray, nprobe: int, count: int) -> np.ndarray:
+        probe = np.argsort(-(self.centroids @ query))[:nprobe]
+        rows = [self.lists[i] for i in probe]
+        rows.append(np.arange(self.built_count, count))
+        if self.stale_rows:
+            rows.append(np.fromiter(self.stale_rows, dtype=np.int64))
+        rows = np.unique(np.concatenate(rows))
+        return rows[rows < count]
+
+    def remove_row(self, row: int, last: int):
+        """Track a swap-remove: `last` was moved into `row` and then dropped."""
+        self.stale_rows.discard(last)
+        if row != last:
+            self.stale_rows.add(row)
+        self.removed += 1
+
+    def is_exact_for(self, count: int) -> bool:
+        """Whether the buckets still describe every row, so the index can be saved."""
+        return self.built_count == count and not self.stale_rows and not self.removed
+
+    def needs_rebuild(self, count: int) -> bool:
+        changed = max(count - self.built_count, 0) + len(self.stale_rows) + self.removed
+        return changed > 0.1 * max(self.built_count, 1)
+
+
+class LocalBackend(VectorBackend):
+    """
+    In-process NumPy vector index.
+
+    Small namespaces are searched exactly with a single float32 matrix product.
+    Namespaces with at least `ann_min_vectors` vectors use an IVF index instead.
+    With `quantization` set to "float16" or "int8", vectors are kept at half or a
+    quarter of their float32 size and dequantized block by block while scoring.
+    Each namespace persists to `path/<namespace>/` as a memory-mappable `.npy`
+    matrix plus JSON IDs and metadata, written on `flush()` and every
+    `flush_interval` seconds while there are unsaved changes. `snapshot.json`
+    names the files of the current snapshot and is replaced last.
+    """
+
+    def __init__(
+        self,
+        dimension: int,
+        path: Optional[str] = None,
+        ann_min_vectors: int = 20000,
+        nprobe: int = 8,
+        flush_interval: float = 30.0,
+        quantization: str = "none",
+    ):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {quantization}")
+        self.dimension = dimension
+        self.quantization = quantization
+        self.path = path
+        self.ann_min_vectors = ann_min_vectors
+        self.nprobe = nprobe
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()  # Orders concurrent flushes
+        if path and flush_interval > 0:
+            threading.Thread(
+                target=self._autosave,
+                args=(flush_interval,),
+                name="local-index-autosave",
+                daemon=True,
+            ).start()
+
+    def upsert(self, ids, embeddings, metadata=None, namespace=None):
+        if not ids:
+            return
+        vectors = normalize_rows(as_float32_matrix(embeddings).reshape(len(ids), -1))
+        if vectors.shape[1] != self.dimension:
+            raise ValueError(
+                f"Expected vectors of dimension {self.dimension}, got {vectors.shape[1]}"
+            )
+        metadata = list(metadata) if metadata else [{} for _ in ids]
+        with self._lock:
+            self._namespace(namespace).upsert(list(ids), vectors, metadata)
+
+    def query(self, vector, top_k=10, namespace=None, filter=None, include_values=False):
+        query = normalize_rows(as_float32_matrix(vector))[0]
+        with self._lock:
+            ns = self._namespace(namespace)
+            if ns.count == 0 or top_k <= 0:
+                return QueryResult(namespace=namespace or "")
+
+            rows = None
+            if ns.count >= self.ann_min_vectors:
+                if ns.ivf is None or ns.ivf.needs_rebuild(ns.count):
+                    logger.info(f"Building IVF index for namespace '{namespace or ''}' ({ns.count} vectors)")
+                    ns.ivf = _IVFIndex.build(ns)
+                    ns.dirty = True
+                rows = ns.ivf.candidates(query, self.nprobe, ns.count)
+
+            if filter:
+                candidates = range(ns.count) if rows is None else rows
+                rows = np.array(
+                    [row for row in candidates if _matches(ns.metadata[row], filter)],
+                    dtype=np.int64,
+                )
+
+            scores = ns.scores(query, rows)
+            k = min(top_k, len(scores))
+            if k == 0:
+                return QueryResult(namespace=namespace or "")
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+
+            matches = []
+            for position in best:
+                row = int(position if rows is None else rows[position])
+                matches.append(
+                    ScoredVector(
+                        id=ns.ids[row],
+                        score=float(scores[position]),
+                        metadata=ns.metadata[row],
+                        values=ns.rows([row])[0].tolist() if include_values else None,
+                    )
+                )
+            return QueryResult(matches=matches, namespace=namespace or "")
+
+    def fetch(self, ids, namespace=None):
+        with self._lock:
+            ns = self._namespace(namespace)
+            return {
+                vector_id: {
+                    "values": ns.rows([ns.id_to_row[vector_id]])[0],
+                    "metadata": ns.metadata[ns.id_to_row[vector_id]],
+                }
+                for vector_id in ids
+                if vector_id in ns.id_to_row
+            }
+
+    def delete(self, ids, namespace=None):
+        with self._lock:
+            self._namespace(namespace).delete(list(ids))
+
+    def update_metadata(self, vector_id, metadata, namespace=None):
+        with self._lock:
+            ns = self._namespace(namespace)
+            row = ns.id_to_row.get(vector_id)
+            if row is not None:
+                ns.metadata[row] = {**ns.metadata[row], **metadata}
+                ns.dirty = True
+
+    def list_ids(self, namespace=None):
+        with self._lock:
+            ids = list(self._namespace(namespace).ids)
+        for start in range(0, len(ids), _LIST_PAGE_SIZE):
+            yield ids[start : start + _LIST_PAGE_SIZE]
+
+    def flush(self):
+        # Copy unsaved namespaces under the lock, then write them without holding it,
+        # so queries and upserts are not blocked while files are written
+        with self._save_lock:
+            with self._lock:
+                snapshots = []
+                for ns in self._namespaces.values():
+                    state = ns.snapshot()
+                    if state is not None:
+                        snapshots.append((ns, state))
+            for i, (ns, state) in enumerate(snapshots):
+                try:
+                    ns.write_snapshot(state)
+                except Exception:
+                    with self._lock:
+                        for unsaved, _ in snapshots[i:]:
+                            unsaved.dirty = True
+                    raise
+
+    def warmup(self):
+        # Map the default namespace so its files are opened before the first query
+        with self._lock:
+            self._namespace(None)
+
+    def _autosave(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error saving local vector index: {str(e)}")
+
+    def _namespace(self, namespace: Optional[str]) -> _Namespace:
+        # Caller holds the lock; namespaces are loaded on first use
+        name = namespace or ""
+        if name not in self._namespaces:
+            path = None
+            if self.path:
+                path = os.path.join(self.path, quote(name, safe="") or DEFAULT_NAMESPACE_DIR)
+            self._namespaces[name] = _Namespace(self.dimension, path, self.quantization)
+        return self._namespaces[name]
+
+
+def _matches(metadata: dict, filter: dict) -> bool:
+    """Evaluate a Pinecone-style metadata filter ($eq, $ne, $in, $nin, $and, $or)."""
+    for field, condition in filter.items():
+        if field == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif field == "$or":
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(field)
+            for operator, operand in condition.items():
+                if operator == "$eq" and value != operand:
+                    return False
+                if operator == "$ne" and value == operand:
+                    return False
+                if operator == "$in" and value not in operand:
+                    return False
+                if operator == "$nin" and value in operand:
+                    return False
+        elif metadata.get(field) != condition:
+            return False
+    return True
+
+
+def _dump_json(f, data):
+    f.write(json.dumps(data).encode("utf-8"))
@@ -0,0 +1,177 @@
+import asyncio
+import threading
+import numpy as np
+import pinecone
+from pinecone.exceptions import NotFoundException
+from typing import Dict, Iterator, List, Optional
+
+from app.config import settings
+from app.utils.logger import logger
+from app.vector_reduction import stored_dimension
+from app.vector_backends.base import QueryResult, ScoredVector, VectorBackend
+
+
+class PineconeBackend(VectorBackend):
+    def __init__(self, index=None):
+        """
+        Args:
+            index: An already opened index handle, or an object with the same
+                interface (for example a benchmark stand-in). No client is created
+                when it is given.
+        """
+        self._index = index
+        self._index_lock = threading.Lock()
+        self._async_index = None
+        self.pc = None
+        if index is not None:
+            return
+        # Initialize Pinecone instance, over gRPC when the optional extra is installed
+        if settings.PINECONE_USE_GRPC:
+            try:
+                from pinecone.grpc import PineconeGRPC
+
+                self.pc = PineconeGRPC(api_key=settings.PINECONE_API_KEY)
+            except ImportError:
+                logger.warning("pinecone[grpc] is not installed, falling back to REST")
+        if self.pc is None:
+            self.pc = pinecone.Pinecone(
+                api_key=settings.PINECONE_API_KEY,
+                environment=settings.PINECONE_ENVIRONMENT,
+            )
+
+    @property
+    def index(self):
+        """The Pinecone index handle, opened (and created if missing) on first use."""
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    self._index = self._open_index()
+        return self._index
+
+    def warmup(self):
+        self.index
+
+    async def aopen(self):
+        """
+        Open the asyncio index client, whose keep-alive connection pool lives on the
+        running event loop. Queries run on threads if it cannot be opened.
+        """
+        if self.pc is None or self._async_index is not None or not settings.PINECONE_ASYNC_QUERIES:
+            return
+        try:
+            # Opening the index handle checks that it exists; the async client needs its host
+            host = await asyncio.to_thread(self._index_host)
+            self._async_index = self.pc.IndexAsyncio(host=host)
+        except (ImportError, AttributeError):
+            logger.warning("pinecone[asyncio] is not installed, queries run on threads")
+            return
+        except Exception as e:
+            logger.warning(f"Could not open the async Pinecone client, queries run on threads: {e}")
+            return
+        self.async_queries = True
+
+    async def aclose(self):
+        if self._async_index is not None:
+            self.async_queries = False
+            index, self._async_index = self._async_index, None
+            await index.close()
+
+    def _index_host(self) -> str:
+        self.index
+        return self.pc.describe_index(settings.PINECONE_INDEX).host
+
+    def _open_index(self):
+        # Check if the index exists, create if it doesn't
+        if not any(
+            index["name"] == settings.PINECONE_INDEX for index in self.pc.list_indexes()
+        ):
+            logger.info(f"Creating Pinecone index {settings.PINECONE_INDEX}")
+            self.pc.create_index(
+                name=settings.PINECONE_INDEX,
+                dimension=stored_dimension(),
+                spec={
+                    "metric": "cosine",
+                    "replicas": 1,
+                    "serverless": {
+                        "cloud": settings.PINECONE_CLOUD,
+                        "region": settings.PINECONE_REGION,
+                    },
+                },
+            )
+        try:
+            # Size the connection pool for concurrent upsert batches
+            return self.pc.Index(
+                settings.PINECONE_INDEX, pool_threads=settings.VECTOR_UPSERT_CONCURRENCY
+            )
+        except NotFoundException as e:
+            logger.error(f"Error opening Pinecone index: {e}")
+            raise RuntimeError(
+                "Pinecone index not found. Please check the index name and configuration."
+            )
+
+    def upsert(self, ids, embeddings, metadata=None, namespace=None):
+        # The client serializes plain lists; convert the float32 rows only here
+        values = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1).tolist()
+        self.index.upsert(
+            vectors=list(zip(ids, values, metadata or [{} for _ in ids])),
+            namespace=namespace,
+        )
+
+    def query(self, vector, top_k=10, namespace=None, filter=None, include_values=False):
+        response = self.index.query(
+            vector=np.asarray(vector, dtype=np.float32).tolist(),
+            top_k=top_k,
+            namespace=namespace,
+            filter=filter,
+            include_metadata=True,
+            include_values=include_values,
+        )
+        return _to_result(response, namespace, include_values)
+
+    async def aquery(self, vector, top_k=10, namespace=None, filter=None, include_values=False):
+        response = await self._async_index.query(
+            vector=np.asarray(vector, dtype=np.float32).tolist(),
+            top_k=top_k,
+            namespace=namespace or "",
+            filter=filter,
+            include_metadata=True,
+            include_values=include_values,
+        )
+        return _to_result(response, namespace, include_values)
+
+    def fetch(self, ids: List[str], namespace: Optional[str] = None) -> Dict[str, dict]:
+        response = self.index.fetch(ids=ids, namespace=namespace)
+        return {
+            vector_id: {
+                "values": np.asarray(vector.values, dtype=np.float32),
+                "metadata": vector.metadata or {},
+            }
+            for vector_id, vector in response.vectors.items()
+        }
+
+    def delete(self, ids: List[str], namespace: Optional[str] = None):
+        if ids:
+            self.index.delete(ids=ids, namespace=namespace)
+
+    def update_metadata(self, vector_id: str, metadata: dict, namespace: Optional[str] = None):
+        self.index.update(id=vector_id, set_metadata=metadata, namespace=namespace)
+
+    def list_ids(self, namespace: Optional[str] = None) -> Iterator[List[str]]:
+        # Serverless indexes only. Older clients yield lists of IDs, newer ones list responses
+        for page in self.index.list(namespace=namespace or ""):
+            yield [getattr(item, "id", item) for item in getattr(page, "vectors", page)]
+
+
+def _to_result(response, namespace: Optional[str], include_values: bool) -> QueryResult:
+    return QueryResult(
+        matches=[
+            ScoredVector(
+                id=match.id,
+                score=match.score,
+                metadata=match.metadata or {},
+                values=match.values if include_values else None,
+            )
+            for match in response.matches
+        ],
+        namespace=namespace or "",
+    )
@@ -0,0 +1,331 @@
+"""
+Dimensionality reduction of embeddings before they are stored or queried.
+
+With VECTOR_REDUCTION set, `EmbeddingService` passes every embedding it returns
+through one `VectorReducer`. Ingestion, search and embed-file requests therefore
+all store and query the same VECTOR_REDUCED_DIMENSION vectors. Two modes are
+supported:
+
+- "truncate" keeps the leading components and renormalizes. Only use it with
+  models trained for Matryoshka-style truncation.
+- "pca" projects onto principal components fitted offline on a sample of full
+  vectors, loaded from the artifact at VECTOR_PCA_PATH.
+
+The PCA artifact is fitted, and the recall given up at each dimension is
+measured, on a snapshot of full-dimension vectors:
+
+    python -m app.vector_snapshot export .data/snapshots/full --namespace documents
+    python -m app.vector_reduction evaluate .data/snapshots/full --dimensions 128 256 512
+    python -m app.vector_reduction fit-pca .data/snapshots/full --dimension 256
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import List, Optional
+
+import numpy as np
+
+from app.config import settings
+from app.utils.vectors import as_float32_matrix, normalize_rows, valid_rows
+
+REDUCTION_MODES = ("none", "truncate", "pca")
+
+
+class VectorReducer:
+    """
+    Maps embeddings of `input_dimension` to unit vectors of `output_dimension`.
+
+    Rows that are all zeros, which mark failed embeddings, stay zeros.
+    """
+
+    def __init__(
+        self,
+        mode: str,
+        input_dimension: int,
+        output_dimension: int,
+        components: Optional[np.ndarray] = None,
+        mean: Optional[np.ndarray] = None,
+    ):
+        if mode not in ("truncate", "pca"):
+            raise ValueError(f"Unknown vector reduction mode: {mode}")
+        if not 0 < output_dimension <= input_dimension:
+            raise ValueError(
+                f"Reduced dimension must be between 1 and {input_dimension}, got {output_dimension}"
+            )
+        expected_shape = (output_dimension, input_dimension)
+        if mode == "pca" and (components is None or components.shape != expected_shape):
+            raise ValueError(
+                f"PCA needs a ({output_dimension}, {input_dimension}) component matrix"
+            )
+        self.mode = mode
+        self.input_dimension = input_dimension
+        self.output_dimension = output_dimension
+        self.components = None if components is None else as_float32_matrix(components)
+        self.mean = (
+            np.zeros(input_dimension, dtype=np.float32)
+            if mean is None
+            else np.asarray(mean, dtype=np.float32)
+        )
+        # Share of the sample variance kept, set by fit_pca
+        self.explained_variance: Optional[float] = None
+
+    def reduce(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Reduce a (n, input_dimension) array, or a single vector.
+
+        Returns:
+            np.ndarray: Float32 unit vectors of `output_dimension`, in the input's shape.
+
+        Raises:
+            ValueError: If the embeddings do not have `input_dimension` components.
+        """
+        single = np.ndim(embeddings) == 1
+        matrix = as_float32_matrix(embeddings)
+        if matrix.shape[1] != self.input_dimension:
+            raise ValueError(
+                f"Expected embeddings of dimension {self.input_dimension}, got {matrix.shape[1]}"
+            )
+        if self.mode == "truncate":
+            reduced = matrix[:, : self.output_dimension]
+        else:
+            reduced = (matrix - self.mean) @ self.components.T
+        reduced = normalize_rows(reduced).astype(np.float32, copy=False)
+        reduced[~(matrix != 0).any(axis=1)] = 0.0
+        return reduced[0] if single else reduced
+
+    @classmethod
+    def fit_pca(cls, sample: np.ndarray, output_dimension: int) -> "VectorReducer":
+        """
+        Fit a PCA projection on a sample of full-dimension embeddings.
+
+        Args:
+            sample (np.ndarray): (n, input_dimension) embeddings. Zero and non-finite
+                rows are ignored.
+            output_dimension (int): Components to keep.
+        """
+        sample = as_float32_matrix(sample)
+        sample = normalize_rows(sample[valid_rows(sample)]).astype(np.float64)
+        if len(sample) <= output_dimension:
+            raise ValueError(
+                f"Fitting {output_dimension} components needs more than {output_dimension} "
+                f"sample vectors, got {len(sample)}"
+            )
+        mean = sample.mean(axis=0)
+        centered = sample - mean
+        # Eigenvectors of the covariance; d x d stays small next to the sample
+        eigenvalues, eigenvectors = np.linalg.eigh(centered.T @ centered / len(sample))
+        order = np.argsort(eigenvalues)[::-1][:output_dimension]
+        reducer = cls(
+            "pca",
+            sample.shape[1],
+            output_dimension,
+            components=eigenvectors[:, order].T,
+            mean=mean,
+        )
+        kept = eigenvalues[order].sum() / max(eigenvalues.sum(), 1e-12)
+        reducer.explained_variance = float(kept)
+        return reducer
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(f, mode=self.mode, components=self.components, mean=self.mean)
+
+    @classmethod
+    def load(cls, path: str) -> "VectorReducer":
+        with np.load(path) as artifact:
+            components = artifact["components"]
+            return cls(
+                str(artifact["mode"]),
+                components.shape[1],
+                components.shape[0],
+                components=components,
+                mean=artifact["mean"],
+            )
+
+
+def stored_dimension() -> int:
+    """Dimension of the vectors in the index: VECTOR_REDUCED_DIMENSION when reducing."""
+    if settings.VECTOR_REDUCTION == "none":
+        return settings.VECTOR_DIMENSION
+    return settings.VECTOR_REDUCED_DIMENSION
+
+
+def create_reducer() -> Optional[VectorReducer]:
+    """
+    Build the reducer configured by VECTOR_REDUCTION, or None if it is "none".
+
+    Raises:
+        ValueError: If the mode is unknown or the PCA artifact does not match the
+            configured dimensions.
+        FileNotFoundError: If the PCA artifact is missing.
+    """
+    mode = settings.VECTOR_REDUCTION
+    if mode == "none":
+        return None
+    if mode not in REDUCTION_MODES:
+        raise ValueError(f"Unknown vector reduction mode: {mode}")
+    if mode == "truncate":
+        return VectorReducer(mode, settings.VECTOR_DIMENSION, settings.VECTOR_REDUCED_DIMENSION)
+    if not os.path.exists(settings.VECTOR_PCA_PATH):
+        raise FileNotFoundError(
+            f"PCA artifact {settings.VECTOR_PCA_PATH} not found; fit it with "
+            "python -m app.vector_reduction fit-pca"
+        )
+    reducer = VectorReducer.load(settings.VECTOR_PCA_PATH)
+    if (reducer.input_dimension, reducer.output_dimension) != (
+        settings.VECTOR_DIMENSION,
+        settings.VECTOR_REDUCED_DIMENSION,
+    ):
+        raise ValueError(
+            f"PCA artifact maps {reducer.input_dimension} to {reducer.output_dimension} "
+            f"dimensions, the settings expect {settings.VECTOR_DIMENSION} to "
+            f"{settings.VECTOR_REDUCED_DIMENSION}"
+        )
+    return reducer
+
+
+def evaluate(
+    vectors: np.ndarray,
+    dimensions: List[int],
+    modes: List[str],
+    queries: int = 200,
+    top_k: int = 10,
+    seed: int = 0,
+) -> List[dict]:
+    """
+    Measure the recall given up by each reduction.
+
+    Held-out sample vectors act as queries. Their exact top-k neighbours by cosine
+    similarity at full dimension are the ground truth, and recall@k is the share
+    of those found by the same exact search over reduced vectors. PCA is fitted
+    on the remaining vectors only.
+
+    Returns:
+        List[dict]: Mode, dimension, recall@k and the size relative to full
+            vectors, one entry per mode and dimension.
+    """
+    vectors = as_float32_matrix(vectors)
+    vectors = normalize_rows(vectors[valid_rows(vectors)])
+    order = np.random.default_rng(seed).permutation(len(vectors))
+    queries = min(queries, len(vectors) // 10)
+    query_vectors, corpus = vectors[order[:queries]], vectors[order[queries:]]
+    if queries == 0 or len(corpus) < top_k:
+        raise ValueError(f"Need at least {max(10, top_k + 1)} valid vectors, got {len(vectors)}")
+    truth = _top_k(corpus, query_vectors, top_k)
+
+    results = []
+    for mode in modes:
+        if mode == "pca":
+            # The leading components of the widest fit are the fit of every narrower one
+            pca = VectorReducer.fit_pca(corpus, max(dimensions))
+        for dimension in sorted(dimensions):
+            if mode == "pca":
+                reducer = VectorReducer(
+                    "pca",
+                    corpus.shape[1],
+                    dimension,
+                    components=pca.components[:dimension],
+                    mean=pca.mean,
+                )
+            else:
+                reducer = VectorReducer(mode, corpus.shape[1], dimension)
+            found = _top_k(reducer.reduce(corpus), reducer.reduce(query_vectors), top_k)
+            recall = np.mean(
+                [len(set(a) & set(b)) / top_k for a, b in zip(truth, found)]
+            )
+            results.append(
+                {
+                    "mode": mode,
+                    "dimension": dimension,
+                    f"recall@{top_k}": round(float(recall), 4),
+                    "relative_size": round(dimension / corpus.shape[1], 4),
+                }
+            )
+    return results
+
+
+def load_snapshot_sample(path: str, sample: int, seed: int = 0) -> np.ndarray:
+    """Load up to `sample` vectors, chosen at random, from a snapshot directory."""
+    from app.vector_snapshot import read_manifest
+
+    manifest = read_manifest(path)
+    total = manifest["count"]
+    chosen = np.sort(np.random.default_rng(seed).permutation(total)[: min(sample, total)])
+    rows, offset = [], 0
+    for batch in manifest["batches"]:
+        vectors = np.load(os.path.join(path, batch["vectors"]), mmap_mode="r")
+        selected = chosen[(chosen >= offset) & (chosen < offset + batch["count"])] - offset
+        if len(selected):
+            rows.append(np.asarray(vectors[selected], dtype=np.float32))
+        offset += batch["count"]
+    if not rows:
+        return np.zeros((0, manifest["dimension"]), dtype=np.float32)
+    return np.concatenate(rows)
+
+
+def _top_k(corpus: np.ndarray, queries: np.ndarray, top_k: int) -> np.ndarray:
+    scores = queries @ corpus.T
+    best = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    return best
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fit = commands.add_parser("fit-pca", help="Fit a PCA projection and save it as an artifact")
+    fit.add_argument("snapshot", help="Snapshot directory of full-dimension vectors")
+    fit.add_argument("--dimension", type=int, required=True, help="Components to keep")
+    fit.add_argument("--output", default=settings.VECTOR_PCA_PATH, help="Artifact path")
+    fit.add_argument("--sample", type=int, default=100000, help="Vectors to fit on")
+
+    evaluation = commands.add_parser("evaluate", help="Report recall@k for each reduced dimension")
+    evaluation.add_argument("snapshot", help="Snapshot directory of full-dimension vectors")
+    evaluation.add_argument("--dimensions", type=int, nargs="+", required=True)
+    evaluation.add_argument(
+        "--modes", nargs="+", choices=["truncate", "pca"], default=["truncate", "pca"]
+    )
+    evaluation.add_argument("--sample", type=int, default=50000, help="Vectors to evaluate on")
+    evaluation.add_argument("--queries", type=int, default=200, help="Held-out query vectors")
+    evaluation.add_argument("--top-k", type=int, default=10)
+    evaluation.add_argument("--json", action="store_true", help="Print the results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    try:
+        sample = load_snapshot_sample(args.snapshot, args.sample)
+        if args.command == "fit-pca":
+            reducer = VectorReducer.fit_pca(sample, args.dimension)
+            reducer.save(args.output)
+            print(
+                f"Saved {reducer.input_dimension} -> {reducer.output_dimension} PCA to "
+                f"{args.output} ({reducer.explained_variance:.1%} of the variance, "
+                f"fitted on {len(sample)} vectors)"
+            )
+            return 0
+        results = evaluate(sample, args.dimensions, args.modes, args.queries, args.top_k)
+    except (FileNotFoundError, ValueError) as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    recall = f"recall@{args.top_k}"
+    print(f"{'mode':<10}{'dimension':>10}{recall:>12}{'size':>8}")
+    for row in results:
+        print(
+            f"{row['mode']:<10}{row['dimension']:>10}{row[recall]:>12.4f}"
+            f"{row['relative_size']:>8.0%}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
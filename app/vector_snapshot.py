@@ -0,0 +1,267 @@
+"""
+Snapshot export and import of vector store namespaces.
+
+A snapshot is a directory holding one pair of files per batch: a float32
+`vectors-NNNNN.npy` matrix, which can be memory-mapped, and a
+`records-NNNNN.parquet` table of IDs and JSON-encoded metadata in the same row
+order. `snapshot.json` lists the batches with the namespace, dimension and
+vector count, and is written last, so a directory without it is an unfinished
+export. Moving a namespace this way makes no embedding calls:
+
+    python -m app.vector_snapshot export .data/snapshots/documents --namespace documents
+    python -m app.vector_snapshot import .data/snapshots/documents
+
+Batches are fetched, written, read and upserted on a thread pool. Parquet
+support requires pyarrow.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from app.utils.logger import logger
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_NAME = "snapshot.json"
+# IDs per fetch request, well below Pinecone's request limits
+_FETCH_IDS = 100
+
+
+def export_namespace(
+    vector_store,
+    path: str,
+    namespace: Optional[str] = None,
+    batch_size: int = 10000,
+    workers: int = 4,
+) -> dict:
+    """
+    Write every vector of a namespace to a snapshot directory.
+
+    IDs are listed page by page and grouped into batches. Each batch is fetched
+    and written by a worker thread, with at most two batches per worker in
+    flight. Vectors deleted between listing and fetching are left out.
+
+    Args:
+        vector_store (VectorStore): Store to read from.
+        path (str): Snapshot directory. It must not already hold a snapshot.
+        namespace (Optional[str]): Namespace to export.
+        batch_size (int): Vectors per batch file.
+        workers (int): Batches fetched and written concurrently.
+
+    Returns:
+        dict: The snapshot manifest.
+
+    Raises:
+        FileExistsError: If `path` already holds a snapshot.
+    """
+    _pyarrow()  # Fail before any work if pyarrow is missing
+    if os.path.exists(os.path.join(path, MANIFEST_NAME)):
+        raise FileExistsError(f"{path} already holds a snapshot")
+    os.makedirs(path, exist_ok=True)
+
+    started = time.perf_counter()
+    batches = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snapshot-export") as executor:
+        in_flight: deque = deque()
+        for index, ids in enumerate(_rebatch(vector_store.list_ids(namespace), batch_size)):
+            in_flight.append(
+                executor.submit(_export_batch, vector_store, path, index, ids, namespace)
+            )
+            if len(in_flight) >= 2 * workers:  # Backpressure on listing
+                batches.append(in_flight.popleft().result())
+        while in_flight:
+            batches.append(in_flight.popleft().result())
+
+    batches = [batch for batch in batches if batch["count"]]
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "namespace": namespace or "",
+        "dimension": vector_store.dimension,
+        "count": sum(batch["count"] for batch in batches),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "batches": batches,
+    }
+    _write_manifest(path, manifest)
+    logger.info(
+        f"Exported {manifest['count']} vectors from namespace '{manifest['namespace']}' "
+        f"to {path} in {time.perf_counter() - started:.1f}s"
+    )
+    return manifest
+
+
+def import_snapshot(
+    vector_store,
+    path: str,
+    namespace: Optional[str] = None,
+    workers: int = 4,
+) -> dict:
+    """
+    Upsert every vector of a snapshot directory.
+
+    Batch files are memory-mapped and upserted by worker threads. Upserts
+    overwrite by ID, so an import that failed part way can simply be run again.
+
+    Args:
+        vector_store (VectorStore): Store to write to.
+        path (str): Snapshot directory.
+        namespace (Optional[str]): Namespace to write to, defaults to the one the
+            snapshot was exported from.
+        workers (int): Batches read and upserted concurrently.
+
+    Returns:
+        dict: The snapshot manifest.
+
+    Raises:
+        FileNotFoundError: If `path` holds no finished snapshot.
+        ValueError: If the snapshot format or dimension does not match.
+        VectorUpsertError: If a batch still fails after all retries.
+    """
+    _pyarrow()
+    manifest = read_manifest(path)
+    if manifest["dimension"] != vector_store.dimension:
+        raise ValueError(
+            f"Snapshot vectors have dimension {manifest['dimension']}, "
+            f"the vector store expects {vector_store.dimension}"
+        )
+    target = manifest["namespace"] if namespace is None else namespace
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snapshot-import") as executor:
+        # Consume the results so the first failed batch raises here
+        for _ in executor.map(
+            lambda batch: _import_batch(vector_store, path, batch, target or None),
+            manifest["batches"],
+        ):
+            pass
+    vector_store.flush()
+    logger.info(
+        f"Imported {manifest['count']} vectors from {path} into namespace '{target}' "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+    return manifest
+
+
+def read_manifest(path: str) -> dict:
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"{path} holds no finished snapshot ({MANIFEST_NAME} is missing)")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format: {manifest.get('format')}")
+    return manifest
+
+
+def _export_batch(vector_store, path: str, index: int, ids: List[str], namespace) -> dict:
+    pa, pq = _pyarrow()
+    fetched = {}
+    for start in range(0, len(ids), _FETCH_IDS):
+        fetched.update(vector_store.fetch(ids[start : start + _FETCH_IDS], namespace=namespace))
+    ids = [vector_id for vector_id in ids if vector_id in fetched]
+    batch = {
+        "vectors": f"vectors-{index:05d}.npy",
+        "records": f"records-{index:05d}.parquet",
+        "count": len(ids),
+    }
+    if not ids:
+        return batch
+
+    vectors = np.empty((len(ids), vector_store.dimension), dtype=np.float32)
+    for row, vector_id in enumerate(ids):
+        vectors[row] = fetched[vector_id]["values"]
+    np.save(os.path.join(path, batch["vectors"]), vectors)
+    records = pa.table(
+        {
+            "id": pa.array(ids, type=pa.string()),
+            # Metadata fields differ between vectors, so each row is stored as JSON
+            "metadata": pa.array(
+                [json.dumps(fetched[vector_id]["metadata"]) for vector_id in ids],
+                type=pa.string(),
+            ),
+        }
+    )
+    pq.write_table(records, os.path.join(path, batch["records"]))
+    return batch
+
+
+def _import_batch(vector_store, path: str, batch: dict, namespace: Optional[str]):
+    _, pq = _pyarrow()
+    vectors = np.load(os.path.join(path, batch["vectors"]), mmap_mode="r")
+    records = pq.read_table(os.path.join(path, batch["records"]))
+    ids = records.column("id").to_pylist()
+    metadata = [json.loads(value) for value in records.column("metadata").to_pylist()]
+    if len(ids) != len(vectors):
+        raise ValueError(f"{batch['records']} has {len(ids)} IDs for {len(vectors)} vectors")
+    vector_store.upsert_embeddings(ids, vectors, metadata=metadata, namespace=namespace)
+
+
+def _rebatch(pages: Iterable[List[str]], size: int) -> Iterator[List[str]]:
+    """Regroup pages of IDs into lists of `size` IDs."""
+    batch: List[str] = []
+    for page in pages:
+        batch.extend(page)
+        while len(batch) >= size:
+            yield batch[:size]
+            batch = batch[size:]
+    if batch:
+        yield batch
+
+
+def _write_manifest(path: str, manifest: dict):
+    temporary = os.path.join(path, f"{MANIFEST_NAME}.tmp")
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temporary, os.path.join(path, MANIFEST_NAME))
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Vector snapshots need pyarrow: pip install pyarrow") from None
+    return pyarrow, pyarrow.parquet
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="Snapshot directory")
+    parser.add_argument(
+        "--namespace",
+        help="Namespace to export, or to import into (defaults to the exported one)",
+    )
+    parser.add_argument("--batch-size", type=int, default=10000, help="Vectors per batch file")
+    parser.add_argument("--workers", type=int, default=4, help="Batches processed concurrently")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    from app.services.dependencies import get_vector_store
+
+    vector_store = get_vector_store()
+    try:
+        if args.command == "export":
+            manifest = export_namespace(
+                vector_store, args.path, args.namespace, args.batch_size, args.workers
+            )
+        else:
+            manifest = import_snapshot(vector_store, args.path, args.namespace, args.workers)
+    except (FileExistsError, FileNotFoundError, ImportError, ValueError) as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    print(f"{manifest['count']} vectors in {len(manifest['batches'])} batches")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
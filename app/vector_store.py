@@ -1,48 +1,455 @@
-import pinecone
-from pinecone.exceptions import NotFoundException
+import asyncio
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+import numpy as np
+
 from app.config import settings
+from app.utils import metrics
+from app.utils.logger import logger
+from app.utils.retry import is_transient
+from app.vector_backends import QueryResult, VectorBackend, create_backend
+from app.vector_reduction import stored_dimension
+
+# Wait between attempts to open a backend's async client after one failed
+_ASYNC_CLIENT_RETRY_SECONDS = 60.0
+
+
+@dataclass
+class UpsertBatchResult:
+    batch_index: int
+    ids: List[str]
+    attempts: int = 0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class VectorUpsertError(RuntimeError):
+    """Raised when some upsert batches failed after all retries."""
+
+    def __init__(self, results: List[UpsertBatchResult]):
+        self.results = results
+        failed = [result for result in results if not result.ok]
+        super().__init__(
+            f"{len(failed)} of {len(results)} upsert batches failed: {failed[0].error}"
+        )
 
 
 class VectorStore:
-    def __init__(self):
-        # Initialize Pinecone instance
-        self.pc = pinecone.Pinecone(
-            api_key=settings.PINECONE_API_KEY, environment=settings.PINECONE_ENVIRONMENT
+    def __init__(self, backend: Optional[VectorBackend] = None):
+        # Pinecone by default, or the in-process index when VECTOR_BACKEND=local.
+        # The backend connects on first use so construction makes no network calls.
+        self._backend = backend
+        self._backend_lock = threading.Lock()
+        self.dimension = stored_dimension()
+        # Bumped on every write so caches can tell when a namespace changed
+        self._generations: Dict[str, int] = {}
+        self._generation_lock = threading.Lock()
+        self.batch_size = settings.VECTOR_UPSERT_BATCH_SIZE
+        self.max_batch_bytes = settings.VECTOR_UPSERT_MAX_BYTES
+        self.max_retries = max(1, settings.VECTOR_UPSERT_MAX_RETRIES)
+        self._upsert_executor = ThreadPoolExecutor(
+            max_workers=settings.VECTOR_UPSERT_CONCURRENCY,
+            thread_name_prefix="vector-upsert",
         )
+        self._query_executor = ThreadPoolExecutor(
+            max_workers=settings.VECTOR_QUERY_CONCURRENCY,
+            thread_name_prefix="vector-query",
+        )
+        # Created on the event loop by the first async query
+        self._async_open_lock: Optional[asyncio.Lock] = None
+        self._async_retry_at = 0.0
 
-        print(self.pc.list_indexes())
-        print(settings.PINECONE_INDEX)
-        # Check if the index exists, create if it doesn't
-        if not any(
-            index["name"] == settings.PINECONE_INDEX for index in self.pc.list_indexes()
-        ):
-            self.pc.create_index(
-                name=settings.PINECONE_INDEX,
-                dimension=settings.VECTOR_DIMENSION,
-                spec={
-                    "metric": "cosine",
-                    "replicas": 1,
-                    "serverless": {
-                        "cloud": settings.PINECONE_CLOUD,
-                        "region": settings.PINECONE_REGION,
-                    },
-                },
-            )
+    @property
+    def backend(self) -> VectorBackend:
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = create_backend(settings.VECTOR_BACKEND)
+        return self._backend
+
+    def warmup(self):
+        """Connect to the backend ahead of the first request."""
+        self.backend.warmup()
+
+    async def aopen(self):
+        """Connect to the backend and open its async clients on the running event loop."""
+        backend = await asyncio.to_thread(lambda: self.backend)
+        await self._open_async_client(backend)
+
+    async def aclose(self):
+        if self._backend is not None:
+            await self._backend.aclose()
+
+    def generation(self, namespace: Optional[str] = None) -> int:
+        """Return the write generation of a namespace in this process."""
+        return self._generations.get(namespace or "", 0)
+
+    def upsert_embeddings(
+        self, ids, embeddings, metadata=None, namespace=None, raise_on_error=True
+    ) -> List[UpsertBatchResult]:
+        """
+        Upsert vectors in batches sent concurrently, retrying transient errors.
+
+        Batches are capped by VECTOR_UPSERT_BATCH_SIZE vectors and an estimate of
+        VECTOR_UPSERT_MAX_BYTES serialized bytes, so large documents stay under the
+        request size limit.
+
+        Args:
+            ids (List[str]): Vector IDs.
+            embeddings: One float32 vector per ID, as a 2-D array or a list of rows.
+            metadata (Optional[List[dict]]): One metadata dict per ID.
+            namespace (Optional[str]): Target namespace.
+            raise_on_error (bool): Raise VectorUpsertError if any batch failed.
+
+        Returns:
+            List[UpsertBatchResult]: The outcome of every batch, in order.
+        """
+        ids = list(ids)
+        metadata = list(metadata) if metadata else [{} for _ in ids]
+        batches = self._split_batches(ids, metadata)
         try:
-            self.index = self.pc.Index(settings.PINECONE_INDEX)
-        except NotFoundException as e:
-            # Handle the exception, log it, or raise a custom error
-            print(f"Error: {e}")
-            raise RuntimeError(
-                "Pinecone index not found. Please check the index name and configuration."
+            if len(batches) == 1:
+                results = [self._upsert_batch(0, batches[0], ids, embeddings, metadata, namespace)]
+            else:
+                results = list(
+                    self._upsert_executor.map(
+                        lambda item: self._upsert_batch(
+                            item[0], item[1], ids, embeddings, metadata, namespace
+                        ),
+                        enumerate(batches),
+                    )
+                )
+        finally:
+            self._bump_generation(namespace)
+
+        if raise_on_error and any(not result.ok for result in results):
+            raise VectorUpsertError(results)
+        return results
+
+    def buffered_writer(self, namespace: Optional[str] = None) -> "BufferedVectorWriter":
+        """Create a writer that buffers vectors across calls and upserts them in bulk."""
+        return BufferedVectorWriter(self, namespace=namespace)
+
+    def query_embeddings(
+        self, vector, top_k=10, namespace=None, filter=None
+    ) -> QueryResult:
+        with metrics.VECTOR_STORE_SECONDS.labels("query").time():
+            return self.backend.query(vector, top_k=top_k, namespace=namespace, filter=filter)
+
+    async def aquery_embeddings(
+        self, vector, top_k=10, namespace=None, filter=None
+    ) -> QueryResult:
+        """
+        Async `query_embeddings`. Uses the backend's async client when it has one,
+        otherwise runs the query on the query threads without blocking the event loop.
+        """
+        backend = self.backend
+        if not backend.async_queries:
+            await self._open_async_client(backend)
+        with metrics.VECTOR_STORE_SECONDS.labels("query").time():
+            if backend.async_queries:
+                return await backend.aquery(
+                    vector, top_k=top_k, namespace=namespace, filter=filter
+                )
+            return await asyncio.wrap_future(
+                self._query_executor.submit(
+                    backend.query, vector, top_k=top_k, namespace=namespace, filter=filter
+                )
             )
 
-        self.dimension = settings.VECTOR_DIMENSION
+    async def _open_async_client(self, backend: VectorBackend):
+        """
+        Open the backend's async client once, on the running event loop. After a
+        failed attempt queries run on threads, and the client is tried again once
+        _ASYNC_CLIENT_RETRY_SECONDS passed.
+        """
+        if time.monotonic() < self._async_retry_at:
+            return
+        if self._async_open_lock is None:
+            self._async_open_lock = asyncio.Lock()
+        async with self._async_open_lock:
+            if backend.async_queries or time.monotonic() < self._async_retry_at:
+                return
+            try:
+                await backend.aopen()
+            except Exception as e:
+                logger.warning(f"Could not open the async vector store client: {e}")
+            if not backend.async_queries:
+                self._async_retry_at = time.monotonic() + _ASYNC_CLIENT_RETRY_SECONDS
+
+    async def aquery_many(self, queries: List[dict]) -> List[Union[QueryResult, Exception]]:
+        """Async `query_many`, with at most VECTOR_QUERY_CONCURRENCY queries in flight."""
+        slots = asyncio.Semaphore(settings.VECTOR_QUERY_CONCURRENCY)
+
+        async def run(query: dict) -> Union[QueryResult, Exception]:
+            async with slots:
+                try:
+                    return await self.aquery_embeddings(**query)
+                except Exception as e:
+                    return e
+
+        return list(await asyncio.gather(*(run(query) for query in queries)))
+
+    def query_many(self, queries: List[dict]) -> List[Union[QueryResult, Exception]]:
+        """
+        Run several queries concurrently, at most VECTOR_QUERY_CONCURRENCY at a time.
+
+        Args:
+            queries (List[dict]): Keyword arguments of `query_embeddings` for each
+                query: "vector", and optionally "top_k", "namespace" and "filter".
 
-    def upsert_embeddings(self, ids, embeddings, metadata=None, namespace=None):
-        self.index.upsert(
-            vectors=zip(ids, embeddings, metadata or []), namespace=namespace
+        Returns:
+            List[Union[QueryResult, Exception]]: The result of every query in input
+                order, or the exception it raised.
+        """
+
+        def run(query: dict) -> Union[QueryResult, Exception]:
+            try:
+                return self.query_embeddings(**query)
+            except Exception as e:
+                return e
+
+        if len(queries) == 1:
+            return [run(queries[0])]
+        return list(self._query_executor.map(run, queries))
+
+    def fetch(self, ids: List[str], namespace: Optional[str] = None) -> Dict[str, dict]:
+        metrics.VECTOR_STORE_VECTORS.labels("fetch").inc(len(ids))
+        with metrics.VECTOR_STORE_SECONDS.labels("fetch").time():
+            return self.backend.fetch(ids, namespace=namespace)
+
+    def update_metadata(self, updates: Dict[str, dict], namespace: Optional[str] = None):
+        """
+        Set metadata fields of stored vectors, keeping their other fields.
+
+        Args:
+            updates (Dict[str, dict]): The fields to set, by vector ID. Missing IDs
+                are ignored.
+            namespace (Optional[str]): Namespace of the vectors.
+        """
+        if not updates:
+            return
+        metrics.VECTOR_STORE_VECTORS.labels("update").inc(len(updates))
+        try:
+            with metrics.VECTOR_STORE_SECONDS.labels("update").time():
+                list(
+                    self._upsert_executor.map(
+                        lambda item: self.backend.update_metadata(
+                            item[0], item[1], namespace=namespace
+                        ),
+                        updates.items(),
+                    )
+                )
+        finally:
+            self._bump_generation(namespace)
+
+    def list_ids(self, namespace: Optional[str] = None) -> Iterator[List[str]]:
+        """Yield the IDs stored in a namespace, a page at a time."""
+        return self.backend.list_ids(namespace=namespace)
+
+    def delete(self, ids: List[str], namespace: Optional[str] = None):
+        metrics.VECTOR_STORE_VECTORS.labels("delete").inc(len(ids))
+        try:
+            with metrics.VECTOR_STORE_SECONDS.labels("delete").time():
+                self.backend.delete(ids, namespace=namespace)
+        finally:
+            self._bump_generation(namespace)
+
+    def flush(self):
+        # Nothing can be buffered if the backend was never created
+        if self._backend is not None:
+            self._backend.flush()
+
+    def _split_batches(self, ids: List[str], metadata: List[dict]) -> List[range]:
+        """Split row positions into ranges capped by count and estimated request size."""
+        # REST requests serialize each float as JSON text, roughly 12 bytes apiece
+        vector_bytes = self.dimension * 12
+        batches = []
+        start = 0
+        size = 0
+        for i, vector_id in enumerate(ids):
+            item_bytes = vector_bytes + len(vector_id) + len(json.dumps(metadata[i], default=str))
+            if i > start and (i - start >= self.batch_size or size + item_bytes > self.max_batch_bytes):
+                batches.append(range(start, i))
+                start, size = i, 0
+            size += item_bytes
+        if start < len(ids) or not batches:
+            batches.append(range(start, len(ids)))
+        return batches
+
+    def _upsert_batch(self, batch_index, rows, ids, embeddings, metadata, namespace):
+        result = UpsertBatchResult(batch_index=batch_index, ids=[ids[i] for i in rows])
+        if not rows:
+            return result
+        metrics.VECTOR_STORE_VECTORS.labels("upsert").inc(len(rows))
+        for attempt in range(self.max_retries):
+            result.attempts = attempt + 1
+            try:
+                with metrics.VECTOR_STORE_SECONDS.labels("upsert").time():
+                    self.backend.upsert(
+                        result.ids,
+                        _take_rows(embeddings, rows),
+                        [metadata[i] for i in rows],
+                        namespace=namespace,
+                    )
+                result.error = None
+                return result
+            except Exception as e:
+                result.error = str(e)
+                if not is_transient(e) or attempt == self.max_retries - 1:
+                    break
+                delay = min(30.0, 0.5 * 2**attempt) * random.uniform(0.5, 1.0)
+                logger.warning(
+                    f"Upsert batch {batch_index} failed on attempt {attempt + 1}, "
+                    f"retrying in {delay:.2f}s: {str(e)}"
+                )
+                metrics.VECTOR_STORE_RETRIES.labels("upsert").inc()
+                time.sleep(delay)
+        logger.error(f"Upsert batch {batch_index} of {len(rows)} vectors failed: {result.error}")
+        return result
+
+    def _bump_generation(self, namespace: Optional[str]):
+        with self._generation_lock:
+            name = namespace or ""
+            self._generations[name] = self._generations.get(name, 0) + 1
+
+
+class _WriteGroup:
+    def __init__(self, size: int, on_written, on_failed):
+        self.remaining = size
+        self.error: Optional[str] = None
+        self.on_written = on_written
+        self.on_failed = on_failed
+
+
+class BufferedVectorWriter:
+    """
+    Buffers vectors across calls (for example across documents) and upserts them
+    in full batches in the background.
+
+    Each `add` call forms a group. Once every vector of a group has been written,
+    its `on_written` callback runs; if any of its batches failed, `on_failed` runs
+    instead. Callbacks always run on the thread calling `add` or `flush`, so
+    callers need no locking of their own. At most VECTOR_UPSERT_CONCURRENCY
+    flushes are in flight; `add` blocks beyond that.
+    """
+
+    def __init__(self, vector_store: VectorStore, namespace: Optional[str] = None):
+        self.vector_store = vector_store
+        self.namespace = namespace
+        self.flush_size = vector_store.batch_size * settings.VECTOR_UPSERT_CONCURRENCY
+        self._ids: List[str] = []
+        self._embeddings: list = []
+        self._metadata: List[dict] = []
+        self._groups: List[_WriteGroup] = []
+        self._in_flight = []
+        self._completed: List[_WriteGroup] = []
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(settings.VECTOR_UPSERT_CONCURRENCY)
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.VECTOR_UPSERT_CONCURRENCY,
+            thread_name_prefix="vector-writer",
         )
 
-    def query_embeddings(self, vector, top_k=10):
-        return self.index.query(vector=vector, top_k=top_k, include_metadata=True)
+    def add(
+        self,
+        ids: List[str],
+        embeddings,
+        metadata: Optional[List[dict]] = None,
+        on_written: Optional[Callable[[], None]] = None,
+        on_failed: Optional[Callable[[str], None]] = None,
+    ):
+        """
+        Buffer a group of vectors.
+
+        Args:
+            ids (List[str]): Vector IDs.
+            embeddings: One vector per ID.
+            metadata (Optional[List[dict]]): One metadata dict per ID.
+            on_written (Optional[Callable[[], None]]): Called once all vectors are written.
+            on_failed (Optional[Callable[[str], None]]): Called with the error if any failed.
+        """
+        group = _WriteGroup(len(ids), on_written, on_failed)
+        if not ids:
+            with self._lock:
+                self._completed.append(group)
+        self._ids.extend(ids)
+        self._embeddings.extend(embeddings)
+        self._metadata.extend(metadata or [{} for _ in ids])
+        self._groups.extend([group] * len(ids))
+        if len(self._ids) >= self.flush_size:
+            self._submit()
+        self._run_callbacks()
+
+    def flush(self):
+        """Write everything buffered, wait for all writes and run pending callbacks."""
+        self._submit()
+        for future in list(self._in_flight):
+            future.result()
+        self._in_flight = []
+        self._run_callbacks()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+    def _submit(self):
+        if not self._ids:
+            return
+        batch = (self._ids, self._embeddings, self._metadata, self._groups)
+        self._ids, self._embeddings, self._metadata, self._groups = [], [], [], []
+        with metrics.INGEST_STAGE_WAIT_SECONDS.labels("upsert").time():
+            self._slots.acquire()  # Backpressure
+        self._in_flight = [future for future in self._in_flight if not future.done()]
+        self._in_flight.append(self._executor.submit(self._write, *batch))
+
+    def _write(self, ids, embeddings, metadata, groups):
+        try:
+            try:
+                results = self.vector_store.upsert_embeddings(
+                    ids, embeddings, metadata, namespace=self.namespace, raise_on_error=False
+                )
+                errors = {}
+                for result in results:
+                    for vector_id in result.ids:
+                        errors[vector_id] = result.error
+            except Exception as e:
+                errors = {vector_id: str(e) for vector_id in ids}
+            with self._lock:
+                for vector_id, group in zip(ids, groups):
+                    if errors.get(vector_id):
+                        group.error = errors[vector_id]
+                    group.remaining -= 1
+                    if group.remaining == 0:
+                        self._completed.append(group)
+        finally:
+            self._slots.release()
+
+    def _run_callbacks(self):
+        with self._lock:
+            completed, self._completed = self._completed, []
+        for group in completed:
+            try:
+                if group.error is None:
+                    if group.on_written:
+                        group.on_written()
+                elif group.on_failed:
+                    group.on_failed(group.error)
+            except Exception as e:
+                logger.error(f"Error in vector writer callback: {str(e)}")
+
+
+def _take_rows(embeddings, rows: range):
+    """Slice a batch out of an array without copying, or out of a list of rows."""
+    if isinstance(embeddings, np.ndarray):
+        return embeddings[rows.start : rows.stop]
+    return [embeddings[i] for i in rows]
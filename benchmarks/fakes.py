@@ -0,0 +1,272 @@
+"""
+Local stand-ins for the external services, so the pipeline can be benchmarked
+without network access: an embedding provider, a Pinecone index and an S3 client.
+"""
+
+import hashlib
+import io
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.vector_backends.local_backend import _matches
+
+_WORDS = (
+    "vector index query embedding document chunk latency throughput batch cache "
+    "storage search model token paragraph section report metric service request "
+    "response memory process thread network region bucket object version record"
+).split()
+
+
+class FakeEmbeddings:
+    """
+    Deterministic embedding provider with the `embed_documents`/`embed_query`
+    interface of LangChain embeddings.
+
+    Each call sleeps `latency_ms` plus `per_text_ms` per text to model a remote
+    API. Vectors are derived from a hash of the text, so identical texts always
+    get identical vectors, and come back as lists of floats like the real clients.
+    """
+
+    def __init__(
+        self,
+        dimension: int,
+        latency_ms: float = 20.0,
+        per_text_ms: float = 0.05,
+        max_batch_size: int = 2048,
+    ):
+        self.dimension = dimension
+        self.latency = latency_ms / 1000.0
+        self.per_text = per_text_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.calls = 0
+        self.texts = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if len(texts) > self.max_batch_size:
+            raise ValueError(
+                f"Batch of {len(texts)} texts exceeds the provider limit of {self.max_batch_size}"
+            )
+        with self._lock:
+            self.calls += 1
+            self.texts += len(texts)
+        time.sleep(self.latency + self.per_text * len(texts))
+        return [self._vector(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def _vector(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+
+
+class FakePineconeIndex:
+    """
+    In-memory stand-in for a Pinecone `Index`, answering exact cosine queries with
+    NumPy. Every request sleeps `latency_ms` to model the network round trip.
+    """
+
+    def __init__(self, dimension: int, latency_ms: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency_ms / 1000.0
+        self._namespaces: Dict[str, Dict[str, tuple]] = {}
+        self._matrices: Dict[str, tuple] = {}  # Cached (ids, normalized rows) per namespace
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors, namespace: Optional[str] = None):
+        self._sleep()
+        with self._lock:
+            records = self._namespaces.setdefault(namespace or "", {})
+            for vector_id, values, metadata in vectors:
+                records[vector_id] = (np.asarray(values, dtype=np.float32), metadata or {})
+            self._matrices.pop(namespace or "", None)
+        return {"upserted_count": len(vectors)}
+
+    def query(
+        self,
+        vector,
+        top_k: int = 10,
+        namespace: Optional[str] = None,
+        filter: Optional[dict] = None,
+        include_metadata: bool = True,
+        include_values: bool = False,
+    ):
+        self._sleep()
+        with self._lock:
+            records = self._namespaces.get(namespace or "", {})
+            ids, matrix = self._matrix(namespace or "")
+        if not ids:
+            return SimpleNamespace(matches=[])
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = matrix @ query
+        rows = np.argsort(-scores)
+        matches = []
+        for row in rows:
+            values, metadata = records[ids[row]]
+            if filter and not _matches(metadata, filter):
+                continue
+            matches.append(
+                SimpleNamespace(
+                    id=ids[row],
+                    score=float(scores[row]),
+                    metadata=metadata if include_metadata else None,
+                    values=values.tolist() if include_values else [],
+                )
+            )
+            if len(matches) == top_k:
+                break
+        return SimpleNamespace(matches=matches)
+
+    def fetch(self, ids: List[str], namespace: Optional[str] = None):
+        self._sleep()
+        with self._lock:
+            records = self._namespaces.get(namespace or "", {})
+            return SimpleNamespace(
+                vectors={
+                    vector_id: SimpleNamespace(
+                        values=records[vector_id][0].tolist(), metadata=records[vector_id][1]
+                    )
+                    for vector_id in ids
+                    if vector_id in records
+                }
+            )
+
+    def delete(self, ids: List[str], namespace: Optional[str] = None):
+        self._sleep()
+        with self._lock:
+            records = self._namespaces.get(namespace or "", {})
+            for vector_id in ids:
+                records.pop(vector_id, None)
+            self._matrices.pop(namespace or "", None)
+
+    def update(self, id: str, set_metadata: Optional[dict] = None, namespace: Optional[str] = None):
+        self._sleep()
+        with self._lock:
+            records = self._namespaces.get(namespace or "", {})
+            if id in records and set_metadata:
+                values, metadata = records[id]
+                records[id] = (values, {**metadata, **set_metadata})
+        return {}
+
+    def list(self, namespace: str = "", limit: int = 100):
+        self._sleep()
+        with self._lock:
+            ids = list(self._namespaces.get(namespace or "", {}))
+        for start in range(0, len(ids), limit):
+            yield ids[start : start + limit]
+
+    def count(self, namespace: Optional[str] = None) -> int:
+        return len(self._namespaces.get(namespace or "", {}))
+
+    def _matrix(self, namespace: str):
+        # Caller holds the lock
+        if namespace not in self._matrices:
+            records = self._namespaces.get(namespace, {})
+            ids = list(records)
+            matrix = np.zeros((len(ids), self.dimension), dtype=np.float32)
+            for row, vector_id in enumerate(ids):
+                matrix[row] = records[vector_id][0]
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._matrices[namespace] = (ids, matrix / np.where(norms == 0, 1.0, norms))
+        return self._matrices[namespace]
+
+    def _sleep(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class _Body(io.BytesIO):
+    """Streaming body with the `read`/`iter_chunks`/`close` methods of botocore's."""
+
+    def iter_chunks(self, chunk_size: int = 1024):
+        while True:
+            data = self.read(chunk_size)
+            if not data:
+                return
+            yield data
+
+
+class FakeS3Client:
+    """
+    In-memory stand-in for the boto3 S3 client methods the fetcher uses:
+    paginated `list_objects_v2` listings and `get_object`.
+    """
+
+    def __init__(self, objects: Dict[str, bytes], page_size: int = 1000, latency_ms: float = 0.0):
+        self.objects = objects
+        self.page_size = page_size
+        self.latency = latency_ms / 1000.0
+        self.last_modified = datetime.now(timezone.utc)
+
+    def get_paginator(self, operation: str):
+        if operation != "list_objects_v2":
+            raise ValueError(f"Unsupported operation: {operation}")
+        return SimpleNamespace(paginate=self._paginate)
+
+    def get_object(self, Bucket: str, Key: str) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        data = self.objects[Key]
+        return {
+            "Body": _Body(data),
+            "ETag": self._etag(data),
+            "ContentLength": len(data),
+            "LastModified": self.last_modified,
+        }
+
+    def _paginate(self, Bucket: str, Prefix: str = ""):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        for start in range(0, len(keys), self.page_size):
+            yield {
+                "Contents": [
+                    {
+                        "Key": key,
+                        "ETag": self._etag(self.objects[key]),
+                        "Size": len(self.objects[key]),
+                        "LastModified": self.last_modified,
+                    }
+                    for key in keys[start : start + self.page_size]
+                ]
+            }
+
+    @staticmethod
+    def _etag(data: bytes) -> str:
+        return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+def make_corpus(documents: int, document_bytes: int, seed: int = 0) -> Dict[str, bytes]:
+    """
+    Generate synthetic text documents made of paragraphs of random words.
+
+    Args:
+        documents (int): Number of documents.
+        document_bytes (int): Approximate size of each document.
+        seed (int): Random seed, so runs are comparable.
+
+    Returns:
+        Dict[str, bytes]: UTF-8 document bodies by S3 key.
+    """
+    rng = random.Random(seed)
+    corpus = {}
+    for i in range(documents):
+        paragraphs, size = [], 0
+        while size < document_bytes:
+            paragraph = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(20, 200)))
+            paragraphs.append(paragraph.capitalize() + ".")
+            size += len(paragraph) + 3
+        corpus[f"corpus/doc-{i:06d}.txt"] = "\n\n".join(paragraphs).encode("utf-8")
+    return corpus
+
+
+def make_queries(count: int, seed: int = 0) -> List[str]:
+    """Generate short random queries over the corpus vocabulary."""
+    rng = random.Random(seed + 1)
+    return [" ".join(rng.choice(_WORDS) for _ in range(rng.randint(3, 10))) for _ in range(count)]
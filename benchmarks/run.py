@@ -0,0 +1,263 @@
+"""
+Offline end-to-end benchmark of ingestion and search.
+
+Runs `DocumentProcessor.process_documents` over a synthetic corpus served by a
+local S3 stand-in, then sends queries through the `/api/v1/search` route. The
+embedding provider and the Pinecone index are replaced by local stand-ins with
+configurable latency. Results are written as JSON and can be compared against
+a saved baseline:
+
+    python -m benchmarks.run --output benchmarks/results/baseline.json
+    python -m benchmarks.run --baseline benchmarks/results/baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import numpy as np
+
+# Metrics compared against a baseline, and whether higher values are better
+_COMPARED_METRICS = {
+    ("ingest", "docs_per_second"): True,
+    ("ingest", "chunks_per_second"): True,
+    ("search", "queries_per_second"): True,
+    ("search", "p50_ms"): False,
+    ("search", "p95_ms"): False,
+    ("search", "p99_ms"): False,
+    ("process", "peak_rss_mb"): False,
+}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=200, help="Documents in the corpus")
+    parser.add_argument("--document-bytes", type=int, default=20000, help="Approximate size of each document")
+    parser.add_argument("--queries", type=int, default=500, help="Search requests to send")
+    parser.add_argument("--search-concurrency", type=int, default=1, help="Threads sending search requests")
+    parser.add_argument("--dimension", type=int, default=384, help="Embedding dimension")
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0, help="Fixed latency per provider call")
+    parser.add_argument("--embed-per-text-ms", type=float, default=0.05, help="Added latency per embedded text")
+    parser.add_argument("--embed-max-batch", type=int, default=2048, help="Largest batch the provider accepts")
+    parser.add_argument("--index-latency-ms", type=float, default=5.0, help="Latency per index request")
+    parser.add_argument("--s3-latency-ms", type=float, default=5.0, help="Latency per get_object call")
+    parser.add_argument(
+        "--vector-backend", choices=["pinecone", "local"], default="pinecone",
+        help="Use the Pinecone backend over the in-memory stand-in, or the local index",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the corpus and queries")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare the results against this JSON file")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="Allowed regression, in percent")
+    parser.add_argument(
+        "--fail-on-regression", action="store_true",
+        help="Exit with status 1 when a metric regressed beyond the tolerance",
+    )
+    return parser.parse_args(argv)
+
+
+def configure_environment(args: argparse.Namespace, workdir: str):
+    """Point the settings at local, throwaway state. Must run before `app` is imported."""
+    os.environ.update(
+        {
+            "OPENAI_API_KEY": "benchmark",
+            "PINECONE_API_KEY": "benchmark",
+            "VECTOR_DIMENSION": str(args.dimension),
+            "VECTOR_BACKEND": args.vector_backend,
+            "LOCAL_INDEX_PATH": "",
+            "S3_ACCESS_KEY": "benchmark",
+            "S3_SECRET_KEY": "benchmark",
+            "S3_REGION": "us-east-1",
+            "S3_BUCKET": "benchmark",
+            "S3_ENDPOINT": "http://localhost",
+            "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+            "EMBEDDING_CACHE_PATH": "",
+            "DOCUMENT_TRACKER_BACKEND": "manifest",
+            "DOCUMENT_MANIFEST_PATH": os.path.join(workdir, "manifest.sqlite3"),
+            "DOCUMENT_MANIFEST_ALLOW_EPHEMERAL": "true",  # The work directory is temporary
+            "WARMUP_ON_STARTUP": "false",
+        }
+    )
+
+
+def run(args: argparse.Namespace) -> dict:
+    from fastapi.testclient import TestClient
+
+    import app.services.document_fetcher as document_fetcher
+    from app.config import settings
+    from app.document_processor import DocumentProcessor
+    from app.main import app
+    from app.services import dependencies
+    from app.services.embedding import EmbeddingService
+    from app.services.manifest_tracker import ManifestDocumentTracker
+    from app.vector_backends import create_backend
+    from app.vector_backends.pinecone_backend import PineconeBackend
+    from app.vector_store import VectorStore
+    from benchmarks.fakes import (
+        FakeEmbeddings,
+        FakePineconeIndex,
+        FakeS3Client,
+        make_corpus,
+        make_queries,
+    )
+
+    corpus = make_corpus(args.documents, args.document_bytes, seed=args.seed)
+    document_fetcher._s3_client = FakeS3Client(corpus, latency_ms=args.s3_latency_ms)
+
+    provider = FakeEmbeddings(
+        args.dimension,
+        latency_ms=args.embed_latency_ms,
+        per_text_ms=args.embed_per_text_ms,
+        max_batch_size=args.embed_max_batch,
+    )
+    embedding_service = EmbeddingService()
+    embedding_service._providers["openai"] = provider
+
+    if args.vector_backend == "pinecone":
+        backend = PineconeBackend(
+            index=FakePineconeIndex(args.dimension, latency_ms=args.index_latency_ms)
+        )
+    else:
+        backend = create_backend("local")
+    vector_store = VectorStore(backend=backend)
+    tracker = ManifestDocumentTracker(settings.DOCUMENT_MANIFEST_PATH, allow_ephemeral=True)
+    processor = DocumentProcessor(embedding_service, vector_store, tracker)
+
+    # Ingestion
+    started = time.perf_counter()
+    stats = processor.process_documents()
+    ingest_seconds = time.perf_counter() - started
+    processor.close()
+    ingest = {
+        "documents": stats["processed"],
+        "skipped": stats["skipped"],
+        "chunks": stats["chunks"],
+        "corpus_mb": round(sum(len(body) for body in corpus.values()) / 1e6, 3),
+        "seconds": round(ingest_seconds, 3),
+        "docs_per_second": round(stats["processed"] / ingest_seconds, 3),
+        "chunks_per_second": round(stats["chunks"] / ingest_seconds, 3),
+        "provider_calls": provider.calls,
+    }
+
+    # Search, through the FastAPI route with the same services
+    app.dependency_overrides[dependencies.get_embedding_service] = lambda: embedding_service
+    app.dependency_overrides[dependencies.get_vector_store] = lambda: vector_store
+    queries = make_queries(args.queries, seed=args.seed)
+    latencies = []
+    errors = 0
+
+    def search(query: str):
+        client = TestClient(app)
+        request_started = time.perf_counter()
+        response = client.post("/api/v1/search", json={"query": query, "top_k": 10})
+        return time.perf_counter() - request_started, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.search_concurrency)) as executor:
+        for latency, status in executor.map(search, queries):
+            latencies.append(latency * 1000.0)
+            errors += status != 200
+    search_seconds = time.perf_counter() - started
+    app.dependency_overrides.clear()
+    embedding_service.close()
+
+    search_results = {
+        "queries": len(queries),
+        "errors": errors,
+        "seconds": round(search_seconds, 3),
+        "queries_per_second": round(len(queries) / search_seconds, 3) if queries else 0.0,
+    }
+    for percentile in (50, 95, 99):
+        value = float(np.percentile(latencies, percentile)) if latencies else 0.0
+        search_results[f"p{percentile}_ms"] = round(value, 3)
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "settings": {
+            name: value
+            for name, value in settings.model_dump().items()
+            if not any(secret in name for secret in ("KEY", "SECRET", "PASSWORD"))
+        },
+        "ingest": ingest,
+        "search": search_results,
+        "process": {"peak_rss_mb": round(_peak_rss_mb(), 1)},
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Print each compared metric next to its baseline value.
+
+    Returns:
+        List[str]: The metrics that regressed by more than `tolerance` percent.
+    """
+    regressions = []
+    print(f"{'metric':<28}{'baseline':>14}{'current':>14}{'change':>10}")
+    for (section, name), higher_is_better in _COMPARED_METRICS.items():
+        before = baseline.get(section, {}).get(name)
+        after = results.get(section, {}).get(name)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before * 100.0 if before else 0.0
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(f"{section}.{name}")
+        print(f"{section + '.' + name:<28}{before:>14.3f}{after:>14.3f}{change:>+9.1f}%{flag}")
+    return regressions
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="embedding-benchmark-") as workdir:
+        configure_environment(args, workdir)
+        results = run(args)
+
+    print(json.dumps({key: results[key] for key in ("ingest", "search", "process")}, indent=2))
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions and args.fail_on_regression:
+            print(f"Regressed beyond {args.tolerance}%: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import os
+
+# Local, throwaway settings; they must be in place before `app` is imported
+os.environ.update(
+    {
+        "OPENAI_API_KEY": "test",
+        "PINECONE_API_KEY": "test",
+        "VECTOR_DIMENSION": "16",
+        "VECTOR_BACKEND": "local",
+        "LOCAL_INDEX_PATH": "",
+        "S3_ACCESS_KEY": "test",
+        "S3_SECRET_KEY": "test",
+        "S3_REGION": "us-east-1",
+        "S3_BUCKET": "test",
+        "S3_ENDPOINT": "http://localhost",
+        "LOG_LEVEL": "WARNING",
+        "EMBEDDING_CACHE_PATH": "",
+        "EMBEDDING_MICRO_BATCHING": "false",
+        "WARMUP_ON_STARTUP": "false",
+    }
+)
+
+import pytest  # noqa: E402
+
+from benchmarks.fakes import FakeEmbeddings, FakeS3Client  # noqa: E402
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """An in-memory bucket used by the document fetcher."""
+    import app.services.document_fetcher as document_fetcher
+
+    client = FakeS3Client({})
+    monkeypatch.setattr(document_fetcher, "_s3_client", client)
+    return client
+
+
+@pytest.fixture
+def make_processor(tmp_path):
+    """Build a document processor on a local index, fake embeddings and a manifest tracker."""
+    from app.document_processor import DocumentProcessor
+    from app.services.embedding import EmbeddingService
+    from app.services.manifest_tracker import ManifestDocumentTracker
+    from app.vector_backends import create_backend
+    from app.vector_store import VectorStore
+
+    def make(dedup_index=None):
+        embedding_service = EmbeddingService()
+        embedding_service._providers["openai"] = FakeEmbeddings(16)
+        vector_store = VectorStore(backend=create_backend("local"))
+        tracker = ManifestDocumentTracker(
+            str(tmp_path / "manifest.sqlite3"), allow_ephemeral=True
+        )
+        return DocumentProcessor(
+            embedding_service, vector_store, tracker, dedup_index=dedup_index
+        )
+
+    return make
@@ -0,0 +1,121 @@
+from app.bulk_ingest import format_report, hash_shard, plan_shards, record_shard, shard_batches
+
+
+def _document(index: int) -> bytes:
+    return " ".join(f"word{index}-{j}" for j in range(300)).encode("utf-8")
+
+
+def test_download_errors_count_as_failed(s3, make_processor, monkeypatch):
+    s3.objects.update({f"docs/{i}.txt": _document(i) for i in range(4)})
+    get_object = s3.get_object
+
+    def flaky_get_object(Bucket, Key):
+        if Key == "docs/2.txt":
+            raise ConnectionError("connection reset")
+        return get_object(Bucket=Bucket, Key=Key)
+
+    monkeypatch.setattr(s3, "get_object", flaky_get_object)
+    processor = make_processor()
+
+    stats = processor.process_documents("docs/")
+
+    assert stats["processed"] == 3
+    assert stats["failed"] == 1
+    assert stats["skipped"] == 0
+    assert "docs/2.txt" not in processor.document_tracker.get_processed_documents()
+
+    # The failed document is picked up by the next run
+    monkeypatch.setattr(s3, "get_object", get_object)
+    stats = processor.process_documents("docs/")
+    assert stats["processed"] == 1
+    assert stats["failed"] == 0
+
+
+def test_shard_with_failed_documents_is_not_checkpointed():
+    checkpoint = {"shards": ["a", "b"], "completed": {}}
+    result = {"stats": {"processed": 3, "failed": 1}, "seconds": 1.0, "cancelled": False}
+
+    assert not record_shard(checkpoint, "a", result)
+    assert checkpoint["completed"] == {}
+
+    result["stats"]["failed"] = 0
+    assert record_shard(checkpoint, "a", result)
+    assert checkpoint["completed"]["a"]["processed"] == 3
+
+
+def test_cancelled_shard_is_not_checkpointed():
+    checkpoint = {"shards": ["a"], "completed": {}}
+    result = {"stats": {"processed": 1, "failed": 0}, "seconds": 1.0, "cancelled": True}
+
+    assert not record_shard(checkpoint, "a", result)
+    assert checkpoint["completed"] == {}
+
+
+def test_report_lists_failed_documents_and_incomplete_shards():
+    report = {
+        "shards": 2,
+        "completed": 1,
+        "finished": ["a"],
+        "failed_shards": [],
+        "incomplete": ["b"],
+        "seconds": 2.0,
+        "queued": 5,
+        "processed": 4,
+        "skipped": 0,
+        "failed": 1,
+        "chunks": 8,
+        "reused": 0,
+        "deduplicated": 0,
+    }
+
+    text = format_report(report)
+
+    assert "1 with failed documents" in text
+    assert "4 processed, 0 skipped, 1 failed" in text
+    assert "Incomplete   b" in text
+
+
+def test_hash_shards_share_one_listing(s3, monkeypatch):
+    s3.objects.update({f"docs/{i}.txt": b"text" for i in range(50)})
+    s3.objects["other/0.txt"] = b"text"
+    listings = []
+    paginate = s3._paginate
+
+    def counting_paginate(Bucket, Prefix=""):
+        listings.append(Prefix)
+        return paginate(Bucket=Bucket, Prefix=Prefix)
+
+    monkeypatch.setattr(s3, "_paginate", counting_paginate)
+    shards = plan_shards("docs/", None, 4)
+
+    items = list(shard_batches(shards, batch_size=5))
+
+    assert listings == ["docs/"]
+    keys = {}
+    for shard, objects, _ in items:
+        assert len(objects) <= 5
+        for obj in objects:
+            assert hash_shard(obj["Key"], 4) == shard["index"]
+            assert set(obj) == {"Key", "ETag", "Size", "LastModified"}
+            keys[obj["Key"]] = shard["name"]
+    assert sorted(keys) == sorted(key for key in s3.objects if key.startswith("docs/"))
+    # Each shard ends with exactly one last item, after all of its batches
+    for shard in shards:
+        flags = [last for item_shard, _, last in items if item_shard is shard]
+        assert flags[-1] and flags.count(True) == 1
+
+
+def test_finished_hash_shards_get_no_keys(s3):
+    s3.objects.update({f"docs/{i}.txt": b"text" for i in range(50)})
+    pending = plan_shards("docs/", None, 4)[1:]
+
+    items = list(shard_batches(pending))
+
+    assert {shard["index"] for shard, _, _ in items} == {1, 2, 3}
+    assert all(hash_shard(obj["Key"], 4) != 0 for _, objects, _ in items for obj in objects)
+
+
+def test_prefix_shards_are_listed_by_the_worker(s3):
+    shards = plan_shards("", ["docs/a/", "docs/b/"], 4)
+
+    assert list(shard_batches(shards)) == [(shards[0], None, True), (shards[1], None, True)]
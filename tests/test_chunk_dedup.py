@@ -0,0 +1,111 @@
+import random
+
+import pytest
+
+from app.services.chunk_dedup import ChunkDedupIndex
+
+
+def _text(seed: int, paragraphs: int = 3) -> bytes:
+    rng = random.Random(seed)
+    words = [f"w{seed}x{i}" for i in range(500)]
+    return "\n\n".join(
+        " ".join(rng.choice(words) for _ in range(120)) for _ in range(paragraphs)
+    ).encode("utf-8")
+
+
+@pytest.fixture
+def dedup_index(tmp_path):
+    return ChunkDedupIndex(str(tmp_path / "dedup.sqlite3"), mode="exact")
+
+
+def _owner(dedup_index) -> str:
+    """The document whose chunks are stored, the other one references them."""
+    rows = dedup_index._db.execute("SELECT DISTINCT document_key FROM chunks").fetchall()
+    assert len(rows) == 1
+    return rows[0][0]
+
+
+def test_stored_chunks_list_their_duplicate_sources(s3, make_processor, dedup_index):
+    s3.objects.update({"a.txt": _text(1), "b.txt": _text(1)})
+    processor = make_processor(dedup_index=dedup_index)
+
+    stats = processor.process_documents()
+
+    assert stats["processed"] == 2
+    owner = _owner(dedup_index)
+    duplicate = "b.txt" if owner == "a.txt" else "a.txt"
+    assert stats["deduplicated"] == stats["chunks"]
+    stored = processor.vector_store.fetch([f"{owner}_chunk_0"])
+    metadata = stored[f"{owner}_chunk_0"]["metadata"]
+    assert metadata["duplicate_sources"] == [duplicate]
+    assert metadata["duplicate_count"] == 1
+    # Search results carry the referencing documents
+    match = processor.vector_store.query_embeddings(stored[f"{owner}_chunk_0"]["values"], top_k=1)
+    assert match.matches[0].metadata["duplicate_sources"] == [duplicate]
+
+
+def test_changed_canonical_requeues_its_duplicates_in_the_same_run(
+    s3, make_processor, dedup_index
+):
+    s3.objects.update({"a.txt": _text(1), "b.txt": _text(1)})
+    processor = make_processor(dedup_index=dedup_index)
+    processor.process_documents()
+    owner = _owner(dedup_index)
+    duplicate = "b.txt" if owner == "a.txt" else "a.txt"
+
+    # The stored chunks change content: the duplicate's references are dropped
+    s3.objects[owner] = _text(2)
+    stats = processor.process_documents()
+
+    assert stats["processed"] == 2
+    assert stats["failed"] == 0
+    assert sorted(processor.document_tracker.get_processed_documents()) == ["a.txt", "b.txt"]
+    refs = dedup_index._db.execute("SELECT COUNT(*) FROM refs").fetchone()[0]
+    assert refs == 0
+    # The duplicate now stores its own vectors
+    stored = processor.vector_store.fetch([f"{duplicate}_chunk_0", f"{owner}_chunk_0"])
+    assert stored[f"{duplicate}_chunk_0"]["metadata"]["source_key"] == duplicate
+    assert "duplicate_sources" not in stored[f"{owner}_chunk_0"]["metadata"]
+
+    # Nothing is left for the next run
+    stats = processor.process_documents()
+    assert stats["queued"] == 0
+
+
+def test_changed_duplicate_is_removed_from_the_sources(s3, make_processor, dedup_index):
+    s3.objects.update({"a.txt": _text(1), "b.txt": _text(1)})
+    processor = make_processor(dedup_index=dedup_index)
+    processor.process_documents()
+    owner = _owner(dedup_index)
+    duplicate = "b.txt" if owner == "a.txt" else "a.txt"
+
+    s3.objects[duplicate] = _text(3)
+    stats = processor.process_documents()
+
+    assert stats["processed"] == 1
+    metadata = processor.vector_store.fetch([f"{owner}_chunk_0"])[f"{owner}_chunk_0"]["metadata"]
+    assert metadata["duplicate_sources"] == []
+    assert metadata["duplicate_count"] == 0
+
+
+def test_reused_chunks_keep_matching_near_duplicates(s3, make_processor, tmp_path):
+    dedup_index = ChunkDedupIndex(str(tmp_path / "near.sqlite3"), mode="near", threshold=0.8)
+    original = _text(4, paragraphs=6)
+    s3.objects["a.txt"] = original
+    processor = make_processor(dedup_index=dedup_index)
+    processor.process_documents()
+    first_chunk = processor.text_splitter.split_text(original.decode("utf-8"))[0]
+
+    # The unchanged chunks are reused rather than embedded again
+    s3.objects["a.txt"] = original + b"\n\n" + _text(5, paragraphs=1)
+    stats = processor.process_documents()
+    assert stats["reused"] > 0
+    missing = dedup_index._db.execute(
+        "SELECT COUNT(*) FROM chunks WHERE signature IS NULL"
+    ).fetchone()[0]
+    assert missing == 0
+
+    words = first_chunk.split(" ")
+    words[-1] = "changed"
+    near = " ".join(words)
+    assert dedup_index.find("b.txt", "other", dedup_index.signature(near)) == "a.txt_chunk_0"
@@ -0,0 +1,73 @@
+import numpy as np
+
+
+def _paragraph(index: int) -> str:
+    # About 900 characters: every paragraph is a chunk of its own
+    return " ".join(f"p{index}w{j}" for j in range(150))[:900]
+
+
+def _document(*paragraphs: int) -> bytes:
+    return "\n\n".join(_paragraph(i) for i in paragraphs).encode("utf-8")
+
+
+def _embedded_texts(processor) -> int:
+    return processor.embedding_service._providers["openai"].texts
+
+
+def _stored(processor, key: str, count: int) -> dict:
+    return processor.vector_store.fetch([f"{key}_chunk_{i}" for i in range(count)])
+
+
+def test_only_changed_chunks_are_embedded_again(s3, make_processor):
+    s3.objects["a.txt"] = _document(0, 1, 2, 3)
+    processor = make_processor()
+    processor.process_documents()
+    before = _stored(processor, "a.txt", 4)
+    embedded = _embedded_texts(processor)
+
+    s3.objects["a.txt"] = _document(0, 1, 9, 3)
+    stats = processor.process_documents()
+
+    assert stats["processed"] == 1
+    assert stats["reused"] == 3
+    assert _embedded_texts(processor) - embedded == 1
+    after = _stored(processor, "a.txt", 4)
+    for i in (0, 1, 3):
+        chunk_id = f"a.txt_chunk_{i}"
+        np.testing.assert_array_equal(after[chunk_id]["values"], before[chunk_id]["values"])
+    assert after["a.txt_chunk_2"]["metadata"]["content"] == _paragraph(9)[:200]
+
+
+def test_moved_chunks_reuse_their_stored_vectors(s3, make_processor):
+    s3.objects["a.txt"] = _document(0, 1, 2)
+    processor = make_processor()
+    processor.process_documents()
+    before = _stored(processor, "a.txt", 3)
+    embedded = _embedded_texts(processor)
+
+    s3.objects["a.txt"] = _document(7, 0, 1, 2)
+    stats = processor.process_documents()
+
+    assert stats["reused"] == 3
+    assert _embedded_texts(processor) - embedded == 1
+    after = _stored(processor, "a.txt", 4)
+    for i in range(3):
+        moved, previous = after[f"a.txt_chunk_{i + 1}"], before[f"a.txt_chunk_{i}"]
+        # Up to the rounding of normalizing the vector again when it is written
+        np.testing.assert_allclose(moved["values"], previous["values"], rtol=1e-6)
+        assert moved["metadata"]["chunk_index"] == i + 1
+        assert moved["metadata"]["total_chunks"] == 4
+
+
+def test_chunks_past_the_new_end_are_deleted(s3, make_processor):
+    s3.objects["a.txt"] = _document(0, 1, 2, 3)
+    processor = make_processor()
+    processor.process_documents()
+    embedded = _embedded_texts(processor)
+
+    s3.objects["a.txt"] = _document(0, 1)
+    stats = processor.process_documents()
+
+    assert stats["reused"] == 2
+    assert _embedded_texts(processor) == embedded
+    assert sorted(_stored(processor, "a.txt", 4)) == ["a.txt_chunk_0", "a.txt_chunk_1"]
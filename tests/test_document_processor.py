@@ -0,0 +1,111 @@
+import threading
+
+from benchmarks.fakes import FakeEmbeddings
+
+
+def _document(index: int) -> bytes:
+    return "\n\n".join(
+        f"Doc {index} paragraph {i} " + f"lorem{i} " * 30 for i in range(20)
+    ).encode("utf-8")
+
+
+class _TrackingEmbeddings(FakeEmbeddings):
+    """Fake provider that records its peak concurrency and can fail or stop the run."""
+
+    def __init__(self, fail_on=None, on_call=None):
+        super().__init__(16, latency_ms=20.0)
+        self.fail_on = fail_on
+        self.on_call = on_call
+        self.active = 0
+        self.peak = 0
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            if self.on_call is not None:
+                self.on_call(self.calls)
+            if self.fail_on is not None and any(self.fail_on in text for text in texts):
+                raise ValueError("rejected input")  # Not retried
+            return super().embed_documents(texts)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _pipelined(make_processor, provider):
+    processor = make_processor()
+    processor.embedding_service._providers["openai"] = provider
+    processor.batch_size = 8
+    processor.embed_concurrency = 4
+    return processor
+
+
+def _stored_chunks(processor, key: str) -> dict:
+    count = len(processor.text_splitter.split_text(_document(int(key[1:])).decode("utf-8")))
+    return processor.vector_store.fetch([f"{key}_chunk_{i}" for i in range(count)])
+
+
+def test_batches_are_embedded_concurrently(s3, make_processor):
+    s3.objects.update({f"d{k}": _document(k) for k in range(12)})
+    provider = _TrackingEmbeddings()
+    processor = _pipelined(make_processor, provider)
+
+    stats = processor.process_documents()
+
+    assert stats["processed"] == 12
+    assert stats["failed"] == 0
+    assert provider.peak > 1
+    for k in range(12):
+        chunks = _stored_chunks(processor, f"d{k}")
+        assert sorted(c["metadata"]["chunk_index"] for c in chunks.values()) == list(
+            range(len(chunks))
+        )
+        assert {c["metadata"]["total_chunks"] for c in chunks.values()} == {len(chunks)}
+    processor.close()
+
+
+def test_failed_batch_fails_only_the_documents_in_it(s3, make_processor):
+    s3.objects.update({f"d{k}": _document(k) for k in range(12)})
+    provider = _TrackingEmbeddings(fail_on="Doc 3 paragraph 5 ")
+    processor = _pipelined(make_processor, provider)
+
+    stats = processor.process_documents()
+
+    tracked = set(processor.document_tracker.get_processed_documents())
+    assert "d3" not in tracked
+    assert 1 <= stats["failed"] <= 3  # Batches may pack chunks of neighbouring documents
+    assert stats["processed"] + stats["failed"] == 12
+    assert len(tracked) == stats["processed"]
+
+    # The failed documents are picked up by the next run
+    provider.fail_on = None
+    stats = processor.process_documents()
+    assert stats["processed"] == 12 - len(tracked)
+    assert stats["failed"] == 0
+    processor.close()
+
+
+def test_cancelled_run_leaves_unwritten_documents_unprocessed(s3, make_processor):
+    s3.objects.update({f"d{k}": _document(k) for k in range(12)})
+    cancel = threading.Event()
+
+    def cancel_after_three_calls(calls):
+        if calls >= 3:
+            cancel.set()
+
+    provider = _TrackingEmbeddings(on_call=cancel_after_three_calls)
+    processor = _pipelined(make_processor, provider)
+
+    stats = processor.process_documents(cancel_event=cancel)
+
+    tracked = processor.document_tracker.get_processed_documents()
+    assert len(tracked) == stats["processed"] < 12
+    for key in tracked:
+        chunks = _stored_chunks(processor, key)
+        assert all(c["metadata"]["total_chunks"] == len(chunks) for c in chunks.values())
+
+    stats = processor.process_documents()
+    assert stats["processed"] == 12 - len(tracked)
+    processor.close()
@@ -0,0 +1,95 @@
+import pytest
+
+import app.services.document_tracker as document_tracker
+from app.services.document_tracker import DocumentTracker
+from app.vector_backends import create_backend
+from app.vector_store import VectorStore
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _document(index: int) -> bytes:
+    return " ".join(f"word{index}-{j}" for j in range(300)).encode("utf-8")
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    monkeypatch.setattr(document_tracker.time, "sleep", lambda seconds: None)
+    tracker = DocumentTracker(VectorStore(backend=create_backend("local")))
+    tracker.mark_as_processed("a.txt", etag="1", chunk_hashes=["h0", "h1"])
+    return tracker
+
+
+def _fail(tracker, monkeypatch, errors):
+    fetch = tracker.vector_store.fetch
+    errors = list(errors)
+
+    def flaky_fetch(ids, namespace=None):
+        if errors:
+            raise errors.pop(0)
+        return fetch(ids, namespace=namespace)
+
+    monkeypatch.setattr(tracker.vector_store, "fetch", flaky_fetch)
+
+
+def test_transient_fetch_errors_are_retried(tracker, monkeypatch):
+    _fail(tracker, monkeypatch, [_StatusError(503), ConnectionError("reset")])
+
+    assert tracker.get_records(["a.txt", "b.txt"]) == {
+        "a.txt": {"etag": "1", "size": None, "last_modified": None}
+    }
+
+
+@pytest.mark.parametrize("errors", [[_StatusError(403)], [_StatusError(503)] * 3])
+def test_fetch_errors_are_raised(tracker, monkeypatch, errors):
+    _fail(tracker, monkeypatch, errors)
+    with pytest.raises(_StatusError):
+        tracker.get_records(["a.txt"])
+
+    _fail(tracker, monkeypatch, errors)
+    with pytest.raises(_StatusError):
+        tracker.get_chunk_hashes("a.txt")
+
+
+def test_unchecked_listing_page_counts_as_failed(s3, make_processor, monkeypatch):
+    s3.objects.update({f"docs/{i}.txt": _document(i) for i in range(3)})
+    processor = make_processor()
+
+    def failing_get_records(document_keys):
+        raise _StatusError(403)
+
+    monkeypatch.setattr(processor.document_tracker, "get_records", failing_get_records)
+    stats = processor.process_documents("docs/")
+
+    assert stats["processed"] == 0
+    assert stats["failed"] == 3
+    assert processor.document_tracker.get_processed_documents() == []
+
+
+def test_missing_chunk_hashes_fail_the_document(s3, make_processor, monkeypatch):
+    s3.objects["a.txt"] = _document(1)
+    processor = make_processor()
+    processor.process_documents()
+    s3.objects["a.txt"] = _document(2)
+    tracker = processor.document_tracker
+    get_chunk_hashes = tracker.get_chunk_hashes
+
+    def failing_get_chunk_hashes(document_key):
+        raise _StatusError(403)
+
+    monkeypatch.setattr(tracker, "get_chunk_hashes", failing_get_chunk_hashes)
+    stats = processor.process_documents()
+
+    assert stats["processed"] == 0
+    assert stats["failed"] == 1
+    assert stats["chunks"] == 0
+
+    # The next run processes the changed document
+    monkeypatch.setattr(tracker, "get_chunk_hashes", get_chunk_hashes)
+    stats = processor.process_documents()
+    assert stats["processed"] == 1
+    assert stats["failed"] == 0
@@ -0,0 +1,195 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app.vector_backends.local_backend import LocalBackend
+
+
+def _vectors(count: int, dimension: int = 16, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, dimension)).astype(np.float32)
+
+
+def _ivf_backend(count: int = 1000) -> LocalBackend:
+    backend = LocalBackend(16, ann_min_vectors=100, nprobe=1, flush_interval=0)
+    backend.upsert([f"v{i}" for i in range(count)], _vectors(count))
+    # The first query builds the IVF index
+    backend.query(_vectors(1, seed=1)[0], top_k=1)
+    assert backend._namespace(None).ivf is not None
+    return backend
+
+
+def test_upsert_after_delete_is_found_by_ivf_queries():
+    backend = _ivf_backend()
+    for i in range(20):
+        # The new vector takes the row freed by the delete
+        backend.delete([f"v{999 - i}"])
+        vector = _vectors(1, seed=100 + i)[0]
+        backend.upsert([f"new{i}"], vector.reshape(1, -1))
+
+        assert backend.query(vector, top_k=1).matches[0].id == f"new{i}"
+
+
+def test_ivf_queries_find_overwritten_and_moved_vectors():
+    backend = _ivf_backend()
+    vector = _vectors(1, seed=3)[0]
+    backend.upsert(["v10"], vector.reshape(1, -1))
+    backend.delete(["v0"])  # Moves the last row into row 0
+
+    assert backend.query(vector, top_k=1).matches[0].id == "v10"
+    moved = backend.fetch(["v999"])["v999"]["values"]
+    assert backend.query(moved, top_k=1).matches[0].id == "v999"
+
+
+def test_delete_and_fetch():
+    backend = LocalBackend(16, flush_interval=0)
+    vectors = _vectors(5)
+    backend.upsert([f"v{i}" for i in range(5)], vectors, [{"i": i} for i in range(5)])
+
+    backend.delete(["v1", "missing"])
+
+    fetched = backend.fetch([f"v{i}" for i in range(5)])
+    assert sorted(fetched) == ["v0", "v2", "v3", "v4"]
+    assert fetched["v4"]["metadata"] == {"i": 4}
+    expected = vectors[4] / np.linalg.norm(vectors[4])
+    np.testing.assert_allclose(fetched["v4"]["values"], expected, atol=1e-6)
+
+
+@pytest.mark.parametrize(
+    "quantization, tolerance", [("none", 1e-6), ("float16", 1e-3), ("int8", 2e-2)]
+)
+def test_quantized_index_round_trips_through_disk(tmp_path, quantization, tolerance):
+    vectors = _vectors(50)
+    backend = LocalBackend(16, path=str(tmp_path), flush_interval=0, quantization=quantization)
+    backend.upsert([f"v{i}" for i in range(50)], vectors, [{"i": i} for i in range(50)])
+    backend.flush()
+
+    reloaded = LocalBackend(16, path=str(tmp_path), flush_interval=0, quantization=quantization)
+
+    fetched = reloaded.fetch(["v7"])["v7"]
+    assert fetched["metadata"] == {"i": 7}
+    expected = vectors[7] / np.linalg.norm(vectors[7])
+    np.testing.assert_allclose(fetched["values"], expected, atol=tolerance)
+    assert reloaded.query(vectors[7], top_k=1).matches[0].id == "v7"
+
+
+def test_interrupted_save_keeps_the_previous_snapshot(tmp_path, monkeypatch):
+    backend = LocalBackend(16, path=str(tmp_path), flush_interval=0)
+    backend.upsert(["a", "b"], _vectors(2))
+    backend.flush()
+    backend.upsert(["c"], _vectors(1, seed=1))
+
+    # Crash after the new vectors were written, before the snapshot was switched
+    def crash(f, data):
+        raise OSError("disk full")
+
+    monkeypatch.setattr("app.vector_backends.local_backend._dump_json", crash)
+    with pytest.raises(OSError):
+        backend.flush()
+    monkeypatch.undo()
+
+    reloaded = LocalBackend(16, path=str(tmp_path), flush_interval=0)
+    assert sorted(reloaded.fetch(["a", "b", "c"])) == ["a", "b"]
+    # The failed save is retried by the next flush
+    backend.flush()
+    reloaded = LocalBackend(16, path=str(tmp_path), flush_interval=0)
+    assert sorted(reloaded.fetch(["a", "b", "c"])) == ["a", "b", "c"]
+
+
+def test_inconsistent_snapshot_is_refused(tmp_path):
+    backend = LocalBackend(16, path=str(tmp_path), flush_interval=0)
+    backend.upsert(["a", "b"], _vectors(2))
+    backend.flush()
+    namespace_dir = tmp_path / "__default__"
+    ids_file = next(namespace_dir.glob("ids-*.json"))
+    ids_file.write_text('["a"]')
+
+    with pytest.raises(ValueError, match="inconsistent"):
+        LocalBackend(16, path=str(tmp_path), flush_interval=0).fetch(["a"])
+
+
+def test_flush_does_not_block_queries(tmp_path, monkeypatch):
+    backend = LocalBackend(16, path=str(tmp_path), flush_interval=0)
+    backend.upsert(["a"], _vectors(1))
+    writing, release = threading.Event(), threading.Event()
+    original = backend._namespace(None).write_snapshot
+
+    def write_snapshot(state):
+        writing.set()
+        release.wait(5)
+        original(state)
+
+    monkeypatch.setattr(backend._namespace(None), "write_snapshot", write_snapshot)
+    flush = threading.Thread(target=backend.flush)
+    flush.start()
+    assert writing.wait(5)
+
+    assert backend.query(_vectors(1)[0], top_k=1).matches[0].id == "a"
+    release.set()
+    flush.join()
+
+
+def test_exact_queries_rank_by_cosine_similarity():
+    backend = LocalBackend(16, flush_interval=0)
+    vectors = _vectors(50)
+    backend.upsert([f"v{i}" for i in range(50)], vectors)
+    query = _vectors(1, seed=7)[0]
+
+    result = backend.query(query, top_k=5)
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5]
+    assert [match.id for match in result.matches] == [f"v{i}" for i in expected]
+
+
+def test_ivf_recall_on_clustered_vectors():
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((20, 16))
+    vectors = (centers[rng.integers(0, 20, 2000)] + 0.3 * rng.standard_normal((2000, 16))).astype(
+        np.float32
+    )
+    exact = LocalBackend(16, flush_interval=0)
+    ivf = LocalBackend(16, ann_min_vectors=100, nprobe=8, flush_interval=0)
+    for backend in (exact, ivf):
+        backend.upsert([f"v{i}" for i in range(2000)], vectors)
+
+    found = 0
+    for query in vectors[:50] + 0.1 * rng.standard_normal((50, 16)).astype(np.float32):
+        expected = {match.id for match in exact.query(query, top_k=10).matches}
+        found += len(expected & {match.id for match in ivf.query(query, top_k=10).matches})
+    assert found / 500 >= 0.9
+
+
+def test_metadata_filters():
+    backend = LocalBackend(16, flush_interval=0)
+    metadata = [{"source_key": f"doc{i % 3}", "chunk_index": i} for i in range(9)]
+    backend.upsert([f"v{i}" for i in range(9)], _vectors(9), metadata)
+    query = _vectors(1, seed=5)[0]
+
+    def ids(filter):
+        return sorted(match.id for match in backend.query(query, top_k=9, filter=filter).matches)
+
+    assert ids({"source_key": "doc1"}) == ["v1", "v4", "v7"]
+    assert ids({"chunk_index": {"$in": [0, 1]}, "source_key": {"$ne": "doc0"}}) == ["v1"]
+    assert ids({"$or": [{"chunk_index": 8}, {"source_key": {"$eq": "doc0"}}]}) == [
+        "v0",
+        "v3",
+        "v6",
+        "v8",
+    ]
+    assert ids({"source_key": "missing"}) == []
+
+
+def test_namespaces_and_metadata_updates_persist(tmp_path):
+    backend = LocalBackend(16, path=str(tmp_path), flush_interval=0)
+    backend.upsert(["a"], _vectors(1), [{"kind": "chunk", "n": 1}])
+    backend.upsert(["a"], _vectors(1, seed=1), [{"kind": "tracker"}], namespace="processed docs")
+    backend.update_metadata("a", {"n": 2})
+    backend.flush()
+
+    reloaded = LocalBackend(16, path=str(tmp_path), flush_interval=0)
+
+    assert reloaded.fetch(["a"])["a"]["metadata"] == {"kind": "chunk", "n": 2}
+    assert reloaded.fetch(["a"], namespace="processed docs")["a"]["metadata"] == {"kind": "tracker"}
+    assert list(reloaded.list_ids(namespace="processed docs")) == [["a"]]
+    assert list(reloaded.list_ids(namespace="other")) == []
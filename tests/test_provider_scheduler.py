@@ -0,0 +1,160 @@
+import threading
+
+import pytest
+
+import app.services.provider_scheduler as provider_scheduler
+from app.services.provider_scheduler import (
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    EmbeddingUnavailableError,
+    ProviderScheduler,
+    TokenBucket,
+)
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(provider_scheduler.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+
+    def make(call, **options):
+        options.setdefault("backoff_base_seconds", 0.01)
+        scheduler = ProviderScheduler("test", call, **options)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.close()
+
+
+def test_token_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket(per_minute=60)
+
+    assert bucket.delay(60) == 0.0
+    bucket.take(60)
+    assert bucket.delay(1) == pytest.approx(1.0)
+    clock[0] += 0.5
+    assert bucket.delay(1) == pytest.approx(0.5)
+    clock[0] += 120
+    # Never holds more than a minute's worth
+    bucket.take(60)
+    assert bucket.delay(1) == pytest.approx(1.0)
+
+
+def test_token_bucket_oversized_requests_wait_for_a_full_bucket(clock):
+    bucket = TokenBucket(per_minute=60)
+    bucket.take(30)
+
+    assert bucket.delay(600) == pytest.approx(30.0)
+    bucket.take(600)
+    assert bucket.tokens < 0
+
+
+def test_token_bucket_reserve_is_left_for_other_callers(clock):
+    bucket = TokenBucket(per_minute=60)
+    bucket.take(50)
+
+    assert bucket.delay(5) == 0.0
+    assert bucket.delay(5, reserve=0.25) == pytest.approx(10.0)
+
+
+def test_unlimited_token_bucket_never_waits():
+    bucket = TokenBucket(per_minute=0)
+    bucket.take(10**9)
+
+    assert bucket.unlimited
+    assert bucket.delay(10**9) == 0.0
+
+
+def test_concurrency_grows_on_success_and_halves_on_rate_limits(make_scheduler):
+    attempts = []
+
+    def call(texts):
+        attempts.append(texts)
+        if texts == ["limited"] and len(attempts) == 2:
+            raise _StatusError(429)
+        return texts
+
+    scheduler = make_scheduler(call, initial_concurrency=4)
+    assert scheduler.run(["a"]) == ["a"]
+    assert scheduler.limit == pytest.approx(4.25)
+
+    # Retried after the rate limit, with half the concurrency
+    assert scheduler.run(["limited"]) == ["limited"]
+    assert len(attempts) == 3
+    assert scheduler.limit == pytest.approx(4.25 / 2 + 1 / (4.25 / 2))
+
+
+def test_concurrency_never_drops_below_the_minimum(make_scheduler):
+    def call(texts):
+        raise _StatusError(429)
+
+    scheduler = make_scheduler(call, initial_concurrency=2, min_concurrency=2, max_attempts=1)
+
+    with pytest.raises(EmbeddingUnavailableError):
+        scheduler.run(["a"])
+    assert scheduler.limit == 2.0
+
+
+def test_exhausted_retries_raise_embedding_unavailable(make_scheduler):
+    attempts = []
+
+    def call(texts):
+        attempts.append(texts)
+        raise _StatusError(503)
+
+    scheduler = make_scheduler(call, max_attempts=3)
+
+    with pytest.raises(EmbeddingUnavailableError):
+        scheduler.run(["a"])
+    assert len(attempts) == 3
+
+
+def test_caller_errors_are_not_retried(make_scheduler):
+    attempts = []
+
+    def call(texts):
+        attempts.append(texts)
+        raise _StatusError(400)
+
+    scheduler = make_scheduler(call)
+
+    with pytest.raises(_StatusError):
+        scheduler.run(["a"])
+    assert len(attempts) == 1
+
+
+def test_interactive_calls_are_dispatched_before_bulk_ones(make_scheduler):
+    started, release = threading.Event(), threading.Event()
+    order = []
+
+    def call(texts):
+        if texts == ["blocking"]:
+            started.set()
+            release.wait(5)
+        order.append(texts[0])
+        return texts
+
+    scheduler = make_scheduler(call, initial_concurrency=1, max_concurrency=1)
+    blocking = scheduler.submit(["blocking"], PRIORITY_INTERACTIVE)
+    assert started.wait(5)
+    bulk = [scheduler.submit([f"bulk{i}"], PRIORITY_BULK) for i in range(3)]
+    interactive = scheduler.submit(["interactive"], PRIORITY_INTERACTIVE)
+    release.set()
+
+    for future in [blocking, *bulk, interactive]:
+        future.result(timeout=5)
+    assert order == ["blocking", "interactive", "bulk0", "bulk1", "bulk2"]
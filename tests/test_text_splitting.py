@@ -0,0 +1,47 @@
+import random
+
+import pytest
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.services.text_splitting import StreamingTextSplitter
+
+
+def _random_text(rng: random.Random) -> str:
+    tokens = ["word", "a", "longerword", " ", " ", "\n", "\n\n", "\n\n\n", None]
+    return "".join(
+        token if token is not None else "x" * rng.randint(1, 80)  # Longer than some chunks
+        for token in (rng.choice(tokens) for _ in range(rng.randint(0, 400)))
+    )
+
+
+def _pieces(text: str, rng: random.Random):
+    start = 0
+    while start < len(text):
+        end = start + rng.randint(1, 64)
+        yield text[start:end]
+        start = end
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_streaming_chunks_match_split_text(seed):
+    rng = random.Random(seed)
+    for _ in range(300):
+        chunk_size = rng.randint(10, 300)
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=rng.randint(0, chunk_size // 2)
+        )
+        text = _random_text(rng)
+
+        streamed = list(StreamingTextSplitter(splitter).split_stream(_pieces(text, rng)))
+
+        assert streamed == splitter.split_text(text), (seed, chunk_size, text)
+
+
+def test_text_without_top_level_separator_is_split_whole():
+    splitter = RecursiveCharacterTextSplitter(chunk_size=20, chunk_overlap=5)
+    text = "one two three four five six seven eight nine ten"
+    pieces = ["one two th", "ree four", text[18:]]
+
+    streamed = list(StreamingTextSplitter(splitter).split_stream(pieces))
+
+    assert streamed == splitter.split_text(text)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from app.utils.vectors import as_float32_matrix, dequantize, quantize, valid_rows
+
+
+def _rows(count: int = 200, dimension: int = 64) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    scales = rng.uniform(1e-3, 1e3, size=(count, 1))
+    return (rng.standard_normal((count, dimension)) * scales).astype(np.float32)
+
+
+def test_int8_error_is_at_most_half_a_step():
+    matrix = _rows()
+
+    codes, scales = quantize(matrix, "int8")
+
+    assert codes.dtype == np.int8
+    steps = np.abs(matrix).max(axis=1) / 127.0
+    np.testing.assert_allclose(scales, steps, rtol=1e-6)
+    error = np.abs(dequantize(codes, scales) - matrix)
+    assert (error <= steps[:, None] * (0.5 + 1e-4)).all()
+
+
+def test_float16_error_is_within_its_precision():
+    matrix = _rows()
+
+    codes, scales = quantize(matrix, "float16")
+
+    assert codes.dtype == np.float16
+    error = np.abs(dequantize(codes, scales) - matrix)
+    # Half precision keeps 11 significant bits; tiny values fall to its subnormal step
+    assert (error <= np.abs(matrix) * 2.0**-11 + 2.0**-25).all()
+
+
+def test_zero_rows_survive_quantization():
+    matrix = np.zeros((2, 8), dtype=np.float32)
+    matrix[1, 3] = -2.5
+
+    for mode in ("none", "float16", "int8"):
+        np.testing.assert_array_equal(dequantize(*quantize(matrix, mode)), matrix)
+
+
+def test_unknown_quantization_mode_is_rejected():
+    with pytest.raises(ValueError):
+        quantize(_rows(1), "int4")
+
+
+def test_float32_matrix_is_not_copied():
+    matrix = _rows(3)
+
+    assert as_float32_matrix(matrix) is matrix
+    assert as_float32_matrix(matrix[0]).shape == (1, 64)
+    assert as_float32_matrix([], dimension=64).shape == (0, 64)
+
+
+def test_valid_rows_rejects_zero_and_non_finite_vectors():
+    matrix = _rows(4)
+    matrix[1] = 0.0
+    matrix[2, 5] = np.nan
+    matrix[3, 0] = np.inf
+
+    assert valid_rows(matrix).tolist() == [True, False, False, False]